@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
 import json
@@ -9,7 +9,9 @@ from dotenv import load_dotenv
 from services.qdrant_service import QdrantService
 from services.gemini_service import GeminiService
 from services.conflict_detection_service import ConflictDetectionService
+from utils.columnar_store import MIGRATIONS_FILE
 from utils.data_parser import DataParser
+from utils.lane_cache import LANE_CACHE_FILE
 
 # Load environment variables
 load_dotenv()
@@ -105,19 +107,46 @@ def upload_migration_data():
         temp_file = f"{temp_path}{file_ext}"
         file.save(temp_file)
         
-        # Parse the data
-        migration_data = data_parser.parse_fish_migration_data(temp_file, format_type="auto")
+        append = request.form.get('mode') == 'append'
         
-        # Load into conflict service
-        conflict_service.load_migration_data(data=migration_data)
+        if file_ext == '.csv' and not request.form.get('thin_distance'):
+            # Stream the CSV into the conflict service batch by batch
+            record_count = conflict_service.load_migration_batches(
+                data_parser.iter_csv_migration_batches(temp_file), append=append
+            )
+            raw_count = record_count
+            columns = conflict_service.migration_data.columns.tolist()
+        else:
+            # Parse the data
+            migration_data = data_parser.parse_fish_migration_data(temp_file, format_type="auto")
+            raw_count = len(migration_data)
+            
+            # Optionally collapse near-duplicate sightings into weighted records
+            if request.form.get('thin_distance'):
+                thin_hours = request.form.get('thin_hours', 24)
+                migration_data = data_parser.thin_migration_data(
+                    migration_data,
+                    distance_km=float(request.form['thin_distance']),
+                    time_window_hours=float(thin_hours) if thin_hours != '' else None
+                )
+            
+            # Load into conflict service, appending to the existing records if requested
+            if append:
+                conflict_service.append_migration_data(migration_data)
+            else:
+                conflict_service.load_migration_data(data=migration_data)
+            record_count = len(migration_data)
+            columns = migration_data.columns.tolist()
         
         # Save standardized data
-        data_parser.save_standardized_data(migration_data=migration_data)
+        data_parser.save_standardized_data(migration_data=conflict_service.migration_data)
         
         return jsonify({
-            "message": "Migration data uploaded successfully",
-            "record_count": len(migration_data),
-            "columns": migration_data.columns.tolist()
+            "message": "Migration data appended successfully" if append else "Migration data uploaded successfully",
+            "record_count": record_count,
+            "raw_record_count": raw_count,
+            "total_record_count": len(conflict_service.migration_data),
+            "columns": columns
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -144,15 +173,86 @@ def upload_shipping_lanes():
         # Parse the data
         shipping_lanes = data_parser.parse_shipping_lanes(temp_file, format_type="auto")
         
-        # Load into conflict service
-        conflict_service.load_shipping_lanes(data=shipping_lanes)
+        # Load into conflict service, adding to or replacing existing lanes by id if requested
+        append = request.form.get('mode') == 'append'
+        if append:
+            changed_lanes = conflict_service.upsert_shipping_lanes(shipping_lanes)
+        else:
+            conflict_service.load_shipping_lanes(data=shipping_lanes)
+            changed_lanes = list(range(len(shipping_lanes)))
         
         # Save standardized data
-        data_parser.save_standardized_data(shipping_lanes=shipping_lanes)
+        data_parser.save_standardized_data(shipping_lanes=conflict_service.shipping_lanes)
         
         return jsonify({
-            "message": "Shipping lanes uploaded successfully",
-            "lane_count": len(shipping_lanes)
+            "message": "Shipping lanes updated successfully" if append else "Shipping lanes uploaded successfully",
+            "lane_count": len(shipping_lanes),
+            "total_lane_count": len(conflict_service.shipping_lanes),
+            "changed_lane_ids": changed_lanes
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts/append-sightings', methods=['POST'])
+def append_sightings():
+    """Stream new sightings into the existing migration clusters"""
+    try:
+        if 'file' in request.files:
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({"error": "No file selected"}), 400
+            
+            # Save the uploaded file temporarily
+            temp_path = os.path.join(os.path.dirname(__file__), 'data', 'temp_sightings')
+            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+            
+            file_ext = os.path.splitext(file.filename)[1].lower()
+            temp_file = f"{temp_path}{file_ext}"
+            file.save(temp_file)
+            
+            sightings = data_parser.parse_fish_migration_data(temp_file, format_type="auto")
+            params = request.form
+        else:
+            data = request.json or {}
+            records = data.get('sightings')
+            if not records:
+                return jsonify({"error": "sightings or file is required"}), 400
+            
+            sightings = data_parser.standardize_migration_data(pd.DataFrame(records))
+            params = data
+        
+        eps = float(params.get('cluster_distance', 50))  # km
+        min_samples = int(params.get('min_cluster_size', 5))
+        
+        changed_clusters = conflict_service.append_sightings(sightings, eps=eps, min_samples=min_samples)
+        
+        return jsonify({
+            "message": "Sightings appended successfully",
+            "record_count": len(sightings),
+            "total_record_count": len(conflict_service.migration_data),
+            "changed_clusters": [int(c) for c in changed_clusters]
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts/shipping-lanes', methods=['GET'])
+def get_shipping_lanes():
+    """Get shipping lanes simplified for a map zoom, optionally limited to a bbox"""
+    try:
+        zoom = request.args.get('zoom', type=int)
+        bbox = request.args.get('bbox')
+        if bbox:
+            bbox = [float(v) for v in bbox.split(',')]
+            if len(bbox) != 4:
+                return jsonify({"error": "bbox must be min_lon,min_lat,max_lon,max_lat"}), 400
+        
+        lanes = conflict_service.get_shipping_lanes_view(zoom=zoom, bbox=bbox)
+        
+        return jsonify({
+            "shipping_lanes": lanes,
+            "lane_count": len(lanes),
+            "vertex_count": sum(sum(len(p) for p in lane.get('parts', [lane['coordinates']])) for lane in lanes),
+            "zoom": zoom
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -162,13 +262,24 @@ def detect_conflicts():
     """Detect conflicts between migration data and shipping lanes"""
     data = request.json or {}
     distance_threshold = data.get('distance_threshold', 10)  # km
+    mode = data.get('mode', 'cluster')
+    
+    if mode == 'observation':
+        return detect_observation_conflicts(data, distance_threshold)
     
     try:
         # Identify migration clusters first
         eps = data.get('cluster_distance', 50)  # km
         min_samples = data.get('min_cluster_size', 5)
         
-        conflict_service.identify_migration_clusters(eps=eps, min_samples=min_samples)
+        # Optionally cluster each species and/or time bucket ('month', 'season', 'year') separately
+        conflict_service.identify_migration_clusters(
+            eps=eps,
+            min_samples=min_samples,
+            by_species=data.get('partition_by_species', False),
+            time_bucket=data.get('time_bucket'),
+            method=data.get('cluster_method', 'exact')  # 'grid' for the linear-time approximation
+        )
         
         # Detect conflicts
         conflicts = conflict_service.detect_conflicts(distance_threshold=distance_threshold)
@@ -181,6 +292,83 @@ def detect_conflicts():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def detect_observation_conflicts(data, distance_threshold):
+    """Observation-level exposure per lane and species, optionally streamed as NDJSON"""
+    chunk_size = data.get('chunk_size', 100000)
+    
+    if data.get('stream'):
+        def generate():
+            try:
+                for progress in conflict_service.iter_observation_conflicts(distance_threshold, chunk_size=chunk_size):
+                    yield json.dumps(progress) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    try:
+        exposures = conflict_service.detect_observation_conflicts(distance_threshold, chunk_size=chunk_size)
+        
+        return jsonify({
+            "mode": "observation",
+            "exposures": exposures,
+            "exposure_count": len(exposures)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts/cluster-accuracy', methods=['POST'])
+def cluster_accuracy():
+    """Compare approximate grid clustering with exact DBSCAN on the loaded data"""
+    try:
+        data = request.json or {}
+        report = conflict_service.evaluate_grid_clustering(
+            eps=data.get('cluster_distance', 50),
+            min_samples=data.get('min_cluster_size', 5),
+            sample_size=data.get('sample_size', 200000)
+        )
+        
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts/sweep', methods=['POST'])
+def sweep_parameters():
+    """Cluster counts, conflict counts and risk totals over a grid of detection parameters"""
+    try:
+        data = request.json or {}
+        results = conflict_service.sweep_parameters(
+            eps_values=data.get('cluster_distances', [25, 50]),
+            min_samples_values=data.get('min_cluster_sizes', [3, 5, 10]),
+            distance_thresholds=data.get('distance_thresholds', [10])
+        )
+        
+        return jsonify({
+            "results": results,
+            "combination_count": len(results)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts/lane-proximity', methods=['POST'])
+def lane_proximity():
+    """Nearest shipping lane and distance for a batch of positions"""
+    try:
+        data = request.json or {}
+        positions = data.get('positions', [])
+        if not positions:
+            return jsonify({"error": "No positions provided"}), 400
+
+        latitudes = [float(p['latitude']) for p in positions]
+        longitudes = [float(p['longitude']) for p in positions]
+        result = conflict_service.check_lane_proximity(
+            latitudes, longitudes, distance_threshold=data.get('distance_threshold', 10)
+        )
+
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/conflicts/map', methods=['GET'])
 def get_conflict_map():
     """Get a visualization of conflicts"""
@@ -196,6 +384,57 @@ def get_conflict_map():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/conflicts/tiles/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_conflict_map_tile(z, x, y):
+    """Get one XYZ tile of the conflict map as a PNG"""
+    try:
+        tile, revision = conflict_service.render_map_tile(z, x, y)
+        
+        response = Response(tile, mimetype='image/png')
+        response.set_etag(f"{revision}-{z}-{x}-{y}")
+        # The URL does not change with the data, so caches must revalidate every use
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts/risk-grid', methods=['GET'])
+def get_risk_grid():
+    """Get the conflict-risk raster (or its density/proximity factor) as a downsampled grid"""
+    try:
+        bbox = request.args.get('bbox')
+        if bbox:
+            bbox = [float(v) for v in bbox.split(',')]
+            if len(bbox) != 4:
+                return jsonify({"error": "bbox must be min_lon,min_lat,max_lon,max_lat"}), 400
+        
+        grid = conflict_service.get_risk_grid(
+            layer=request.args.get('layer', 'risk'),
+            resolution=request.args.get('resolution', type=float),
+            max_cells=request.args.get('max_cells', 40000, type=int),
+            bbox=bbox
+        )
+        return jsonify(grid)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts/risk-tiles/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_risk_tile(z, x, y):
+    """Get one XYZ heatmap tile of the conflict-risk raster as a PNG"""
+    try:
+        layer = request.args.get('layer', 'risk')
+        tile, revision = conflict_service.render_risk_tile(z, x, y, layer)
+        
+        response = Response(tile, mimetype='image/png')
+        response.set_etag(f"risk-{layer}-{revision}-{z}-{x}-{y}")
+        # As with the conflict map tiles, revalidate every use against the revision
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/conflicts/monthly-stats', methods=['GET'])
 def get_monthly_stats():
     """Get conflict statistics by month"""
@@ -205,6 +444,34 @@ def get_monthly_stats():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/conflicts/cube', methods=['GET'])
+def query_conflict_cube():
+    """Slice and roll up the conflict cube, e.g. ?species=Humpback&risk_band=high,critical&group_by=month,year"""
+    try:
+        dimensions = ['species', 'month', 'year', 'shipping_lane_id', 'risk_band']
+        numeric = {'month', 'year', 'shipping_lane_id'}
+        
+        filters = {}
+        for dimension in dimensions:
+            value = request.args.get(dimension)
+            if value:
+                values = value.split(',')
+                filters[dimension] = [int(v) for v in values] if dimension in numeric else values
+        
+        group_by = request.args.get('group_by', 'month,year')
+        group_by = [d for d in group_by.split(',') if d]
+        
+        rows = conflict_service.query_conflict_cube(filters=filters, group_by=group_by)
+        
+        return jsonify({
+            "rows": rows,
+            "row_count": len(rows),
+            "group_by": group_by,
+            "filters": filters
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/conflicts/suggest-route', methods=['POST'])
 def suggest_route_modification():
     """Suggest modifications to a shipping lane to reduce conflicts"""
@@ -221,6 +488,26 @@ def suggest_route_modification():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/conflicts/suggest-routes', methods=['POST'])
+def suggest_route_modifications_batch():
+    """Suggest modifications for many lanes at once, streamed as NDJSON as each lane finishes"""
+    data = request.json or {}
+    lane_ids = data.get('lane_ids')  # default: every lane with conflicts
+    buffer_distance = data.get('buffer_distance', 20)  # km
+    max_workers = data.get('max_workers')
+    
+    if lane_ids is not None and not isinstance(lane_ids, list):
+        return jsonify({"error": "lane_ids must be a list"}), 400
+    
+    def generate():
+        try:
+            for suggestion in conflict_service.iter_route_suggestions(lane_ids, buffer_distance, max_workers=max_workers):
+                yield json.dumps(suggestion) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/conflicts/analyze', methods=['POST'])
 def analyze_conflicts():
     """Generate AI analysis of conflicts using Gemini"""
@@ -264,6 +551,30 @@ Top Conflict Zones:"""
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/conflicts/reload', methods=['POST'])
+def reload_standardized_data():
+    """Reload the last saved migrations and lanes, optionally only some species, years or months"""
+    data = request.json or {}
+    
+    try:
+        migration_file = data_parser.data_dir / MIGRATIONS_FILE
+        shipping_file = data_parser.data_dir / LANE_CACHE_FILE
+        if not migration_file.exists() and not shipping_file.exists():
+            return jsonify({"error": "No standardized data saved"}), 404
+        
+        conflict_service.load_migration_data(
+            migration_file, species=data.get('species'), year=data.get('year'), month=data.get('month')
+        )
+        conflict_service.load_shipping_lanes(shipping_file)
+        
+        return jsonify({
+            "message": "Standardized data reloaded successfully",
+            "migration_count": len(conflict_service.migration_data) if conflict_service.migration_data is not None else 0,
+            "shipping_lanes_count": len(conflict_service.shipping_lanes) if conflict_service.shipping_lanes is not None else 0
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/conflicts/load-sample-data', methods=['POST'])
 def load_sample_data():
     """Load sample data for testing"""
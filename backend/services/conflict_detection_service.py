@@ -4,127 +4,725 @@ from datetime import datetime
 import json
 import os
 from pathlib import Path
-import geopy.distance
-from sklearn.cluster import DBSCAN
-from shapely.geometry import Point, LineString, MultiPoint
-from shapely.ops import nearest_points
-import matplotlib.pyplot as plt
-import io
 import base64
+import time
+
+from utils.clustering import CLUSTER_METHODS, NeighbourGraph, haversine_dbscan, partition_keys, partitioned_dbscan, update_dbscan_labels
+from utils.columnar_store import MIGRATIONS_FILE, read_migrations
+from utils.distance_field import LaneDistanceField
+from utils.grid_clustering import clustering_agreement
+from utils.geodesy import haversine_km, point_to_segment_distance_km, points_to_polylines_distance_km
+from utils.incremental_dbscan import IncrementalDBSCAN
+from utils.lane_cache import LANE_CACHE_FILE, CachedLanes, LaneCache
+from utils.lane_index import KM_PER_DEGREE
+from utils.lane_store import LaneStore, lane_parts
+from utils.map_renderer import MAP_DPI, MAP_FIGSIZE, MapRenderer, map_extent, render_conflict_map
+from utils.risk_raster import RiskRaster, render_heatmap_tile
+from utils.route_planner import CostGrid, iter_lane_detours, plan_detour
+from utils.tiles import TILE_FIGSIZE, TILE_SIZE, TileCache, TileLayers, render_tile
 
 class ConflictDetectionService:
+    # Smallest radius (km) the cluster/lane distance table is built with, so that
+    # nearby thresholds are served from the same table
+    DISTANCE_TABLE_MIN_RADIUS = 100
+    
+    # Memory cap (bytes) for rendered map tiles
+    TILE_CACHE_BYTES = 64 * 1024 * 1024
+    
+    # Concurrent map renders; further requests queue in the renderer
+    MAP_RENDER_WORKERS = 4
+    
+    # Conflict-risk raster: default cell size (degrees), the cell sizes that may
+    # be requested (each a global grid, so the finest bounds its memory), density
+    # smoothing (km) and the distance (km) at which lane proximity fades to zero
+    RISK_RESOLUTION_DEG = 0.25
+    RISK_RESOLUTIONS_DEG = (0.05, 0.1, 0.25, 0.5, 1.0)
+    RISK_SMOOTHING_KM = 25
+    RISK_PROXIMITY_KM = 50
+    
+    # Nearest-lane distance field: node spacing (degrees) and the distance (km)
+    # up to which it is exact; thresholds are checked against it before the lanes
+    DISTANCE_FIELD_RESOLUTION_DEG = 0.1
+    DISTANCE_FIELD_MAX_KM = 100
+    
+    # Risk bands of the conflict cube: a conflict falls in the band of the
+    # highest lower edge (risk level, 0-100) it reaches
+    RISK_BANDS = (('low', 0), ('medium', 25), ('high', 50), ('critical', 75))
+    
+    # Route suggestions: cost grid cell size (degrees), extra cost per km at
+    # peak cluster density / inside a conflict buffer / at the corridor edge,
+    # and the widest detour (km) allowed from the original lane
+    ROUTE_GRID_RESOLUTION_DEG = 0.1
+    ROUTE_DENSITY_WEIGHT = 4.0
+    ROUTE_CONFLICT_WEIGHT = 20.0
+    ROUTE_DEVIATION_WEIGHT = 0.5
+    ROUTE_MAX_DEVIATION_KM = 250
+    
     def __init__(self, data_dir="../data"):
         self.data_dir = Path(data_dir)
         self.migration_data = None
         self.shipping_lanes = None
+        self.lane_store = None
         self.conflict_zones = None
         
+        # Dataset versions, bumped on every load, key the derived caches below
+        self.migration_version = 0
+        self.lanes_version = 0
+        self._cluster_key = None
+        self._cluster_summary = None
+        self._cluster_months = None
+        self._distance_table = None
+        
+        # Per-(species, month, year, lane, risk band) aggregates of the detected conflicts
+        self.conflict_cube = None
+        
+        # (data revision, threshold) the current conflicts were detected for
+        self._conflict_key = None
+        
+        # Dirty tracking for incremental updates: appended rows not yet clustered,
+        # and clusters/lanes whose rows in the distance table are stale
+        self._pending_rows = None
+        self._dirty_clusters = set()
+        self._dirty_lanes = set()
+        
+        # Streaming clusterer for continuously appended sightings, seeded lazily
+        self._stream_clusterer = None
+        
+        # Bumped on any change to what the map shows; keys rendered tiles
+        self.data_revision = 0
+        self._tile_layers = None
+        self.tile_cache = TileCache(self.TILE_CACHE_BYTES)
+        self.map_renderer = MapRenderer(self.MAP_RENDER_WORKERS)
+        
+        # Bumped whenever lane geometry changes; keys the cached lane base image
+        self.lane_revision = 0
+        
+        # Bumped whenever sightings or lane geometry change; keys the risk rasters
+        self.risk_revision = 0
+        self._risk_rasters = {}
+        
+        # Distance-to-nearest-lane field, built lazily once per lane revision
+        self._distance_field = None
+        
+        # Routing cost grid, keyed by data revision and buffer distance
+        self._route_cost_grid = None
+        
         # Load data if available
         self._load_data()
     
     def _load_data(self):
-        """Load migration and shipping lane data if available"""
-        migration_file = self.data_dir / "fish_migrations.csv"
-        shipping_file = self.data_dir / "shipping_lanes.json"
+        """Load migration and shipping lane data if available, preferring the standardized columnar files"""
+        migration_file = self.data_dir / MIGRATIONS_FILE
+        if not migration_file.exists():
+            migration_file = self.data_dir / "fish_migrations.csv"
+        shipping_file = self.data_dir / LANE_CACHE_FILE
+        if not shipping_file.exists():
+            shipping_file = self.data_dir / "shipping_lanes.json"
         
-        if migration_file.exists():
-            self.migration_data = pd.read_csv(migration_file)
+        if self.load_migration_data(migration_file):
             print(f"Loaded migration data: {len(self.migration_data)} records")
         
-        if shipping_file.exists():
-            with open(shipping_file, 'r') as f:
-                self.shipping_lanes = json.load(f)
+        if self.load_shipping_lanes(shipping_file):
             print(f"Loaded shipping lanes: {len(self.shipping_lanes)} lanes")
     
-    def load_migration_data(self, file_path=None, data=None):
-        """Load fish migration data from file or dataframe"""
+    def load_migration_data(self, file_path=None, data=None, species=None, year=None, month=None):
+        """
+        Load fish migration data from file or dataframe
+        
+        Parquet files are read with species/year/month (a value or a list of
+        values each) pushed down to the row groups; CSV files are read whole.
+        """
         if data is not None:
-            self.migration_data = data
+            self._set_migration_data(data)
             return True
         
         if file_path is None:
             file_path = self.data_dir / "fish_migrations.csv"
         
         if os.path.exists(file_path):
-            self.migration_data = pd.read_csv(file_path)
+            if str(file_path).endswith('.parquet'):
+                self._set_migration_data(read_migrations(file_path, species=species, year=year, month=month))
+            else:
+                self._set_migration_data(pd.read_csv(file_path))
             return True
         
         return False
     
     def load_shipping_lanes(self, file_path=None, data=None):
-        """Load shipping lanes data from file or JSON"""
+        """
+        Load shipping lanes data from file (JSON or lane cache) or JSON
+        
+        A lane cache is memory mapped: the lane store works on the mapped
+        coordinates and lanes only copy their geometry when it is read.
+        """
         if data is not None:
-            self.shipping_lanes = data
+            self._set_shipping_lanes(data)
             return True
         
         if file_path is None:
             file_path = self.data_dir / "shipping_lanes.json"
         
         if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                self.shipping_lanes = json.load(f)
+            if str(file_path).endswith('.lanes'):
+                self._set_shipping_lanes(LaneCache(file_path).lanes())
+            else:
+                with open(file_path, 'r') as f:
+                    self._set_shipping_lanes(json.load(f))
             return True
         
         return False
     
+    def _set_migration_data(self, migration_data):
+        """Store migration data and invalidate everything derived from it"""
+        self.migration_data = migration_data
+        self.migration_version += 1
+        self.data_revision += 1
+        self.risk_revision += 1
+        self._cluster_key = None
+        self._cluster_summary = None
+        self._cluster_months = None
+        self._distance_table = None
+        self._pending_rows = None
+        self._dirty_clusters = set()
+        self._stream_clusterer = None
+    
+    def _set_shipping_lanes(self, shipping_lanes, lane_store=None):
+        """
+        Store shipping lanes and compile the lane geometry store used by every query, unless given
+        
+        Lanes backed by coordinate arrays (a lane cache or parsed GeoJSON)
+        get a store over those arrays instead of one rebuilt from lists.
+        """
+        self.shipping_lanes = shipping_lanes
+        if lane_store is None:
+            if isinstance(shipping_lanes, CachedLanes):
+                lane_store = shipping_lanes.cache.lane_store()
+            else:
+                lane_store = LaneStore(shipping_lanes)
+        self.lane_store = lane_store
+        self.lanes_version += 1
+        self.lane_revision += 1
+        self.risk_revision += 1
+        self.data_revision += 1
+        self._distance_table = None
+        self._dirty_lanes = set()
+    
+    def append_migration_data(self, data):
+        """
+        Append a batch of migration records without invalidating existing results
+        
+        The new rows are clustered incrementally on the next
+        identify_migration_clusters call with unchanged parameters, and only
+        the clusters they touch are re-detected.
+        
+        Args:
+            data: DataFrame of standardized migration records
+            
+        Returns:
+            Number of records appended
+        """
+        if self.migration_data is None or self.migration_data.empty:
+            self._set_migration_data(data.reset_index(drop=True))
+            return len(data)
+        
+        start = len(self.migration_data)
+        self.migration_data = pd.concat([self.migration_data, data], ignore_index=True)
+        
+        new_rows = np.arange(start, len(self.migration_data))
+        if self._pending_rows is not None:
+            new_rows = np.concatenate([self._pending_rows, new_rows])
+        self._pending_rows = new_rows
+        self.data_revision += 1
+        self.risk_revision += 1
+        
+        return len(data)
+    
+    def load_migration_batches(self, batches, append=False):
+        """
+        Load or append migration records batch by batch as they are parsed
+        
+        Each batch is handed to append_migration_data as soon as it arrives,
+        so only migration_data itself ever holds the whole file. If reading
+        a batch fails, the records held before the call are restored.
+        
+        Args:
+            batches: Iterable of standardized migration DataFrames, e.g. from
+                DataParser.iter_csv_migration_batches
+            append: Keep the existing records instead of replacing them
+            
+        Returns:
+            Number of records loaded
+        """
+        previous = self.migration_data
+        count = 0
+        try:
+            for i, batch in enumerate(batches):
+                if i == 0 and not append:
+                    self._set_migration_data(batch.reset_index(drop=True))
+                else:
+                    self.append_migration_data(batch)
+                count += len(batch)
+        except Exception:
+            self._set_migration_data(previous)
+            raise
+        
+        return count
+    
+    def upsert_shipping_lanes(self, lanes):
+        """
+        Add or replace shipping lanes, matched on their 'id'
+        
+        The lane store is recompiled, but conflicts are only recomputed for the
+        added or changed lanes on the next detection.
+        
+        Args:
+            lanes: List of standardized lanes
+            
+        Returns:
+            List of lane indices that were added or replaced
+        """
+        if self.shipping_lanes is None:
+            self._set_shipping_lanes(lanes)
+            return list(range(len(lanes)))
+        
+        shipping_lanes = list(self.shipping_lanes)
+        positions = {lane.get('id', i): i for i, lane in enumerate(shipping_lanes)}
+        changed = []
+        
+        for lane in lanes:
+            lane_id = positions.get(lane.get('id'))
+            if lane_id is None:
+                lane_id = len(shipping_lanes)
+                shipping_lanes.append(lane)
+                positions[lane.get('id', lane_id)] = lane_id
+            else:
+                shipping_lanes[lane_id] = lane
+            changed.append(lane_id)
+        
+        self.shipping_lanes = shipping_lanes
+        self.lane_store = LaneStore(shipping_lanes)
+        self._dirty_lanes.update(changed)
+        self.lane_revision += 1
+        self.risk_revision += 1
+        self.data_revision += 1
+        
+        return changed
+    
     def _calculate_distance(self, lat1, lon1, lat2, lon2):
         """Calculate distance between two points in kilometers"""
-        return geopy.distance.geodesic((lat1, lon1), (lat2, lon2)).km
+        return float(haversine_km(lat1, lon1, lat2, lon2))
     
     def _point_to_line_distance(self, point, line):
         """Calculate minimum distance from a point to a line (shipping lane)"""
-        point_geom = Point(point[1], point[0])  # lon, lat
-        line_geom = LineString([(p[1], p[0]) for p in line])  # Convert to lon, lat
-        
-        # Find nearest points
-        nearest_point_on_line = nearest_points(point_geom, line_geom)[1]
+        return float(points_to_polylines_distance_km([point[0]], [point[1]], [line])[0, 0])
+    
+    def _sample_weight(self, data):
+        """
+        Clustering weight of each record: the number of sightings a thinned record stands for
         
-        # Calculate distance
-        return self._calculate_distance(
-            point[0], point[1],
-            nearest_point_on_line.y, nearest_point_on_line.x
-        )
+        Returns:
+            Float array, or None when no record is weighted
+        """
+        if 'weight' not in data.columns:
+            return None
+        return pd.to_numeric(data['weight'], errors='coerce').fillna(1).values.astype(np.float64)
     
-    def identify_migration_clusters(self, eps=50, min_samples=5):
+    def identify_migration_clusters(self, eps=50, min_samples=5, by_species=False, time_bucket=None,
+                                    method='exact', max_workers=None):
         """
         Identify clusters in migration data using DBSCAN
         
         Args:
             eps: Maximum distance between points in a cluster (km)
             min_samples: Minimum number of points to form a cluster
+            by_species: Cluster each species separately
+            time_bucket: Also cluster each 'month', 'season' or 'year' separately
+            method: 'exact' DBSCAN or the linear-time 'grid' approximation
+            max_workers: Process pool size for partitioned clustering (default: all cores)
             
         Returns:
             DataFrame with cluster labels
         """
         if self.migration_data is None:
             raise ValueError("Migration data not loaded")
+        if method not in CLUSTER_METHODS:
+            raise ValueError(f"Unsupported clustering method: {method}")
         
-        # Extract coordinates
-        coords = self.migration_data[['latitude', 'longitude']].values
-        
-        # Create a distance matrix
-        n_samples = len(coords)
-        distance_matrix = np.zeros((n_samples, n_samples))
-        
-        for i in range(n_samples):
-            for j in range(i+1, n_samples):
-                distance = self._calculate_distance(
-                    coords[i][0], coords[i][1],
-                    coords[j][0], coords[j][1]
-                )
-                distance_matrix[i, j] = distance
-                distance_matrix[j, i] = distance
+        # Clusters only depend on the data and the parameters, so repeat calls are free
+        partitioned = bool(by_species) or time_bucket is not None
+        cluster_key = (self.migration_version, eps, min_samples, bool(by_species), time_bucket, method)
+        if cluster_key == self._cluster_key and 'cluster' in self.migration_data.columns:
+            if self._pending_rows is None:
+                return self.migration_data
+            # Grid clustering is cheap enough to simply redo
+            if not partitioned and method == 'exact':
+                self._update_migration_clusters(eps, min_samples)
+                return self.migration_data
         
-        # Apply DBSCAN clustering
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed')
-        self.migration_data['cluster'] = dbscan.fit_predict(distance_matrix)
+        if partitioned:
+            # Independent partitions are clustered in parallel and merged into global ids
+            self.migration_data['cluster'] = partitioned_dbscan(
+                self.migration_data['latitude'].values,
+                self.migration_data['longitude'].values,
+                partition_keys(self.migration_data, by_species, time_bucket).values,
+                eps=eps,
+                min_samples=min_samples,
+                max_workers=max_workers,
+                method=method,
+                sample_weight=self._sample_weight(self.migration_data)
+            )
+        else:
+            # Cluster on a haversine BallTree, or bin into grid cells for the approximate mode
+            self.migration_data['cluster'] = CLUSTER_METHODS[method](
+                self.migration_data['latitude'].values,
+                self.migration_data['longitude'].values,
+                eps=eps,
+                min_samples=min_samples,
+                sample_weight=self._sample_weight(self.migration_data)
+            )
+        self._cluster_key = cluster_key
+        self._cluster_summary = None
+        self._cluster_months = None
+        self.data_revision += 1
+        self._distance_table = None
+        self._pending_rows = None
+        self._dirty_clusters = set()
+        self._stream_clusterer = None
         
         # Count clusters (excluding noise points labeled as -1)
-        n_clusters = len(set(self.migration_data['cluster'])) - (1 if -1 in self.migration_data['cluster'] else 0)
+        n_clusters = int(self.migration_data['cluster'].max()) + 1 if len(self.migration_data) else 0
         print(f"Identified {n_clusters} migration clusters")
         
         return self.migration_data
     
+    def evaluate_grid_clustering(self, eps=50, min_samples=5, sample_size=200000, random_state=0):
+        """
+        Report how closely grid clustering matches exact DBSCAN on the loaded data
+        
+        Both methods run on the same records (a random sample when the data is
+        larger than sample_size, since exact DBSCAN is the slow side). Note that
+        sampling thins the data, so use min_samples scaled to the sample.
+        
+        Args:
+            eps: Maximum distance between points in a cluster (km)
+            min_samples: Minimum number of points to form a cluster
+            sample_size: Maximum number of records compared
+            random_state: Seed for the sample
+            
+        Returns:
+            Dictionary of agreement metrics (see clustering_agreement) plus
+            the sample size and the runtime of both methods in seconds
+        """
+        if self.migration_data is None:
+            raise ValueError("Migration data not loaded")
+        
+        data = self.migration_data
+        if len(data) > sample_size:
+            data = data.sample(n=sample_size, random_state=random_state)
+        lats, lons = data['latitude'].values, data['longitude'].values
+        weights = self._sample_weight(data)
+        
+        start = time.perf_counter()
+        exact = haversine_dbscan(lats, lons, eps=eps, min_samples=min_samples, sample_weight=weights)
+        exact_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        approximate = CLUSTER_METHODS['grid'](lats, lons, eps=eps, min_samples=min_samples, sample_weight=weights)
+        grid_seconds = time.perf_counter() - start
+        
+        report = clustering_agreement(exact, approximate)
+        report.update({
+            'sample_size': len(data),
+            'exact_seconds': exact_seconds,
+            'grid_seconds': grid_seconds
+        })
+        print(f"Grid clustering agreement: ARI {report['adjusted_rand_index']:.3f} on {len(data)} records")
+        
+        return report
+    
+    def _update_migration_clusters(self, eps, min_samples):
+        """Cluster pending appended rows by re-labelling only their neighbourhood"""
+        labels = self.migration_data['cluster'].fillna(-1).astype(np.int64).values
+        labels, changed = update_dbscan_labels(
+            self.migration_data['latitude'].values,
+            self.migration_data['longitude'].values,
+            labels,
+            self._pending_rows,
+            eps=eps,
+            min_samples=min_samples,
+            sample_weight=self._sample_weight(self.migration_data)
+        )
+        self.migration_data['cluster'] = labels
+        self._pending_rows = None
+        self._stream_clusterer = None
+        self._apply_cluster_changes(changed)
+        
+        print(f"Updated {len(changed)} migration clusters around appended records")
+    
+    def _apply_cluster_changes(self, changed):
+        """Patch the cached summaries of the touched clusters and mark them for re-detection"""
+        if self._cluster_summary is not None:
+            kept = self._cluster_summary.drop(index=list(changed), errors='ignore')
+            touched = self.migration_data[self.migration_data['cluster'].isin(changed)]
+            self._cluster_summary = pd.concat([kept, self._summarize_clusters(touched)]).sort_index()
+        if self._cluster_months is not None:
+            months = self._cluster_months
+            kept = months[~months.index.get_level_values('cluster').isin(list(changed))]
+            touched = self.migration_data[self.migration_data['cluster'].isin(changed)]
+            self._cluster_months = pd.concat([kept, self._summarize_cluster_months(touched)]).sort_index()
+        self._dirty_clusters.update(changed)
+        self.data_revision += 1
+    
+    def append_sightings(self, data, eps=50, min_samples=5):
+        """
+        Stream a batch of new sightings into the existing clusters
+        
+        Uses an IncrementalDBSCAN that is seeded from the loaded history once
+        (adopting its current labels when they were computed with the same
+        parameters) and afterwards only touches the neighbourhoods of new
+        points. Cluster ids stay stable across batches.
+        
+        Args:
+            data: DataFrame of standardized migration records
+            eps: Maximum distance between points in a cluster (km)
+            min_samples: Minimum number of points to form a cluster
+            
+        Returns:
+            Sorted list of cluster ids that were created, grew or merged away
+        """
+        if self.migration_data is None:
+            self._set_migration_data(data.iloc[:0].copy())
+        
+        engine = self._stream_clusterer
+        if engine is None or (engine.eps, engine.min_samples) != (eps, min_samples) or len(engine) != len(self.migration_data):
+            engine = IncrementalDBSCAN(eps, min_samples)
+            current = (self.migration_version, eps, min_samples, False, None, 'exact')
+            labels = None
+            if self._cluster_key == current and self._pending_rows is None and 'cluster' in self.migration_data.columns:
+                labels = self.migration_data['cluster'].values
+            engine.fit(
+                self.migration_data['latitude'].values,
+                self.migration_data['longitude'].values,
+                labels=labels,
+                sample_weight=self._sample_weight(self.migration_data)
+            )
+            
+            # A fresh labelling invalidates everything derived from the old one
+            if labels is None:
+                self._cluster_summary = None
+                self._cluster_months = None
+                self._distance_table = None
+                self._dirty_clusters = set()
+            self._stream_clusterer = engine
+        
+        self.migration_data = pd.concat([self.migration_data, data], ignore_index=True)
+        self.risk_revision += 1
+        _, changed = engine.insert(
+            data['latitude'].values,
+            data['longitude'].values,
+            sample_weight=self._sample_weight(data)
+        )
+        self.migration_data['cluster'] = engine.labels()
+        self._cluster_key = (self.migration_version, eps, min_samples, False, None, 'exact')
+        self._pending_rows = None
+        self._apply_cluster_changes(changed)
+        
+        return sorted(changed)
+    
+    def _summarize_clusters(self, clustered):
+        """
+        Center, time range, species and size of each cluster in the given rows
+        
+        Returns:
+            DataFrame indexed by cluster id
+        """
+        groups = clustered.groupby('cluster')
+        summary = groups[['latitude', 'longitude']].mean()
+        summary['count'] = groups['weight'].sum().astype(np.int64) if 'weight' in clustered.columns else groups.size()
+        summary['species'] = groups['species'].first() if 'species' in clustered.columns else "Unknown"
+        
+        # Get time range for each cluster
+        if 'timestamp' in clustered.columns:
+            summary['time_start'] = groups['timestamp'].min().astype(object)
+            summary['time_end'] = groups['timestamp'].max().astype(object)
+        elif 'month' in clustered.columns and 'year' in clustered.columns:
+            summary['time_start'] = groups['month'].min().astype(str) + "/" + groups['year'].min().astype(str)
+            summary['time_end'] = groups['month'].max().astype(str) + "/" + groups['year'].max().astype(str)
+        else:
+            summary['time_start'] = "Unknown"
+            summary['time_end'] = "Unknown"
+        
+        return summary
+    
+    def _get_cluster_summary(self):
+        """
+        Per-cluster summary for all clusters, cached per clustering
+        
+        Returns:
+            DataFrame indexed by cluster id
+        """
+        if self._cluster_summary is None:
+            self._cluster_summary = self._summarize_clusters(self.migration_data[self.migration_data['cluster'] >= 0])
+        return self._cluster_summary
+    
+    def _summarize_cluster_months(self, clustered):
+        """
+        Sightings and individuals of each cluster per month
+        
+        Months come from the 'month'/'year' columns, or from 'timestamp'
+        when those are missing; rows without a usable month are left out.
+        
+        Returns:
+            DataFrame indexed by (cluster, month, year) with 'observations'
+            (sightings, honouring thinning weights) and 'individuals' (summed 'count')
+        """
+        if 'month' in clustered.columns and 'year' in clustered.columns:
+            month = pd.to_numeric(clustered['month'], errors='coerce')
+            year = pd.to_numeric(clustered['year'], errors='coerce')
+        elif 'timestamp' in clustered.columns:
+            timestamps = pd.to_datetime(clustered['timestamp'], errors='coerce')
+            month, year = timestamps.dt.month, timestamps.dt.year
+        else:
+            month = year = pd.Series(np.nan, index=clustered.index)
+        
+        weights = self._sample_weight(clustered)
+        observations = weights if weights is not None else np.ones(len(clustered))
+        if 'count' in clustered.columns:
+            individuals = pd.to_numeric(clustered['count'], errors='coerce').fillna(1).values
+        else:
+            individuals = observations
+        
+        frame = pd.DataFrame({
+            'cluster': clustered['cluster'].values,
+            'month': month.values,
+            'year': year.values,
+            'observations': observations,
+            'individuals': individuals
+        }).dropna(subset=['month', 'year'])
+        frame['month'] = frame['month'].astype(np.int64)
+        frame['year'] = frame['year'].astype(np.int64)
+        
+        return frame.groupby(['cluster', 'month', 'year']).sum()
+    
+    def _get_cluster_months(self):
+        """Per-cluster monthly totals for all clusters, cached per clustering"""
+        if self._cluster_months is None:
+            self._cluster_months = self._summarize_cluster_months(self.migration_data[self.migration_data['cluster'] >= 0])
+        return self._cluster_months
+    
+    def _build_conflict_cube(self, cluster_ids, lane_ids, risk_levels, species):
+        """
+        Aggregate detected conflicts over (species, month, year, lane, risk band)
+        
+        Each conflict is a cluster/lane pair and counts once in every month its
+        cluster has sightings; its species is the cluster's. Sightings and
+        individuals are those of the conflicting cluster in that month.
+        
+        Returns:
+            DataFrame with one row per non-empty cell and the additive measures
+            'conflict_count', 'risk_sum', 'observations' and 'individuals'
+        """
+        names = [name for name, _ in self.RISK_BANDS]
+        edges = [edge for _, edge in self.RISK_BANDS[1:]]
+        conflicts = pd.DataFrame({
+            'cluster': cluster_ids,
+            'species': species,
+            'shipping_lane_id': lane_ids,
+            'risk_band': pd.Categorical.from_codes(np.digitize(risk_levels, edges), categories=names),
+            'risk_level': risk_levels
+        })
+        
+        cells = conflicts.merge(self._get_cluster_months().reset_index(), on='cluster')
+        cube = cells.groupby(
+            ['species', 'month', 'year', 'shipping_lane_id', 'risk_band'], observed=True, as_index=False
+        ).agg(
+            conflict_count=('cluster', 'size'),
+            risk_sum=('risk_level', 'sum'),
+            observations=('observations', 'sum'),
+            individuals=('individuals', 'sum')
+        )
+        cube['risk_band'] = cube['risk_band'].astype(str)
+        return cube
+    
+    def _get_distance_table(self, distance_threshold):
+        """
+        Nearest distance from each cluster center to every lane within a radius
+        
+        The table does not depend on the threshold: it is built for a radius of
+        at least DISTANCE_TABLE_MIN_RADIUS and reused by any smaller threshold
+        until the data, the lanes or the clustering change.
+        
+        Dirty clusters and lanes from incremental updates are patched in place:
+        their rows are dropped and recomputed for just those clusters or lanes.
+        
+        Returns:
+            Dict with 'radius' and arrays 'cluster_id', 'lane_id', 'distance_km'
+        """
+        table_key = (self.migration_version, self.lanes_version, self._cluster_key)
+        table = self._distance_table
+        
+        if table is not None and table['key'] == table_key and table['radius'] >= distance_threshold:
+            self._patch_distance_table(table)
+            return table
+        
+        radius = max(distance_threshold, self.DISTANCE_TABLE_MIN_RADIUS)
+        if table is not None and table['key'] == table_key:
+            radius = max(radius, 2 * table['radius'])
+        
+        summary = self._get_cluster_summary()
+        rows, lane_ids, distances = self.lane_store.lanes_within(
+            summary['latitude'].values, summary['longitude'].values, radius
+        )
+        
+        self._distance_table = {
+            'key': table_key,
+            'radius': radius,
+            'cluster_id': summary.index.values[rows],
+            'lane_id': lane_ids,
+            'distance_km': distances
+        }
+        self._dirty_clusters = set()
+        self._dirty_lanes = set()
+        return self._distance_table
+    
+    def _patch_distance_table(self, table):
+        """Recompute distance table rows for dirty clusters and dirty lanes only"""
+        if not self._dirty_clusters and not self._dirty_lanes:
+            return
+        
+        summary = self._get_cluster_summary()
+        dirty_clusters = np.array(sorted(self._dirty_clusters), dtype=np.int64)
+        dirty_lanes = np.array(sorted(self._dirty_lanes), dtype=np.int64)
+        keep = ~np.isin(table['cluster_id'], dirty_clusters) & ~np.isin(table['lane_id'], dirty_lanes)
+        parts = [(table['cluster_id'][keep], table['lane_id'][keep], table['distance_km'][keep])]
+        
+        # Dirty clusters against every lane
+        centers = summary[summary.index.isin(dirty_clusters)]
+        if len(centers):
+            rows, lane_ids, distances = self.lane_store.lanes_within(
+                centers['latitude'].values, centers['longitude'].values, table['radius']
+            )
+            parts.append((centers.index.values[rows], lane_ids, distances))
+        
+        # Every remaining cluster against the dirty lanes only, through a store of just those lanes
+        if len(dirty_lanes):
+            centers = summary[~summary.index.isin(dirty_clusters)]
+            subset_store = LaneStore([self.shipping_lanes[lane_id] for lane_id in dirty_lanes])
+            rows, local_ids, distances = subset_store.lanes_within(
+                centers['latitude'].values, centers['longitude'].values, table['radius']
+            )
+            parts.append((centers.index.values[rows], dirty_lanes[local_ids], distances))
+        
+        cluster_ids, lane_ids, distances = (np.concatenate(column) for column in zip(*parts))
+        order = np.lexsort((lane_ids, cluster_ids))
+        table['cluster_id'] = cluster_ids[order]
+        table['lane_id'] = lane_ids[order]
+        table['distance_km'] = distances[order]
+        
+        print(f"Re-detected {len(dirty_clusters)} clusters and {len(dirty_lanes)} lanes")
+        self._dirty_clusters = set()
+        self._dirty_lanes = set()
+    
     def detect_conflicts(self, distance_threshold=10):
         """
         Detect conflicts between migration clusters and shipping lanes
@@ -138,72 +736,272 @@ class ConflictDetectionService:
         if self.migration_data is None or self.shipping_lanes is None:
             raise ValueError("Migration data and shipping lanes must be loaded")
         
-        # Ensure we have clusters
+        # Ensure we have clusters, including for any appended rows
         if 'cluster' not in self.migration_data.columns:
             self.identify_migration_clusters()
+        elif self._pending_rows is not None:
+            if self._cluster_key is None:
+                self.identify_migration_clusters()
+            else:
+                self.identify_migration_clusters(*self._cluster_key[1:])
         
-        conflicts = []
+        # Nothing that feeds the conflicts changed, so neither do they
+        if self._conflict_key == (self.data_revision, distance_threshold) and self.conflict_zones is not None:
+            return self.conflict_zones
         
-        # Group by cluster
-        for cluster_id, cluster_data in self.migration_data[self.migration_data['cluster'] >= 0].groupby('cluster'):
-            # Calculate cluster center
-            cluster_center = cluster_data[['latitude', 'longitude']].mean().values
-            
-            # Get time range for this cluster
-            if 'timestamp' in cluster_data.columns:
-                time_range = [
-                    cluster_data['timestamp'].min(),
-                    cluster_data['timestamp'].max()
-                ]
-            elif 'month' in cluster_data.columns and 'year' in cluster_data.columns:
-                time_range = [
-                    f"{cluster_data['month'].min()}/{cluster_data['year'].min()}",
-                    f"{cluster_data['month'].max()}/{cluster_data['year'].max()}"
-                ]
-            else:
-                time_range = ["Unknown", "Unknown"]
+        # A threshold change is only a filter and a risk rescale over the cached table
+        summary = self._get_cluster_summary()
+        table = self._get_distance_table(distance_threshold)
+        hit = table['distance_km'] <= distance_threshold
+        rows = summary.index.get_indexer(table['cluster_id'][hit])
+        lane_ids = table['lane_id'][hit]
+        distances = table['distance_km'][hit]
+        
+        # Calculate risk level (higher when distance is smaller), between 0-100
+        risk_levels = np.clip(100 * (1 - distances / distance_threshold), 0, 100)
+        
+        cluster_ids = summary.index.values[rows]
+        latitudes = summary['latitude'].values[rows]
+        longitudes = summary['longitude'].values[rows]
+        species = summary['species'].values[rows]
+        counts = summary['count'].values[rows]
+        time_starts = summary['time_start'].values[rows]
+        time_ends = summary['time_end'].values[rows]
+        lane_names = self.lane_store.names
+        
+        conflicts = [
+            {
+                'cluster_id': int(cluster_ids[i]),
+                'cluster_center': {
+                    'latitude': float(latitudes[i]),
+                    'longitude': float(longitudes[i])
+                },
+                'time_range': [time_starts[i], time_ends[i]],
+                'shipping_lane_id': int(lane_ids[i]),
+                'shipping_lane_name': lane_names[lane_ids[i]],
+                'distance_km': float(distances[i]),
+                'risk_level': float(risk_levels[i]),
+                'species': species[i],
+                'count': int(counts[i])
+            }
+            for i in range(len(rows))
+        ]
+        
+        # Sort by risk level (highest first)
+        conflicts.sort(key=lambda x: x['risk_level'], reverse=True)
+        self.conflict_zones = conflicts
+        self.conflict_cube = self._build_conflict_cube(cluster_ids, lane_ids, risk_levels, species)
+        self.data_revision += 1
+        self._conflict_key = (self.data_revision, distance_threshold)
+        
+        return conflicts
+    
+    def sweep_parameters(self, eps_values=(25, 50), min_samples_values=(3, 5, 10), distance_thresholds=(10,)):
+        """
+        Evaluate a grid of clustering and detection parameters in one pass
+        
+        The neighbour graph is built once at the largest eps and every
+        (eps, min_samples) pair is clustered from it; cluster centers are
+        then measured against the lanes once at the largest threshold and
+        every threshold is a filter over those distances. The service's own
+        clustering and conflict state are left untouched.
+        
+        Args:
+            eps_values: Cluster distances to try (km)
+            min_samples_values: Minimum cluster sizes to try
+            distance_thresholds: Conflict distance thresholds to try (km)
             
-            # Check each shipping lane
-            for lane_id, lane in enumerate(self.shipping_lanes):
-                lane_coords = lane.get('coordinates', [])
+        Returns:
+            List of dicts, one per (eps, min_samples, distance_threshold), with
+            cluster, noise and conflict counts and risk totals
+        """
+        if self.migration_data is None or self.shipping_lanes is None:
+            raise ValueError("Migration data and shipping lanes must be loaded")
+        if not len(eps_values) or not len(min_samples_values) or not len(distance_thresholds):
+            raise ValueError("Every parameter list needs at least one value")
+        
+        lats = self.migration_data['latitude'].values
+        lons = self.migration_data['longitude'].values
+        weights = self._sample_weight(self.migration_data)
+        sightings = np.ones(len(lats)) if weights is None else weights
+        max_threshold = max(distance_thresholds)
+        
+        graph = NeighbourGraph(lats, lons, max(eps_values), sample_weight=weights)
+        print(f"Built neighbour graph with {len(graph)} pairs for the parameter sweep")
+        
+        results = []
+        for eps in sorted(eps_values):
+            for min_samples in sorted(min_samples_values):
+                labels = graph.dbscan(eps, min_samples)
+                clustered = labels >= 0
+                n_clusters = int(labels.max()) + 1 if clustered.any() else 0
                 
-                if not lane_coords:
-                    continue
+                # Cluster centers and sizes, as in the cluster summary
+                members = np.bincount(labels[clustered], minlength=n_clusters)
+                center_lat = np.bincount(labels[clustered], weights=lats[clustered], minlength=n_clusters) / np.maximum(members, 1)
+                center_lon = np.bincount(labels[clustered], weights=lons[clustered], minlength=n_clusters) / np.maximum(members, 1)
+                sizes = np.bincount(labels[clustered], weights=sightings[clustered], minlength=n_clusters)
                 
-                # Calculate minimum distance to shipping lane
-                min_distance = self._point_to_line_distance(cluster_center, lane_coords)
+                cluster_idx, _, distances = self.lane_store.lanes_within(center_lat, center_lon, max_threshold)
                 
-                # If distance is below threshold, record conflict
-                if min_distance <= distance_threshold:
-                    # Calculate risk level (higher when distance is smaller)
-                    risk_level = 100 * (1 - (min_distance / distance_threshold))
-                    risk_level = max(0, min(100, risk_level))  # Ensure between 0-100
-                    
-                    conflicts.append({
-                        'cluster_id': int(cluster_id),
-                        'cluster_center': {
-                            'latitude': float(cluster_center[0]),
-                            'longitude': float(cluster_center[1])
-                        },
-                        'time_range': time_range,
-                        'shipping_lane_id': lane_id,
-                        'shipping_lane_name': lane.get('name', f"Lane {lane_id}"),
-                        'distance_km': float(min_distance),
-                        'risk_level': float(risk_level),
-                        'species': cluster_data['species'].iloc[0] if 'species' in cluster_data.columns else "Unknown",
-                        'count': len(cluster_data)
+                for threshold in sorted(distance_thresholds):
+                    hit = distances <= threshold
+                    risk_levels = np.clip(100 * (1 - distances[hit] / threshold), 0, 100)
+                    results.append({
+                        'eps': eps,
+                        'min_samples': min_samples,
+                        'distance_threshold': threshold,
+                        'cluster_count': n_clusters,
+                        'noise_count': int((~clustered).sum()),
+                        'conflict_count': int(hit.sum()),
+                        'conflicting_cluster_count': int(len(np.unique(cluster_idx[hit]))),
+                        'total_risk': float(risk_levels.sum()),
+                        'avg_risk_level': float(risk_levels.mean()) if len(risk_levels) else 0.0,
+                        'high_risk_count': int((risk_levels >= 70).sum()),
+                        'exposed_count': int(sizes[np.unique(cluster_idx[hit])].sum())
                     })
         
-        # Sort by risk level (highest first)
-        conflicts.sort(key=lambda x: x['risk_level'], reverse=True)
-        self.conflict_zones = conflicts
+        return results
+    
+    def _observation_chunks(self, chunk_size):
+        """Yield fixed-size slices of the loaded migration data"""
+        if self.migration_data is None:
+            raise ValueError("Migration data not loaded")
         
-        return conflicts
+        for start in range(0, len(self.migration_data), chunk_size):
+            yield self.migration_data.iloc[start:start + chunk_size]
+    
+    def _exposure_records(self, exposure):
+        """Convert an exposure table to JSON-ready dicts, highest risk-weighted exposure first"""
+        exposure = exposure.sort_values('risk_weighted_exposure', ascending=False)
+        records = []
+        for row in exposure.itertuples(index=False):
+            lane_id = int(row.shipping_lane_id)
+            records.append({
+                'shipping_lane_id': lane_id,
+                'shipping_lane_name': self.lane_store.names[lane_id],
+                'species': row.species,
+                'observation_count': int(row.observations),
+                'exposure': float(row.exposure),
+                'risk_weighted_exposure': float(row.risk_weighted_exposure),
+                'avg_risk_level': float(100 * row.risk_weighted_exposure / row.exposure) if row.exposure else 0.0,
+                'min_distance_km': float(row.min_distance_km)
+            })
+        return records
+    
+    def iter_observation_conflicts(self, distance_threshold=10, chunks=None, chunk_size=100000):
+        """
+        Check every migration observation against the lanes, one chunk at a time
+        
+        Unlike detect_conflicts this does not reduce clusters to their centers
+        and keeps noise points. Observations are weighted by the 'count' column
+        (1 when absent), and thinned records count as the number of sightings
+        they stand for. Only the running per-(lane, species) totals are kept
+        between chunks, so memory is bounded by the chunk size and the number
+        of lane/species pairs, not by the number of observations.
+        
+        Args:
+            distance_threshold: Maximum distance (km) to consider an observation exposed
+            chunks: Iterable of standardized migration DataFrames, e.g. from a
+                chunked CSV reader; defaults to slices of the loaded migration data
+            chunk_size: Rows per slice when chunks is not given
+            
+        Yields:
+            One progress dict per chunk with that chunk's exposures, then a final
+            dict with 'done' set and the accumulated exposures
+        """
+        if self.shipping_lanes is None:
+            raise ValueError("Shipping lanes must be loaded")
+        
+        if chunks is None:
+            chunks = self._observation_chunks(chunk_size)
+        
+        aggregations = {
+            'observations': 'sum',
+            'exposure': 'sum',
+            'risk_weighted_exposure': 'sum',
+            'min_distance_km': 'min'
+        }
+        totals = None
+        processed = 0
+        
+        field = self._get_distance_field()
+        
+        for chunk_number, chunk in enumerate(chunks):
+            # Only observations the distance field cannot rule out are measured against the lanes
+            lats, lons = chunk['latitude'].values, chunk['longitude'].values
+            candidates = np.flatnonzero(field.may_be_within(lats, lons, distance_threshold))
+            point_idx, lane_idx, distances = self.lane_store.lanes_within(
+                lats[candidates], lons[candidates], distance_threshold
+            )
+            point_idx = candidates[point_idx]
+            processed += len(chunk)
+            
+            if 'count' in chunk.columns:
+                weights = pd.to_numeric(chunk['count'], errors='coerce').fillna(1).values[point_idx]
+            else:
+                weights = np.ones(len(point_idx))
+            
+            # Thinned records stand for several original observations
+            sightings = self._sample_weight(chunk)
+            sightings = 1 if sightings is None else sightings[point_idx]
+            
+            if 'species' in chunk.columns:
+                species = chunk['species'].values[point_idx]
+            else:
+                species = np.full(len(point_idx), "Unknown", dtype=object)
+            
+            risk = np.clip(1 - distances / distance_threshold, 0, 1)
+            partial = pd.DataFrame({
+                'shipping_lane_id': lane_idx,
+                'species': species,
+                'observations': sightings,
+                'exposure': weights,
+                'risk_weighted_exposure': weights * risk,
+                'min_distance_km': distances
+            }).groupby(['shipping_lane_id', 'species'], as_index=False).agg(aggregations)
+            
+            if totals is None:
+                totals = partial
+            else:
+                totals = pd.concat([totals, partial]).groupby(['shipping_lane_id', 'species'], as_index=False).agg(aggregations)
+            
+            yield {
+                'chunk': chunk_number,
+                'observations_processed': processed,
+                'exposures': self._exposure_records(partial)
+            }
+        
+        yield {
+            'done': True,
+            'observations_processed': processed,
+            'exposures': self._exposure_records(totals) if totals is not None else []
+        }
+    
+    def detect_observation_conflicts(self, distance_threshold=10, chunks=None, chunk_size=100000):
+        """
+        Per-lane, per-species exposure of every migration observation
+        
+        Args:
+            distance_threshold: Maximum distance (km) to consider an observation exposed
+            chunks: Optional iterable of standardized migration DataFrames
+            chunk_size: Rows per slice when chunks is not given
+            
+        Returns:
+            List of exposure records sorted by risk-weighted exposure
+        """
+        for progress in self.iter_observation_conflicts(distance_threshold, chunks, chunk_size):
+            if progress.get('done'):
+                return progress['exposures']
     
     def generate_conflict_map(self):
         """
         Generate a map visualization of migration clusters and shipping lanes
         
+        Rendering runs on the shared MapRenderer, so concurrent requests draw
+        on separate figures; the lanes, frame and grid come from a base image
+        cached per lane revision and map extent.
+        
         Returns:
             Base64 encoded PNG image
         """
@@ -214,104 +1012,406 @@ class ConflictDetectionService:
         if 'cluster' not in self.migration_data.columns:
             self.identify_migration_clusters()
         
-        # Create figure
-        plt.figure(figsize=(12, 8))
+        # Snapshot everything the render needs, so it never reads service state mid-update
+        clustered = self.migration_data[self.migration_data['cluster'] >= 0]
+        lons = clustered['longitude'].values.copy()
+        lats = clustered['latitude'].values.copy()
+        clusters = clustered['cluster'].values.astype(np.int64)
+        conflicts = self.conflict_zones or []
+        conflict_lons = [c['cluster_center']['longitude'] for c in conflicts]
+        conflict_lats = [c['cluster_center']['latitude'] for c in conflicts]
         
-        # Plot migration clusters
-        for cluster_id, cluster_data in self.migration_data[self.migration_data['cluster'] >= 0].groupby('cluster'):
-            plt.scatter(
-                cluster_data['longitude'], 
-                cluster_data['latitude'],
-                alpha=0.6,
-                label=f"Cluster {cluster_id}"
+        store = self.lane_store
+        extent = map_extent(store.bboxes, lons, lats)
+        base_key = (self.lane_revision, extent)
+        
+        png = self.map_renderer.submit(
+            render_conflict_map, MAP_FIGSIZE, MAP_DPI,
+            self.map_renderer, base_key, store.parts_for_zoom(None), extent,
+            lons, lats, clusters, conflict_lons, conflict_lats
+        ).result()
+        
+        # Encode as base64
+        return base64.b64encode(png).decode('utf-8')
+    
+    def _get_tile_layers(self):
+        """Map geometry in Web Mercator for the current data revision"""
+        if self._tile_layers is None or self._tile_layers[0] != self.data_revision:
+            if 'cluster' in self.migration_data.columns:
+                clusters = self.migration_data['cluster'].fillna(-1).values
+            else:
+                clusters = np.full(len(self.migration_data), -1)
+            conflicts = self.conflict_zones or []
+            layers = TileLayers(
+                self.migration_data['longitude'].values,
+                self.migration_data['latitude'].values,
+                clusters,
+                self.lane_store.zoom_levels(),
+                [c['cluster_center']['longitude'] for c in conflicts],
+                [c['cluster_center']['latitude'] for c in conflicts]
             )
+            self._tile_layers = (self.data_revision, layers)
+        return self._tile_layers[1]
+    
+    def render_map_tile(self, z, x, y):
+        """
+        Render (or fetch from cache) one XYZ map tile
         
-        # Plot shipping lanes
-        for lane_id, lane in enumerate(self.shipping_lanes):
-            lane_coords = lane.get('coordinates', [])
-            if lane_coords:
-                lats = [p[0] for p in lane_coords]
-                lons = [p[1] for p in lane_coords]
-                plt.plot(lons, lats, 'k-', alpha=0.7, linewidth=2)
-        
-        # Plot conflict zones if available
-        if self.conflict_zones:
-            for conflict in self.conflict_zones:
-                plt.scatter(
-                    conflict['cluster_center']['longitude'],
-                    conflict['cluster_center']['latitude'],
-                    color='red',
-                    marker='x',
-                    s=100,
-                    linewidth=2
-                )
+        Tiles are Web Mercator PNGs of the clusters, lanes and conflict
+        markers intersecting the tile, cached in a byte-capped LRU keyed by
+        the data revision, so any change to the data or results retires the
+        old tiles.
         
-        plt.title('Migration Clusters and Shipping Lanes')
-        plt.xlabel('Longitude')
-        plt.ylabel('Latitude')
-        plt.grid(True)
+        Args:
+            z, x, y: Tile coordinates
+            
+        Returns:
+            Tuple (png_bytes, revision)
+        """
+        if self.migration_data is None or self.shipping_lanes is None:
+            raise ValueError("Migration data and shipping lanes must be loaded")
         
-        # Save to buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
+        # Ensure we have clusters
+        if 'cluster' not in self.migration_data.columns:
+            self.identify_migration_clusters()
         
-        # Encode as base64
-        image_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
+        revision = self.data_revision
+        key = (revision, z, x, y)
+        tile = self.tile_cache.get(key)
+        if tile is None:
+            tile = self.map_renderer.submit(
+                render_tile, TILE_FIGSIZE, TILE_SIZE, self._get_tile_layers(), z, x, y
+            ).result()
+            self.tile_cache.put(key, tile)
         
-        return image_base64
+        return tile, revision
+    
+    def get_shipping_lanes_view(self, zoom=None, bbox=None):
+        """
+        Shipping lanes at the level of detail suited to a map view
+        
+        Args:
+            zoom: Map zoom level; None returns every vertex
+            bbox: Optional (min_lon, min_lat, max_lon, max_lat) view box; only
+                lanes whose bounding box intersects it are returned
+            
+        Returns:
+            List of standardized lanes ([lat, lon] 'coordinates', plus 'parts'
+            for multi-part lanes) with their simplified geometry
+        """
+        if self.shipping_lanes is None:
+            raise ValueError("Shipping lanes not loaded")
+        
+        store = self.lane_store
+        parts = store.parts_for_zoom(zoom)
+        lane_ids = store.lanes_in_bbox(bbox) if bbox is not None else np.arange(store.n_lanes)
+        
+        lanes = []
+        for lane_id in lane_ids:
+            first, last = store.lane_part_offsets[lane_id], store.lane_part_offsets[lane_id + 1]
+            lane_parts_latlon = [parts[p][:, ::-1].tolist() for p in range(first, last)]
+            lane = {
+                'id': self.shipping_lanes[lane_id].get('id', int(lane_id)),
+                'name': store.names[lane_id],
+                'coordinates': lane_parts_latlon[0] if lane_parts_latlon else []
+            }
+            if len(lane_parts_latlon) > 1:
+                lane['parts'] = lane_parts_latlon
+            lanes.append(lane)
+        
+        return lanes
+    
+    def _get_risk_raster(self, resolution=None):
+        """
+        Conflict-risk raster for the current sightings and lanes
+        
+        Rasters are kept per resolution and rebuilt only after the risk
+        revision moves, i.e. when sightings or lane geometry change. Only the
+        cell sizes in RISK_RESOLUTIONS_DEG are accepted, which bounds both
+        the size of one raster and the number kept.
+        
+        Args:
+            resolution: Cell size (degrees), one of RISK_RESOLUTIONS_DEG;
+                defaults to RISK_RESOLUTION_DEG
+            
+        Returns:
+            Tuple (RiskRaster, revision)
+        """
+        if self.migration_data is None or self.shipping_lanes is None:
+            raise ValueError("Migration data and shipping lanes must be loaded")
+        
+        resolution = float(resolution or self.RISK_RESOLUTION_DEG)
+        allowed = [r for r in self.RISK_RESOLUTIONS_DEG if np.isclose(r, resolution)]
+        if not allowed:
+            raise ValueError(f"Raster resolution must be one of {list(self.RISK_RESOLUTIONS_DEG)}")
+        resolution = allowed[0]
+        
+        revision = self.risk_revision
+        cached = self._risk_rasters.get(resolution)
+        if cached is not None and cached[0] == revision:
+            return cached[1], revision
+        
+        data = self.migration_data
+        weights = pd.to_numeric(data['count'], errors='coerce').fillna(1).values if 'count' in data.columns else None
+        raster = RiskRaster(
+            data['latitude'].values, data['longitude'].values, weights, self.lane_store,
+            resolution=resolution, smoothing_km=self.RISK_SMOOTHING_KM, proximity_km=self.RISK_PROXIMITY_KM
+        )
+        
+        # Rasters of an older revision are useless, so drop them all
+        self._risk_rasters = {k: v for k, v in self._risk_rasters.items() if v[0] == revision}
+        self._risk_rasters[resolution] = (revision, raster)
+        return raster, revision
+    
+    def get_risk_grid(self, layer='risk', resolution=None, max_cells=40000, bbox=None):
+        """
+        Conflict-risk surface as a (downsampled) grid
+        
+        Risk is smoothed migration density, weighted by sighting count,
+        multiplied by lane proximity; both factors are scaled to [0, 1].
+        
+        Args:
+            layer: 'risk', 'density' or 'proximity'
+            resolution: Raster cell size (degrees), one of RISK_RESOLUTIONS_DEG
+            max_cells: Upper bound on cells returned; larger areas are block-max downsampled
+            bbox: Optional (min_lon, min_lat, max_lon, max_lat) crop
+            
+        Returns:
+            Dictionary with the grid values (rows south to north), bounds,
+            cell size and the raster revision
+        """
+        raster, revision = self._get_risk_raster(resolution)
+        grid = raster.grid(layer, bbox=bbox, max_cells=max_cells)
+        return {
+            'layer': layer,
+            'revision': revision,
+            'bounds': grid['bounds'],
+            'resolution': grid['resolution'],
+            'shape': list(grid['values'].shape),
+            'max': grid['max'],
+            'values': np.round(grid['values'], 4).tolist()
+        }
+    
+    def render_risk_tile(self, z, x, y, layer='risk'):
+        """
+        Render (or fetch from cache) one XYZ heatmap tile of the risk raster
+        
+        Returns:
+            Tuple (png_bytes, revision)
+        """
+        raster, revision = self._get_risk_raster()
+        key = ('risk', layer, revision, z, x, y)
+        tile = self.tile_cache.get(key)
+        if tile is None:
+            tile = render_heatmap_tile(raster, z, x, y, layer)
+            self.tile_cache.put(key, tile)
+        
+        return tile, revision
+    
+    def _get_distance_field(self):
+        """Distance-to-nearest-lane field for the current lane geometry"""
+        if self.shipping_lanes is None:
+            raise ValueError("Shipping lanes not loaded")
+        
+        if self._distance_field is None or self._distance_field[0] != self.lane_revision:
+            field = LaneDistanceField(
+                self.lane_store,
+                resolution=self.DISTANCE_FIELD_RESOLUTION_DEG,
+                max_distance_km=self.DISTANCE_FIELD_MAX_KM
+            )
+            self._distance_field = (self.lane_revision, field)
+        return self._distance_field[1]
+    
+    def check_lane_proximity(self, latitudes, longitudes, distance_threshold=10):
+        """
+        Nearest shipping lane of each position, e.g. live vessel or animal fixes
+        
+        Distances come from the precomputed field; positions that may lie
+        within distance_threshold of a lane are measured exactly, so the
+        'within_threshold' flags are exact while distances further out are
+        interpolated (within the field's error bound) and capped.
+        
+        Args:
+            latitudes, longitudes: Position coordinates (degrees)
+            distance_threshold: Distance (km) that counts as near a lane
+            
+        Returns:
+            Dictionary with one record per position and the field's error bound
+        """
+        field = self._get_distance_field()
+        distances, lane_ids, exact = field.nearest(latitudes, longitudes, exact_within=distance_threshold)
+        
+        positions = []
+        for lat, lon, distance, lane_id, is_exact in zip(latitudes, longitudes, distances, lane_ids, exact):
+            positions.append({
+                'latitude': float(lat),
+                'longitude': float(lon),
+                'distance_km': float(distance),
+                'shipping_lane_id': int(lane_id) if lane_id >= 0 else None,
+                'shipping_lane_name': self.lane_store.names[lane_id] if lane_id >= 0 else None,
+                'within_threshold': bool(distance <= distance_threshold),
+                'exact': bool(is_exact)
+            })
+        
+        return {
+            'positions': positions,
+            'distance_threshold': distance_threshold,
+            'max_distance_km': field.max_distance_km,
+            'error_bound_km': field.error_bound_km
+        }
+    
+    def query_conflict_cube(self, filters=None, group_by=('month', 'year')):
+        """
+        Slice and roll up the conflict cube
+        
+        Args:
+            filters: Optional dict mapping cube dimensions ('species', 'month',
+                'year', 'shipping_lane_id', 'risk_band') to a value or list of values
+            group_by: Dimensions to keep; every other dimension is summed out
+            
+        Returns:
+            List of dicts with the kept dimensions, 'conflict_count',
+            'observations', 'individuals' and 'avg_risk_level'. A conflict
+            spanning several months counts once per month, so conflict counts
+            summed over months are conflict-months.
+        """
+        if self.conflict_cube is None:
+            raise ValueError("No conflicts detected yet")
+        
+        dimensions = ['species', 'month', 'year', 'shipping_lane_id', 'risk_band']
+        group_by = list(group_by or [])
+        unknown = [d for d in list(filters or {}) + group_by if d not in dimensions]
+        if unknown:
+            raise ValueError(f"Unknown cube dimensions: {', '.join(map(str, unknown))}")
+        
+        cube = self.conflict_cube
+        mask = np.ones(len(cube), dtype=bool)
+        for dimension, values in (filters or {}).items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            mask &= cube[dimension].isin(list(values)).values
+        
+        measures = ['conflict_count', 'risk_sum', 'observations', 'individuals']
+        selected = cube[mask]
+        if group_by:
+            rolled = selected.groupby(group_by, as_index=False)[measures].sum()
+        else:
+            rolled = selected[measures].sum().to_frame().T
+        
+        rolled['avg_risk_level'] = (rolled['risk_sum'] / rolled['conflict_count'].replace(0, np.nan)).fillna(0.0)
+        rolled = rolled.drop(columns='risk_sum')
+        for column in ['month', 'year', 'shipping_lane_id', 'conflict_count']:
+            if column in rolled.columns:
+                rolled[column] = rolled[column].astype(np.int64)
+        
+        return rolled.to_dict(orient='records')
     
     def get_monthly_conflict_stats(self):
         """
         Get conflict statistics by month
         
+        A roll-up of the conflict cube over species, lanes and risk bands.
+        
         Returns:
-            Dictionary with monthly conflict counts and risk levels
+            Dictionary keyed by "month/year" with conflict counts and average risk levels
         """
         if self.migration_data is None or self.conflict_zones is None:
             raise ValueError("Migration data and conflict zones must be available")
         
-        monthly_stats = {}
+        return {
+            f"{row['month']}/{row['year']}": {
+                'conflict_count': row['conflict_count'],
+                'avg_risk_level': row['avg_risk_level'],
+                'observations': row['observations'],
+                'individuals': row['individuals']
+            }
+            for row in self.query_conflict_cube(group_by=('month', 'year'))
+        }
+    
+    def _get_route_cost_grid(self, buffer_distance):
+        """
+        Routing cost grid for the current clusters and conflicts, cached per data revision
         
-        # Check if we have month/year columns
-        if 'month' in self.migration_data.columns and 'year' in self.migration_data.columns:
-            # Group conflicts by month
-            for conflict in self.conflict_zones:
-                cluster_id = conflict['cluster_id']
-                cluster_data = self.migration_data[self.migration_data['cluster'] == cluster_id]
-                
-                # Get unique month/year combinations
-                for _, row in cluster_data.drop_duplicates(['month', 'year']).iterrows():
-                    month_key = f"{int(row['month'])}/{int(row['year'])}"
-                    
-                    if month_key not in monthly_stats:
-                        monthly_stats[month_key] = {
-                            'conflict_count': 0,
-                            'avg_risk_level': 0,
-                            'conflicts': []
-                        }
-                    
-                    monthly_stats[month_key]['conflict_count'] += 1
-                    monthly_stats[month_key]['conflicts'].append(conflict)
-            
-            # Calculate average risk level
-            for month_key in monthly_stats:
-                conflicts = monthly_stats[month_key]['conflicts']
-                monthly_stats[month_key]['avg_risk_level'] = sum(c['risk_level'] for c in conflicts) / len(conflicts)
+        Args:
+            buffer_distance: Radius (km) of the conflict buffers and of the density smoothing
+        """
+        key = (self.data_revision, buffer_distance)
+        if self._route_cost_grid is None or self._route_cost_grid[0] != key:
+            clustered = self.migration_data[self.migration_data['cluster'] >= 0]
+            conflicts = self.conflict_zones or []
+            grid = CostGrid(
+                clustered['latitude'].values,
+                clustered['longitude'].values,
+                self._sample_weight(clustered),
+                [c['cluster_center']['latitude'] for c in conflicts],
+                [c['cluster_center']['longitude'] for c in conflicts],
+                buffer_distance,
+                resolution=self.ROUTE_GRID_RESOLUTION_DEG,
+                density_weight=self.ROUTE_DENSITY_WEIGHT,
+                avoid_weight=self.ROUTE_CONFLICT_WEIGHT
+            )
+            self._route_cost_grid = (key, grid)
+        return self._route_cost_grid[1]
+    
+    def _conflict_segments(self, lane_id, conflict_lats, conflict_lons, buffer_distance):
+        """
+        Segments of a lane passing within buffer_distance of each conflict
+        
+        Returns:
+            Tuple (conflict_idx, part, local_segment): the conflict, the lane
+            part (global part index) and the segment's position within that part
+        """
+        store = self.lane_store
+        conflict_idx, segments = store.index.candidate_segments(conflict_lats, conflict_lons, buffer_distance)
+        own = store.segment_lane[segments] == lane_id
+        conflict_idx, segments = conflict_idx[own], segments[own]
         
-        return monthly_stats
+        distances = point_to_segment_distance_km(
+            conflict_lats[conflict_idx], conflict_lons[conflict_idx],
+            store.starts[segments, 0], store.starts[segments, 1], store.ends[segments, 0], store.ends[segments, 1]
+        )
+        hit = distances < buffer_distance
+        conflict_idx, segments = conflict_idx[hit], segments[hit]
+        
+        vertex = store.segment_vertex[segments]
+        part = np.searchsorted(store.part_offsets, vertex, side='right') - 1
+        return conflict_idx, part, vertex - store.part_offsets[part]
     
-    def suggest_route_modifications(self, lane_id, buffer_distance=20):
+    def _conflicting_stretches(self, part, segments, approach_km):
         """
-        Suggest modifications to a shipping lane to reduce conflicts
+        Vertex ranges of a lane part around the given conflicting segments
+        
+        Each range is widened along the part by approach_km on both sides, so
+        the detour has room to leave and rejoin the lane, and overlapping
+        ranges are merged.
+        
+        Returns:
+            List of (first, last) vertex indices, inclusive
+        """
+        segments = np.unique(segments)
+        along = np.r_[0.0, np.cumsum(haversine_km(part[:-1, 0], part[:-1, 1], part[1:, 0], part[1:, 1]))]
+        firsts = np.maximum(np.searchsorted(along, along[segments] - approach_km, side='right') - 1, 0)
+        lasts = np.minimum(np.searchsorted(along, along[segments + 1] + approach_km, side='left'), len(part) - 1)
+        
+        stretches = []
+        for first, last in zip(firsts, lasts):
+            if stretches and first <= stretches[-1][1]:
+                stretches[-1][1] = max(stretches[-1][1], last)
+            else:
+                stretches.append([first, last])
+        return [(int(first), int(last)) for first, last in stretches]
+    
+    def _route_plan(self, lane_id, buffer_distance):
+        """
+        Validate a lane and find the stretches of it to reroute
         
         Args:
-            lane_id: ID of the shipping lane to modify
+            lane_id: ID of the shipping lane
             buffer_distance: Buffer distance (km) to avoid migration clusters
             
         Returns:
-            Dictionary with original and suggested routes
+            Dictionary with the lane and its conflicts, and either a 'message'
+            when nothing needs rerouting, or the lane 'parts', the 'stretches'
+            to reroute as (part, first, last) and the conflicting segments
         """
         if self.shipping_lanes is None or self.conflict_zones is None:
             raise ValueError("Shipping lanes and conflict zones must be available")
@@ -321,83 +1421,190 @@ class ConflictDetectionService:
             raise ValueError(f"Invalid lane ID: {lane_id}")
         
         lane = self.shipping_lanes[lane_id]
-        lane_coords = lane.get('coordinates', [])
+        plan = {'lane_id': lane_id, 'lane': lane}
         
-        if not lane_coords:
+        if not self.lane_store.has_vertices(lane_id):
             raise ValueError(f"No coordinates for lane ID: {lane_id}")
         
         # Get conflicts for this lane
         lane_conflicts = [c for c in self.conflict_zones if c['shipping_lane_id'] == lane_id]
         
         if not lane_conflicts:
-            return {
-                'lane_id': lane_id,
-                'lane_name': lane.get('name', f"Lane {lane_id}"),
-                'original_route': lane_coords,
-                'suggested_route': lane_coords,
-                'message': "No conflicts detected for this lane"
-            }
+            plan['message'] = "No conflicts detected for this lane"
+            return plan
         
-        # Create a LineString for the original route
-        original_line = LineString([(p[1], p[0]) for p in lane_coords])  # lon, lat
+        conflict_lats = np.array([c['cluster_center']['latitude'] for c in lane_conflicts])
+        conflict_lons = np.array([c['cluster_center']['longitude'] for c in lane_conflicts])
+        plan['conflict_lats'] = conflict_lats
+        plan['conflict_lons'] = conflict_lons
         
-        # Create points for conflict zones
-        conflict_points = [Point(c['cluster_center']['longitude'], c['cluster_center']['latitude']) for c in lane_conflicts]
+        # If the original route stays outside the buffer of every conflict, no modification needed
+        conflict_idx, hit_parts, hit_segments = self._conflict_segments(
+            lane_id, conflict_lats, conflict_lons, buffer_distance
+        )
+        if len(conflict_idx) == 0:
+            plan['message'] = "Lane already avoids conflict zones"
+            return plan
         
-        # Create a buffer around conflict points
-        buffer_zones = [p.buffer(buffer_distance / 111.32) for p in conflict_points]  # rough conversion to degrees
+        # Leave room for the detour to turn off and back onto the lane
+        approach_km = 2 * buffer_distance + 2 * self.ROUTE_GRID_RESOLUTION_DEG * KM_PER_DEGREE
         
-        # If the original route doesn't intersect with any buffer, no modification needed
-        if not any(original_line.intersects(b) for b in buffer_zones):
-            return {
-                'lane_id': lane_id,
-                'lane_name': lane.get('name', f"Lane {lane_id}"),
-                'original_route': lane_coords,
-                'suggested_route': lane_coords,
-                'message': "Lane already avoids conflict zones"
-            }
+        parts = self.lane_store.split_parts(lane_id, self.lane_store.lane_vertices(lane_id))
+        first_part = self.lane_store.lane_part_offsets[lane_id]
+        stretches = []
+        for offset, part in enumerate(parts):
+            on_part = hit_parts == first_part + offset
+            if on_part.any() and len(part) > 1:
+                stretches.extend(
+                    (offset, first, last)
+                    for first, last in self._conflicting_stretches(part, hit_segments[on_part], approach_km)
+                )
         
-        # Simple approach: For each conflict, find the nearest point on the route and move it away
-        suggested_route = lane_coords.copy()
+        plan.update({
+            'parts': parts,
+            'stretches': stretches,
+            'conflict_idx': conflict_idx,
+            'hit_parts': hit_parts - first_part,
+            'hit_segments': hit_segments
+        })
+        return plan
+    
+    def _route_plan_stretches(self, plan):
+        """Vertex arrays of the stretches a plan reroutes"""
+        return [plan['parts'][part][first:last + 1] for part, first, last in plan['stretches']]
+    
+    def _route_suggestion(self, plan, detours, buffer_distance):
+        """
+        Suggestion for a planned lane, splicing in the detours of its stretches
         
-        for i, conflict in enumerate(lane_conflicts):
-            # Find nearest point on the route
-            conflict_point = Point(conflict['cluster_center']['longitude'], conflict['cluster_center']['latitude'])
-            nearest_idx = None
-            min_dist = float('inf')
-            
-            for j in range(len(suggested_route)):
-                point = Point(suggested_route[j][1], suggested_route[j][0])
-                dist = conflict_point.distance(point)
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest_idx = j
+        Args:
+            plan: Result of _route_plan
+            detours: Detour (or None where none was found) per planned stretch
+            buffer_distance: Buffer distance (km) the plan was made with
             
-            if nearest_idx is not None:
-                # Calculate vector from conflict to route point
-                dx = suggested_route[nearest_idx][1] - conflict['cluster_center']['longitude']
-                dy = suggested_route[nearest_idx][0] - conflict['cluster_center']['latitude']
-                
-                # Normalize and extend by buffer distance
-                mag = (dx**2 + dy**2)**0.5
-                if mag > 0:
-                    dx = dx / mag * buffer_distance / 111.32
-                    dy = dy / mag * buffer_distance / 111.32
-                    
-                    # Move the point further away
-                    suggested_route[nearest_idx] = [
-                        suggested_route[nearest_idx][0] + dy,
-                        suggested_route[nearest_idx][1] + dx
-                    ]
-        
-        return {
+        Returns:
+            Dictionary with original and suggested routes
+        """
+        lane_id, lane = plan['lane_id'], plan['lane']
+        lane_coords = lane.get('coordinates', [])
+        result = {
             'lane_id': lane_id,
             'lane_name': lane.get('name', f"Lane {lane_id}"),
-            'original_route': lane_coords,
-            'suggested_route': suggested_route,
-            'message': f"Modified route to avoid {len(lane_conflicts)} conflict zones",
-            'conflicts_avoided': len(lane_conflicts)
+            'original_route': lane_coords
         }
+        if 'message' in plan:
+            result['suggested_route'] = lane_coords
+            result['message'] = plan['message']
+            return result
+        
+        conflict_idx, hit_parts, hit_segments = plan['conflict_idx'], plan['hit_parts'], plan['hit_segments']
+        resolved = np.zeros(len(conflict_idx), dtype=bool)
+        
+        # Splice each part's detours in place of the stretches they replace
+        pieces = [[] for _ in plan['parts']]
+        positions = [0] * len(plan['parts'])
+        rerouted = []
+        for (part, first, last), detour in zip(plan['stretches'], detours):
+            if detour is None:
+                continue
+            pieces[part].extend([plan['parts'][part][positions[part]:first], detour])
+            positions[part] = last + 1
+            rerouted.append(detour)
+            resolved |= (hit_parts == part) & (hit_segments >= first) & (hit_segments < last)
+        suggested_parts = [
+            np.concatenate(part_pieces + [part[position:]]).tolist()
+            for part, part_pieces, position in zip(plan['parts'], pieces, positions)
+        ]
+        
+        # A conflict is avoided once every stretch near it is rerouted and no detour comes near it
+        conflict_lats, conflict_lons = plan['conflict_lats'], plan['conflict_lons']
+        avoided_mask = np.ones(len(conflict_lats), dtype=bool)
+        avoided_mask[conflict_idx[~resolved]] = False
+        if rerouted:
+            avoided_mask &= points_to_polylines_distance_km(conflict_lats, conflict_lons, rerouted).min(axis=1) >= buffer_distance
+        avoided = int(avoided_mask.sum())
+        
+        result.update({
+            'suggested_route': suggested_parts[0],
+            'message': f"Rerouted {len(rerouted)} stretches to avoid {avoided} of {len(conflict_lats)} conflict zones",
+            'conflicts_avoided': avoided,
+            'rerouted_stretches': len(rerouted)
+        })
+        
+        # MultiLineString lanes also report every part
+        if len(suggested_parts) > 1:
+            result['original_parts'] = lane_parts(lane)
+            result['suggested_parts'] = suggested_parts
+        
+        return result
+    
+    def suggest_route_modifications(self, lane_id, buffer_distance=20):
+        """
+        Suggest modifications to a shipping lane to reduce conflicts
+        
+        Every stretch of the lane passing within buffer_distance of one of its
+        conflicts is replaced by an A* detour over a cost grid that penalises
+        cluster density, conflict buffers (of all lanes) and distance from
+        the original lane. The rest of the lane is kept as is.
+        
+        Args:
+            lane_id: ID of the shipping lane to modify
+            buffer_distance: Buffer distance (km) to avoid migration clusters
+            
+        Returns:
+            Dictionary with original and suggested routes
+        """
+        plan = self._route_plan(lane_id, buffer_distance)
+        if 'message' in plan:
+            return self._route_suggestion(plan, [], buffer_distance)
+        
+        grid = self._get_route_cost_grid(buffer_distance)
+        max_deviation = max(self.ROUTE_MAX_DEVIATION_KM, 4 * buffer_distance)
+        detours = [
+            plan_detour(grid, stretch, max_deviation, self.ROUTE_DEVIATION_WEIGHT)
+            for stretch in self._route_plan_stretches(plan)
+        ]
+        return self._route_suggestion(plan, detours, buffer_distance)
+    
+    def iter_route_suggestions(self, lane_ids=None, buffer_distance=20, max_workers=None):
+        """
+        Route suggestions for many lanes, yielded as each lane finishes
+        
+        Every lane is validated and planned up front, and the cost grid is
+        built once; the detours of each lane are then searched on a process
+        pool. Lanes that need no rerouting come first.
+        
+        Args:
+            lane_ids: IDs of the lanes to modify (default: every lane with conflicts)
+            buffer_distance: Buffer distance (km) to avoid migration clusters
+            max_workers: Process pool size (default: all cores); 1 plans in-process
+            
+        Yields:
+            Dictionary per lane, as from suggest_route_modifications
+        """
+        if self.shipping_lanes is None or self.conflict_zones is None:
+            raise ValueError("Shipping lanes and conflict zones must be available")
+        
+        if lane_ids is None:
+            lane_ids = sorted({c['shipping_lane_id'] for c in self.conflict_zones})
+        plans = {lane_id: self._route_plan(lane_id, buffer_distance) for lane_id in dict.fromkeys(lane_ids)}
+        
+        tasks = []
+        for lane_id, plan in plans.items():
+            if 'message' in plan:
+                yield self._route_suggestion(plan, [], buffer_distance)
+            else:
+                tasks.append((lane_id, self._route_plan_stretches(plan)))
+        
+        if not tasks:
+            return
+        
+        grid = self._get_route_cost_grid(buffer_distance)
+        max_deviation = max(self.ROUTE_MAX_DEVIATION_KM, 4 * buffer_distance)
+        for lane_id, detours in iter_lane_detours(
+            grid, tasks, max_deviation, self.ROUTE_DEVIATION_WEIGHT, max_workers=max_workers
+        ):
+            yield self._route_suggestion(plans[lane_id], detours, buffer_distance)
     
     def get_conflict_summary(self):
         """
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+
+from utils.clustering import (
+    NeighbourGraph, dbscan_structure, haversine_dbscan, partitioned_dbscan, update_dbscan_labels
+)
+from utils.geodesy import EARTH_RADIUS_KM
+
+EPS = 50
+MIN_SAMPLES = 5
+
+
+def _sightings(seed, n_blobs=6, per_blob=80, n_noise=60):
+    """Gaussian blobs of sightings plus scattered noise, some of them across the antimeridian"""
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(-60, 60, n_blobs), rng.uniform(-180, 180, n_blobs)])
+    centers[0, 1] = 179.8
+    lats = [rng.normal(lat, 0.4, per_blob) for lat, _ in centers]
+    lons = [rng.normal(lon, 0.6, per_blob) for _, lon in centers]
+    lats.append(rng.uniform(-60, 60, n_noise))
+    lons.append(rng.uniform(-180, 180, n_noise))
+    order = rng.permutation(n_blobs * per_blob + n_noise)
+    lons = (np.concatenate(lons)[order] + 180) % 360 - 180
+    return np.concatenate(lats)[order], lons
+
+
+def _same_partition(a, b, mask=None):
+    """Whether two labellings split the (masked) points into the same clusters, up to renaming"""
+    if mask is not None:
+        a, b = a[mask], b[mask]
+    if not np.array_equal(a == -1, b == -1):
+        return False
+    pairs = set(zip(a.tolist(), b.tolist()))
+    return len(pairs) == len(set(a.tolist())) == len(set(b.tolist()))
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_haversine_dbscan_matches_sklearn(seed, weighted):
+    lats, lons = _sightings(seed)
+    weights = np.random.default_rng(seed).integers(1, 3, len(lats)) if weighted else None
+    labels = haversine_dbscan(lats, lons, eps=EPS, min_samples=MIN_SAMPLES, chunk_size=97, sample_weight=weights)
+
+    reference = DBSCAN(eps=EPS / EARTH_RADIUS_KM, min_samples=MIN_SAMPLES, metric='haversine', algorithm='ball_tree')
+    expected = reference.fit(np.radians(np.column_stack([lats, lons])), sample_weight=weights).labels_
+    core = np.zeros(len(lats), dtype=bool)
+    core[reference.core_sample_indices_] = True
+
+    # Border points reachable from two clusters may go to either, so only cores must match exactly
+    np.testing.assert_array_equal(labels == -1, expected == -1)
+    assert _same_partition(labels, expected, core)
+    np.testing.assert_array_equal(dbscan_structure(lats, lons, EPS, MIN_SAMPLES, sample_weight=weights)['is_core'], core)
+
+
+def test_haversine_dbscan_handles_empty_input():
+    assert len(haversine_dbscan([], [], eps=EPS, min_samples=MIN_SAMPLES)) == 0
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_update_dbscan_labels_matches_full_clustering(seed):
+    lats, lons = _sightings(seed)
+    n_old = len(lats) * 2 // 3
+    old = haversine_dbscan(lats[:n_old], lons[:n_old], eps=EPS, min_samples=MIN_SAMPLES)
+
+    labels = np.r_[old, np.full(len(lats) - n_old, -1)]
+    new_idx = np.arange(n_old, len(lats))
+    updated, changed = update_dbscan_labels(lats, lons, labels, new_idx, eps=EPS, min_samples=MIN_SAMPLES)
+
+    # Borders go to their nearest core in both, so the whole partition matches
+    assert _same_partition(updated, haversine_dbscan(lats, lons, eps=EPS, min_samples=MIN_SAMPLES))
+
+    # Old points only change id when their cluster is reported as changed
+    moved = (old >= 0) & (updated[:n_old] != old)
+    assert set(old[moved].tolist()) <= changed
+    assert set(updated[new_idx][updated[new_idx] >= 0].tolist()) <= changed
+
+
+def test_update_dbscan_labels_keeps_the_smallest_id_on_merge():
+    rng = np.random.default_rng(4)
+    lats = np.r_[rng.normal(45, 0.05, 20), rng.normal(45, 0.05, 20), rng.normal(55, 0.05, 20)]
+    lons = np.r_[rng.normal(-30, 0.05, 20), rng.normal(-27, 0.05, 20), rng.normal(-50, 0.05, 20)]
+    labels = haversine_dbscan(lats, lons, eps=EPS, min_samples=MIN_SAMPLES)
+    west, east, far = labels[0], labels[20], labels[40]
+
+    bridge = np.repeat(np.linspace(-29.8, -27.2, 14), MIN_SAMPLES)
+    all_lats = np.r_[lats, np.full(len(bridge), 45.0)]
+    all_lons = np.r_[lons, bridge]
+    new_idx = np.arange(len(lats), len(all_lats))
+    updated, changed = update_dbscan_labels(
+        all_lats, all_lons, np.r_[labels, np.full(len(bridge), -1)], new_idx, eps=EPS, min_samples=MIN_SAMPLES
+    )
+
+    assert set(updated[:40].tolist()) == set(updated[new_idx].tolist()) == {min(west, east)}
+    assert set(updated[40:60].tolist()) == {far}
+    assert far not in changed
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_partitioned_dbscan_clusters_each_partition_on_its_own(max_workers):
+    lats, lons = _sightings(5)
+    partitions = np.random.default_rng(5).choice(['Blue Whale', 'Humpback', 'Orca'], len(lats))
+    labels = partitioned_dbscan(lats, lons, partitions, eps=EPS, min_samples=MIN_SAMPLES, max_workers=max_workers)
+
+    seen = set()
+    for key in np.unique(partitions):
+        member = partitions == key
+        expected = haversine_dbscan(lats[member], lons[member], eps=EPS, min_samples=MIN_SAMPLES)
+        assert _same_partition(labels[member], expected)
+
+        # Ids never repeat across partitions
+        ids = set(labels[member][labels[member] >= 0].tolist())
+        assert not ids & seen
+        seen |= ids
+
+    np.testing.assert_array_equal(
+        labels, partitioned_dbscan(lats, lons, partitions, eps=EPS, min_samples=MIN_SAMPLES, max_workers=1)
+    )
+
+
+def test_neighbour_graph_sweep_matches_haversine_dbscan():
+    lats, lons = _sightings(6)
+    weights = np.random.default_rng(6).integers(1, 3, len(lats))
+    for sample_weight in (None, weights):
+        graph = NeighbourGraph(lats, lons, radius_km=75, chunk_size=101, sample_weight=sample_weight)
+        for eps in (20, 50, 75):
+            for min_samples in (3, 5, 10):
+                expected = haversine_dbscan(lats, lons, eps=eps, min_samples=min_samples, sample_weight=sample_weight)
+                np.testing.assert_array_equal(graph.dbscan(eps, min_samples), expected)
+
+    with pytest.raises(ValueError):
+        graph.dbscan(100, MIN_SAMPLES)
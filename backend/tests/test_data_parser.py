@@ -0,0 +1,108 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_parser import DataParser
+from utils.geojson_stream import parse_geojson_lane_arrays
+from utils.lane_store import LaneStore
+
+
+def _write_csv(path, rows):
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def test_csv_batches_keep_types_across_blocks(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 2000
+    rows = {
+        'Species': rng.choice(['Blue Whale', 'Humpback'], n),
+        'Lat': rng.uniform(-60, 60, n).round(4),
+        'Lng': rng.uniform(-170, 170, n).round(4),
+        'month': rng.integers(1, 13, n).astype(object),
+        'year': np.full(n, 2023),
+        'count': rng.integers(1, 9, n),
+        'depth': np.full(n, '12').astype(object)
+    }
+    # Values a type guessed from the first block would reject
+    rows['month'][n - 3] = 'Jan'
+    rows['depth'][n - 2] = 'shallow'
+    rows['Lat'][n - 1] = 95.0
+    path = _write_csv(tmp_path / "migrations.csv", rows)
+
+    batches = list(DataParser(tmp_path).iter_csv_migration_batches(path, block_size=4096))
+    assert len(batches) > 1
+    df = pd.concat(batches, ignore_index=True)
+
+    # The out-of-range latitude is dropped and 'Jan' cleared, nothing else is lost
+    assert len(df) == n - 1
+    assert {'species', 'latitude', 'longitude', 'month', 'year', 'count'} <= set(df.columns)
+    np.testing.assert_allclose(df['latitude'], rows['Lat'][:-1])
+    np.testing.assert_allclose(df['longitude'], rows['Lng'][:-1])
+    assert str(df['month'].dtype) == 'Int64' and df['month'].isna().sum() == 1
+    assert (df['year'] == 2023).all()
+    assert df['depth'].iloc[n - 2] == 'shallow'
+
+
+def test_csv_batches_of_an_empty_file(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text("latitude,longitude,species\n")
+    batches = list(DataParser(tmp_path).iter_csv_migration_batches(path))
+    assert len(batches) == 1 and batches[0].empty
+    assert {'latitude', 'longitude', 'species'} <= set(batches[0].columns)
+
+
+def test_csv_parse_without_timestamp_builds_one_from_month_and_year(tmp_path):
+    path = _write_csv(tmp_path / "fish_migrations.csv", {
+        'species': ['Orca', 'Orca'], 'latitude': [10.0, 11.0], 'longitude': [20.0, 21.0],
+        'month': [3, 4], 'year': [2022, 2022]
+    })
+    df = DataParser(tmp_path).parse_fish_migration_data()
+    assert df['timestamp'].tolist() == [pd.Timestamp('2022-03-01'), pd.Timestamp('2022-04-01')]
+
+
+def _feature(geometry, **properties):
+    return {'type': 'Feature', 'geometry': geometry, 'properties': properties}
+
+
+def test_geojson_lanes_stream_into_arrays(tmp_path):
+    features = [
+        _feature({'type': 'LineString', 'coordinates': [[-70.5, 40.25], [-69.0, 41.0, 12.0], [-68.0, 41.5]]},
+                 name="Boston approach", traffic_volume=120),
+        _feature({'type': 'Point', 'coordinates': [0.0, 0.0]}, name="Buoy"),
+        _feature({'type': 'MultiLineString', 'coordinates': [[[10.0, 50.0], [11.0, 51.0]], [], [[12.0, 52.0]]]},
+                 id="dover", route_name="Dover strait"),
+        _feature(None, name="No geometry"),
+        _feature({'type': 'LineString', 'coordinates': []}, name="Empty")
+    ]
+    path = tmp_path / "shipping_lanes.geojson"
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+
+    parser = DataParser(tmp_path)
+    lanes = parser.parse_shipping_lanes(path, format_type="auto")
+    assert [dict(lane) for lane in lanes] == [
+        {'id': 0, 'name': "Boston approach", 'traffic_volume': 120,
+         'coordinates': [[40.25, -70.5], [41.0, -69.0], [41.5, -68.0]]},
+        {'id': "dover", 'name': "Dover strait",
+         'coordinates': [[50.0, 10.0], [51.0, 11.0]], 'parts': [[[50.0, 10.0], [51.0, 11.0]], [[52.0, 12.0]]]}
+    ]
+
+    # Small reads split values across chunk boundaries without changing the result
+    arrays = parse_geojson_lane_arrays(path, metadata_keys=('traffic_volume',), chunk_size=7)
+    assert [dict(lane) for lane in arrays.lanes()] == [dict(lane) for lane in lanes]
+
+    # The store over the parsed buffer matches one compiled from the lane dicts
+    store, reference = arrays.lane_store(), LaneStore([dict(lane) for lane in lanes])
+    np.testing.assert_array_equal(store.coords, reference.coords)
+    np.testing.assert_array_equal(store.part_offsets, reference.part_offsets)
+    np.testing.assert_array_equal(store.lane_part_offsets, reference.lane_part_offsets)
+    assert store.names == reference.names
+
+
+def test_geojson_lanes_without_features_are_rejected(tmp_path):
+    path = tmp_path / "lanes.geojson"
+    path.write_text('{"type": "FeatureCollection"}')
+    with pytest.raises(ValueError, match='features'):
+        DataParser(tmp_path).parse_shipping_lanes(path, format_type="geojson")
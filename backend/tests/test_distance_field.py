@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from utils.distance_field import LaneDistanceField
+from utils.geodesy import points_to_polylines_distance_km
+from utils.lane_store import LaneStore
+
+MAX_DISTANCE_KM = 100
+
+
+def _lanes(seed):
+    """Random mid-latitude lanes plus a polar lane and lanes on and across the antimeridian"""
+    rng = np.random.default_rng(seed)
+    polylines = []
+    for _ in range(6):
+        start = np.array([rng.uniform(-60, 60), rng.uniform(-170, 170)])
+        steps = rng.normal(0, 1.5, (rng.integers(2, 6), 2))
+        polylines.append((start + np.cumsum(steps, axis=0)).tolist())
+    polylines.append([[85.0, -120.0], [88.5, -30.0], [87.0, 60.0], [84.0, 150.0]])
+    polylines.append([[20.0, 178.5], [21.0, 179.8], [22.0, -179.0], [23.0, -177.5]])
+    polylines.append([[-40.0, -179.5], [-38.0, -179.5]])
+    return [{'name': f"Lane {i}", 'coordinates': line} for i, line in enumerate(polylines)]
+
+
+def _points_near(lanes, seed, n=3000):
+    """Points scattered within about two degrees of the lane vertices, wrapped into [-180, 180)"""
+    rng = np.random.default_rng(seed)
+    vertices = np.concatenate([np.asarray(lane['coordinates']) for lane in lanes])
+    picks = vertices[rng.integers(len(vertices), size=n)]
+    lats = np.clip(picks[:, 0] + rng.uniform(-2, 2, n), -90, 90)
+    lons = (picks[:, 1] + rng.uniform(-2.5, 2.5, n) + 180) % 360 - 180
+    return lats, lons
+
+
+@pytest.fixture(scope='module', params=[0, 1])
+def case(request):
+    lanes = _lanes(request.param)
+    store = LaneStore(lanes)
+    field = LaneDistanceField(store, resolution=0.1, max_distance_km=MAX_DISTANCE_KM)
+    lats, lons = _points_near(lanes, request.param + 10)
+    brute = points_to_polylines_distance_km(lats, lons, [lane['coordinates'] for lane in lanes])
+    return store, field, lats, lons, brute
+
+
+def test_lookup_stays_within_error_bound(case):
+    _, field, lats, lons, brute = case
+    approx, _ = field.lookup(lats, lons)
+    truth = np.minimum(brute.min(axis=1), MAX_DISTANCE_KM)
+    assert np.abs(approx - truth).max() <= field.error_bound_km + 1e-6
+
+
+@pytest.mark.parametrize('threshold', [5, 30, 80])
+def test_within_matches_lanes_within(case, threshold):
+    store, field, lats, lons, brute = case
+    expected = np.zeros(len(lats), dtype=bool)
+    point_idx, _, _ = store.lanes_within(lats, lons, threshold)
+    expected[point_idx] = True
+
+    np.testing.assert_array_equal(field.within(lats, lons, threshold), expected)
+    np.testing.assert_array_equal(expected, brute.min(axis=1) <= threshold)
+    assert not (expected & ~field.may_be_within(lats, lons, threshold)).any()
+
+
+def test_nearest_is_exact_within_radius(case):
+    _, field, lats, lons, brute = case
+    distance, lane_id, exact = field.nearest(lats, lons, exact_within=50)
+    close = brute.min(axis=1) <= 50
+
+    assert exact[close].all()
+    np.testing.assert_allclose(distance[close], brute.min(axis=1)[close], atol=1e-6)
+    np.testing.assert_array_equal(lane_id[close], brute.argmin(axis=1)[close])
+
+
+def test_lane_across_the_antimeridian_is_found_from_the_other_side():
+    store = LaneStore([{'name': "Dateline", 'coordinates': [[10.0, -179.5], [12.0, -179.5]]}])
+    field = LaneDistanceField(store, resolution=0.1, max_distance_km=MAX_DISTANCE_KM)
+    expected = points_to_polylines_distance_km([11.0], [179.95], [[[10.0, -179.5], [12.0, -179.5]]])[0, 0]
+
+    assert field.may_be_within([11.0], [179.95], 80)[0]
+    assert field.within([11.0], [179.95], 80)[0]
+    distance, lane_id, exact = field.nearest([11.0], [179.95], exact_within=80)
+    assert exact[0] and lane_id[0] == 0
+    assert distance[0] == pytest.approx(expected)
+
+    approx, lane = field.lookup([11.0], [179.95])
+    assert abs(approx[0] - expected) <= field.error_bound_km and lane[0] == 0
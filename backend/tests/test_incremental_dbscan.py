@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from utils.clustering import dbscan_structure, haversine_dbscan
+from utils.geodesy import haversine_km
+from utils.incremental_dbscan import IncrementalDBSCAN
+
+EPS = 50
+MIN_SAMPLES = 5
+
+
+def _sightings(seed, n_blobs=6, per_blob=80, n_noise=40):
+    """Gaussian blobs of sightings around the North Atlantic plus scattered noise"""
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(30, 60, n_blobs), rng.uniform(-60, -10, n_blobs)])
+    lats = [rng.normal(lat, 0.4, per_blob) for lat, _ in centers]
+    lons = [rng.normal(lon, 0.6, per_blob) for _, lon in centers]
+    lats.append(rng.uniform(30, 60, n_noise))
+    lons.append(rng.uniform(-60, -10, n_noise))
+    order = rng.permutation(n_blobs * per_blob + n_noise)
+    return np.concatenate(lats)[order], np.concatenate(lons)[order]
+
+
+def _assert_matches_batch(lats, lons, labels):
+    """Same noise and core partition as a batch DBSCAN; borders join a cluster of a core within eps"""
+    expected = haversine_dbscan(lats, lons, eps=EPS, min_samples=MIN_SAMPLES)
+    core = dbscan_structure(lats, lons, EPS, MIN_SAMPLES)['is_core']
+
+    np.testing.assert_array_equal(labels == -1, expected == -1)
+
+    # Core points must be split into the same clusters, up to renaming
+    pairs = set(zip(labels[core].tolist(), expected[core].tolist()))
+    assert len(pairs) == len(set(labels[core].tolist())) == len(set(expected[core].tolist()))
+
+    # A border point within eps of two clusters may join either of them
+    for i in np.flatnonzero(~core & (labels >= 0)):
+        near = core & (haversine_km(lats[i], lons[i], lats, lons) <= EPS)
+        assert labels[i] in set(labels[near].tolist())
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fit_then_insert_matches_batch_dbscan(seed):
+    lats, lons = _sightings(seed)
+    seeded = len(lats) // 2
+    engine = IncrementalDBSCAN(EPS, MIN_SAMPLES).fit(lats[:seeded], lons[:seeded])
+
+    for batch in np.array_split(np.arange(seeded, len(lats)), 4):
+        before = engine.labels()
+        _, changed = engine.insert(lats[batch], lons[batch])
+        after = engine.labels()
+
+        # Points already clustered keep their id unless their cluster changed
+        clustered = before >= 0
+        moved = clustered & (after[:len(before)] != before)
+        assert set(before[moved].tolist()) <= changed
+        assert not (clustered & (after[:len(before)] == -1)).any()
+
+        _assert_matches_batch(lats[:len(after)], lons[:len(after)], after)
+
+
+def test_merge_keeps_the_older_cluster_id():
+    rng = np.random.default_rng(7)
+    west = (rng.normal(45, 0.05, 20), rng.normal(-30, 0.05, 20))
+    east = (rng.normal(45, 0.05, 20), rng.normal(-27, 0.05, 20))
+    far = (rng.normal(55, 0.05, 20), rng.normal(-50, 0.05, 20))
+    lats = np.concatenate([west[0], east[0], far[0]])
+    lons = np.concatenate([west[1], east[1], far[1]])
+
+    engine = IncrementalDBSCAN(EPS, MIN_SAMPLES).fit(lats, lons)
+    labels = engine.labels()
+    west_id, east_id, far_id = labels[0], labels[20], labels[40]
+    assert len({west_id, east_id, far_id}) == 3
+
+    # A dense chain of sightings between the two nearby clusters joins them
+    bridge_lons = np.repeat(np.linspace(-29.8, -27.2, 14), MIN_SAMPLES)
+    _, changed = engine.insert(np.full(len(bridge_lons), 45.0), bridge_lons)
+    merged = engine.labels()
+
+    survivor = min(west_id, east_id)
+    assert set(merged[:40].tolist()) == {survivor}
+    assert set(merged[60:].tolist()) == {survivor}
+    assert set(merged[40:60].tolist()) == {far_id}
+    assert max(west_id, east_id) in changed
+    assert far_id not in changed
+
+    # New clusters get ids above every id handed out so far
+    engine.insert(np.full(MIN_SAMPLES, -40.0), np.full(MIN_SAMPLES, 100.0))
+    assert engine.labels()[-1] > max(west_id, east_id, far_id)
+
+
+def test_fit_adopts_existing_labels():
+    lats, lons = _sightings(3)
+    existing = haversine_dbscan(lats, lons, eps=EPS, min_samples=MIN_SAMPLES)
+    renamed = np.where(existing >= 0, existing + 100, -1)
+
+    engine = IncrementalDBSCAN(EPS, MIN_SAMPLES).fit(lats, lons, labels=renamed)
+    np.testing.assert_array_equal(engine.labels(), renamed)
+
+
+def test_weighted_points_count_towards_min_samples():
+    lats = np.full(2, 10.0)
+    lons = np.array([20.0, 20.01])
+    engine = IncrementalDBSCAN(EPS, MIN_SAMPLES).fit(lats[:1], lons[:1], sample_weight=[2])
+    assert engine.labels()[0] == -1
+
+    engine.insert(lats[1:], lons[1:], sample_weight=[3])
+    labels = engine.labels()
+    assert labels[0] == labels[1] >= 0
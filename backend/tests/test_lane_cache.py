@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from utils.geojson_stream import parse_geojson_lane_arrays
+from utils.lane_cache import CachedLanes, LaneCache, write_lane_cache
+from utils.lane_store import LaneStore
+
+LANES = [
+    {'id': 0, 'name': "Boston approach", 'traffic_volume': np.int64(120),
+     'coordinates': [[40.25, -70.5], [41.0, -69.0], [41.5, -68.0]]},
+    {'id': "dover", 'name': "Dover strait",
+     'coordinates': [[50.0, 10.0], [51.0, 11.0]], 'parts': [[[50.0, 10.0], [51.0, 11.0]], [], [[52.0, 12.0]]]},
+    {'id': 2, 'coordinates': [[-40.0, -179.5], [-38.0, -179.5]]}
+]
+
+
+def _assert_same_store(store, reference):
+    np.testing.assert_array_equal(store.coords, reference.coords)
+    np.testing.assert_array_equal(store.part_offsets, reference.part_offsets)
+    np.testing.assert_array_equal(store.lane_part_offsets, reference.lane_part_offsets)
+    assert store.names == reference.names
+
+
+def test_lanes_round_trip_through_the_cache(tmp_path):
+    path = tmp_path / "lanes.lanes"
+    write_lane_cache(LANES, path)
+    cache = LaneCache(path)
+
+    # Empty parts are dropped and numpy scalars come back as plain values
+    expected = [dict(lane) for lane in LANES]
+    expected[0]['traffic_volume'] = 120
+    expected[1]['parts'] = [[[50.0, 10.0], [51.0, 11.0]], [[52.0, 12.0]]]
+    assert len(cache) == len(LANES)
+    assert [dict(lane) for lane in cache.lanes()] == expected
+    assert [lane['name'] for lane in cache.lanes()[:2]] == ["Boston approach", "Dover strait"]
+    assert 'parts' not in cache.lanes()[-1] and cache.lanes()[-1]['id'] == 2
+    with pytest.raises(IndexError):
+        cache.lanes()[len(LANES)]
+
+    _assert_same_store(cache.lane_store(), LaneStore(LANES))
+
+
+def test_cached_lanes_are_rewritten_from_their_arrays(tmp_path):
+    source = tmp_path / "shipping_lanes.geojson"
+    source.write_text(
+        '{"type": "FeatureCollection", "features": ['
+        '{"type": "Feature", "properties": {"name": "A"}, '
+        '"geometry": {"type": "LineString", "coordinates": [[1, 2], [3, 4]]}}, '
+        '{"type": "Feature", "properties": {}, '
+        '"geometry": {"type": "MultiLineString", "coordinates": [[[5, 6], [7, 8]], [[9, 10]]]}}]}'
+    )
+    lanes = parse_geojson_lane_arrays(source).lanes()
+    assert isinstance(lanes, CachedLanes)
+
+    path = tmp_path / "lanes.lanes"
+    write_lane_cache(lanes, path)
+    cache = LaneCache(path)
+    assert [dict(lane) for lane in cache.lanes()] == [dict(lane) for lane in lanes]
+
+    # A cache can be written over the very file it maps
+    write_lane_cache(cache.lanes(), path)
+    reopened = LaneCache(path)
+    assert [dict(lane) for lane in reopened.lanes()] == [dict(lane) for lane in lanes]
+    _assert_same_store(reopened.lane_store(), LaneStore([dict(lane) for lane in lanes]))
+
+
+def test_empty_lane_list_round_trips(tmp_path):
+    path = tmp_path / "lanes.lanes"
+    write_lane_cache([], path)
+    cache = LaneCache(path)
+    assert len(cache) == 0 and list(cache.lanes()) == []
+    assert cache.coords.shape == (0, 2)
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "lanes.lanes"
+    path.write_bytes(b'\x00' * 64)
+    with pytest.raises(ValueError):
+        LaneCache(path)
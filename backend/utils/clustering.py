@@ -0,0 +1,503 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import BallTree
+
+from utils.geodesy import EARTH_RADIUS_KM
+from utils.grid_clustering import grid_dbscan
+
+
+def _chunks(n, chunk_size):
+    """Yield (start, stop) bounds covering range(n) in chunk_size steps"""
+    for start in range(0, n, chunk_size):
+        yield start, min(start + chunk_size, n)
+
+
+def _radian_points(latitudes, longitudes):
+    """Stack lat/lon degrees into the (n, 2) radian layout the haversine BallTree expects"""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack([lat, lon])
+
+
+def _neighbour_pairs(tree, points, sources, radius, sort_results=False):
+    """
+    Flattened (source, neighbour) index pairs within radius of each source point
+
+    With sort_results, each source's neighbours are ordered nearest first.
+    """
+    if sort_results:
+        neighbours, _ = tree.query_radius(points[sources], r=radius, return_distance=True, sort_results=True)
+    else:
+        neighbours = tree.query_radius(points[sources], r=radius)
+
+    lengths = np.fromiter((len(nb) for nb in neighbours), dtype=np.int64, count=len(neighbours))
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.repeat(sources, lengths), np.concatenate(neighbours)
+
+
+def _neighbour_counts(tree, points, indices, radius, chunk_size, sample_weight=None):
+    """
+    eps-neighbourhood sizes (including the point itself) for the given point indices
+
+    With sample_weight, each neighbour counts with its weight instead of one.
+    """
+    if sample_weight is None:
+        counts = np.zeros(len(indices), dtype=np.int64)
+        for start, stop in _chunks(len(indices), chunk_size):
+            counts[start:stop] = tree.query_radius(points[indices[start:stop]], r=radius, count_only=True)
+        return counts
+
+    counts = np.zeros(len(indices), dtype=np.float64)
+    for start, stop in _chunks(len(indices), chunk_size):
+        neighbours = tree.query_radius(points[indices[start:stop]], r=radius)
+        # Every neighbourhood contains its own point, so no run is empty
+        lengths = np.fromiter((len(nb) for nb in neighbours), dtype=np.int64, count=len(neighbours))
+        run_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        counts[start:stop] = np.add.reduceat(sample_weight[np.concatenate(neighbours)], run_starts)
+    return counts
+
+
+def _core_mask(tree, points, indices, radius, min_samples, chunk_size, sample_weight=None):
+    """Core-point flags for the given point indices, counted against the whole tree"""
+    return _neighbour_counts(tree, points, indices, radius, chunk_size, sample_weight) >= min_samples
+
+
+def _as_weights(sample_weight, n_samples):
+    """Validated float64 weight array, or None for unweighted points"""
+    if sample_weight is None:
+        return None
+    sample_weight = np.asarray(sample_weight, dtype=np.float64)
+    if sample_weight.shape != (n_samples,):
+        raise ValueError("sample_weight must have one entry per point")
+    return sample_weight
+
+
+def _core_components(tree, points, core_idx, is_core, radius, chunk_size):
+    """
+    Connected components of core points linked within radius
+
+    Each chunk's edges are collapsed into the running component labels straight
+    away, so no more than one chunk of edges is ever held in memory.
+
+    Returns:
+        Array of component ids over all points; only entries of core points are meaningful
+    """
+    n_samples = len(points)
+    component = np.arange(n_samples)
+    for start, stop in _chunks(len(core_idx), chunk_size):
+        rows, cols = _neighbour_pairs(tree, points, core_idx[start:stop], radius)
+        keep = is_core[cols]
+        if not keep.any():
+            continue
+
+        rows = component[rows[keep]]
+        cols = component[cols[keep]]
+        graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n_samples, n_samples))
+        _, merged = connected_components(graph, directed=False)
+        component = merged[component]
+    return component
+
+
+def _nearest_core(tree, points, candidates, is_core, radius, chunk_size):
+    """
+    Nearest core neighbour of each candidate point
+
+    Returns:
+        Tuple (border_idx, core_idx) for candidates that have a core neighbour
+    """
+    borders, cores = [], []
+    for start, stop in _chunks(len(candidates), chunk_size):
+        rows, cols = _neighbour_pairs(tree, points, candidates[start:stop], radius, sort_results=True)
+        keep = is_core[cols]
+        border, first = np.unique(rows[keep], return_index=True)
+        borders.append(border)
+        cores.append(cols[keep][first])
+
+    if not borders:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(borders), np.concatenate(cores)
+
+
+def dbscan_structure(latitudes, longitudes, eps=50, min_samples=5, chunk_size=50000, sample_weight=None):
+    """
+    Core/border structure of a haversine DBSCAN, before clusters are numbered
+
+    Args:
+        latitudes: Array of latitudes in degrees
+        longitudes: Array of longitudes in degrees
+        eps: Maximum distance between neighbouring points (km)
+        min_samples: Minimum neighbourhood size (including the point) for a core point
+        chunk_size: Number of points queried against the tree at once
+        sample_weight: Optional weight of each point (e.g. thinned sightings it
+            stands for), counted towards min_samples like sklearn's DBSCAN
+
+    Returns:
+        Dict of per-point arrays: 'counts' (neighbourhood sizes), 'is_core',
+        'component' (connected component id, meaningful for core points) and
+        'anchor' (the point itself for cores, nearest core for borders, -1 for noise)
+    """
+    points = _radian_points(latitudes, longitudes)
+    n_samples = len(points)
+    sample_weight = _as_weights(sample_weight, n_samples)
+    structure = {
+        'counts': np.zeros(n_samples, dtype=np.int64 if sample_weight is None else np.float64),
+        'is_core': np.zeros(n_samples, dtype=bool),
+        'component': np.arange(n_samples),
+        'anchor': np.full(n_samples, -1, dtype=np.int64)
+    }
+
+    if n_samples == 0:
+        return structure
+
+    tree = BallTree(points, metric='haversine')
+    radius = eps / EARTH_RADIUS_KM
+
+    # Pass 1: neighbourhood sizes decide which points are core points
+    counts = _neighbour_counts(tree, points, np.arange(n_samples), radius, chunk_size, sample_weight)
+    is_core = counts >= min_samples
+
+    # Pass 2: union core points that are within eps of each other
+    core_idx = np.flatnonzero(is_core)
+    component = _core_components(tree, points, core_idx, is_core, radius, chunk_size)
+
+    # Pass 3: border points attach to their nearest core neighbour
+    anchor = np.full(n_samples, -1, dtype=np.int64)
+    anchor[core_idx] = core_idx
+    border, core = _nearest_core(tree, points, np.flatnonzero(~is_core), is_core, radius, chunk_size)
+    anchor[border] = core
+
+    structure.update(counts=counts, is_core=is_core, component=component, anchor=anchor)
+    return structure
+
+
+def haversine_dbscan(latitudes, longitudes, eps=50, min_samples=5, chunk_size=50000, sample_weight=None):
+    """
+    DBSCAN over lat/lon points using a haversine BallTree for neighbourhood queries
+
+    Produces the same core/border/noise semantics as
+    ``DBSCAN(metric='precomputed')`` on a great-circle distance matrix, but
+    never materialises that matrix. Neighbourhoods are queried chunk by chunk
+    and core points are merged with a union of connected components, so
+    memory stays proportional to n plus the neighbours of one chunk.
+
+    Args:
+        latitudes: Array of latitudes in degrees
+        longitudes: Array of longitudes in degrees
+        eps: Maximum distance between neighbouring points (km)
+        min_samples: Minimum neighbourhood size (including the point) for a core point
+        chunk_size: Number of points queried against the tree at once
+        sample_weight: Optional weight of each point, counted towards min_samples
+
+    Returns:
+        Integer array of cluster labels, -1 for noise
+    """
+    structure = dbscan_structure(latitudes, longitudes, eps, min_samples, chunk_size, sample_weight)
+    return _number_clusters(structure['component'], structure['anchor'])
+
+
+def _number_clusters(component, anchor):
+    """Labels from core components and anchors, numbered 0..k-1 in order of first appearance as sklearn does"""
+    labels = np.full(len(anchor), -1, dtype=np.int64)
+    clustered = anchor >= 0
+    labels[clustered] = component[anchor[clustered]]
+
+    if clustered.any():
+        _, first_seen, inverse = np.unique(labels[clustered], return_index=True, return_inverse=True)
+        order = np.argsort(np.argsort(first_seen))
+        labels[clustered] = order[inverse.ravel()]
+
+    return labels
+
+
+class NeighbourGraph:
+    """
+    Every point pair within a radius, sorted by distance
+
+    Built once with the haversine BallTree, the graph answers DBSCAN at any
+    eps up to its radius without touching the tree again: the pairs within
+    eps are a prefix of the sorted edge list, so each run is a bincount, a
+    connected-components pass and a first-occurrence lookup. Memory grows
+    with the number of pairs within the radius, so keep the radius to the
+    largest eps that is actually needed.
+    """
+
+    def __init__(self, latitudes, longitudes, radius_km, chunk_size=50000, sample_weight=None):
+        """
+        Args:
+            latitudes, longitudes: Point coordinates (degrees)
+            radius_km: Largest eps the graph will be queried with (km)
+            chunk_size: Number of points queried against the tree at once
+            sample_weight: Optional weight of each point, counted towards min_samples
+        """
+        points = _radian_points(latitudes, longitudes)
+        self.n_samples = len(points)
+        self.radius_km = radius_km
+        self.sample_weight = _as_weights(sample_weight, self.n_samples)
+
+        rows, cols, distances = [], [], []
+        if self.n_samples:
+            tree = BallTree(points, metric='haversine')
+            for start, stop in _chunks(self.n_samples, chunk_size):
+                neighbours, dist = tree.query_radius(
+                    points[start:stop], r=radius_km / EARTH_RADIUS_KM, return_distance=True
+                )
+                lengths = np.fromiter((len(nb) for nb in neighbours), dtype=np.int64, count=len(neighbours))
+                rows.append(np.repeat(np.arange(start, stop, dtype=np.int32), lengths))
+                cols.append(np.concatenate(neighbours).astype(np.int32))
+                distances.append(np.concatenate(dist))
+
+        # Pairs (including each point with itself) ordered by distance, in radians as the tree measures them
+        distances = np.concatenate(distances) if distances else np.empty(0)
+        order = np.argsort(distances, kind='stable')
+        self.rows = np.concatenate(rows)[order] if rows else np.empty(0, dtype=np.int32)
+        self.cols = np.concatenate(cols)[order] if cols else np.empty(0, dtype=np.int32)
+        self.distances = distances[order]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def dbscan(self, eps, min_samples):
+        """
+        DBSCAN labels at the given parameters, as ``haversine_dbscan`` would return
+
+        Args:
+            eps: Maximum distance between neighbouring points (km), at most the graph radius
+            min_samples: Minimum neighbourhood size (including the point) for a core point
+
+        Returns:
+            Integer array of cluster labels, -1 for noise
+        """
+        if eps > self.radius_km:
+            raise ValueError(f"eps {eps} exceeds the neighbour graph radius {self.radius_km}")
+
+        n = self.n_samples
+        within = np.searchsorted(self.distances, eps / EARTH_RADIUS_KM, side='right')
+        rows, cols = self.rows[:within], self.cols[:within]
+
+        weights = None if self.sample_weight is None else self.sample_weight[cols]
+        is_core = np.bincount(rows, weights=weights, minlength=n) >= min_samples
+
+        # Core points linked within eps form the clusters
+        core_edge = is_core[rows] & is_core[cols]
+        graph = coo_matrix(
+            (np.ones(int(core_edge.sum()), dtype=np.int8), (rows[core_edge], cols[core_edge])), shape=(n, n)
+        )
+        _, component = connected_components(graph, directed=False)
+
+        # Edges are sorted by distance, so the first core neighbour of a border point is its nearest
+        anchor = np.full(n, -1, dtype=np.int64)
+        anchor[is_core] = np.flatnonzero(is_core)
+        border_edge = ~is_core[rows] & is_core[cols]
+        border, first = np.unique(rows[border_edge], return_index=True)
+        anchor[border] = cols[border_edge][first]
+
+        return _number_clusters(component, anchor)
+
+
+# Exact DBSCAN on a haversine BallTree, or the linear-time grid approximation
+CLUSTER_METHODS = {'exact': haversine_dbscan, 'grid': grid_dbscan}
+
+# Meteorological seasons; December counts towards the following year's winter
+SEASONS = {12: 'winter', 1: 'winter', 2: 'winter', 3: 'spring', 4: 'spring', 5: 'spring',
+           6: 'summer', 7: 'summer', 8: 'summer', 9: 'autumn', 10: 'autumn', 11: 'autumn'}
+
+TIME_BUCKETS = ('month', 'season', 'year')
+
+
+def partition_keys(data, by_species=True, time_bucket=None):
+    """
+    Partition key of every migration record
+
+    Args:
+        data: Standardized migration DataFrame
+        by_species: Separate partitions per species
+        time_bucket: None, 'month', 'season' or 'year'; time comes from
+            'timestamp' when present, otherwise from 'month'/'year' columns
+
+    Returns:
+        Series of string keys aligned with data
+    """
+    if time_bucket is not None and time_bucket not in TIME_BUCKETS:
+        raise ValueError(f"Unsupported time bucket: {time_bucket}")
+
+    keys = pd.Series("all", index=data.index)
+    if by_species and 'species' in data.columns:
+        keys = data['species'].astype(str)
+
+    if time_bucket is None:
+        return keys
+
+    if 'timestamp' in data.columns:
+        timestamps = pd.to_datetime(data['timestamp'], errors='coerce')
+        months, years = timestamps.dt.month, timestamps.dt.year
+    elif 'month' in data.columns and 'year' in data.columns:
+        months = pd.to_numeric(data['month'], errors='coerce')
+        years = pd.to_numeric(data['year'], errors='coerce')
+    else:
+        return keys + "|unknown"
+
+    known = months.notna() & years.notna()
+    months = months.fillna(0).astype(int)
+    years = years.fillna(0).astype(int)
+
+    if time_bucket == 'month':
+        buckets = years.astype(str) + "-" + months.astype(str).str.zfill(2)
+    elif time_bucket == 'season':
+        season_years = years + (months == 12)
+        buckets = season_years.astype(str) + "-" + months.map(SEASONS).fillna("unknown")
+    else:
+        buckets = years.astype(str)
+
+    return keys + "|" + buckets.where(known, "unknown")
+
+
+def _cluster_partition(args):
+    """Process pool entry point: cluster one partition's coordinates"""
+    latitudes, longitudes, eps, min_samples, method, sample_weight = args
+    return CLUSTER_METHODS[method](latitudes, longitudes, eps, min_samples, sample_weight=sample_weight)
+
+
+def partitioned_dbscan(latitudes, longitudes, partitions, eps=50, min_samples=5, max_workers=None, method='exact',
+                       sample_weight=None):
+    """
+    Cluster each partition independently and merge into globally unique labels
+
+    Partitions are clustered on a process pool (one task per partition,
+    largest first so stragglers start early). Labels of each partition are
+    offset by the number of clusters in the partitions before it, so ids
+    are unique across partitions and deterministic.
+
+    Args:
+        latitudes, longitudes: Coordinates of all points (degrees)
+        partitions: Partition key of each point
+        eps: Maximum distance between neighbouring points (km)
+        min_samples: Minimum neighbourhood size (including the point) for a core point
+        max_workers: Pool size; defaults to all cores. 1 clusters in-process
+        method: Key of ``CLUSTER_METHODS`` used within each partition
+        sample_weight: Optional weight of each point, counted towards min_samples
+
+    Returns:
+        Integer array of cluster labels, -1 for noise
+    """
+    if method not in CLUSTER_METHODS:
+        raise ValueError(f"Unsupported clustering method: {method}")
+
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    sample_weight = _as_weights(sample_weight, len(latitudes))
+    codes, uniques = pd.factorize(np.asarray(partitions), sort=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    members = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+    tasks = [
+        (latitudes[idx], longitudes[idx], eps, min_samples, method, None if sample_weight is None else sample_weight[idx])
+        for idx in members
+    ]
+
+    if max_workers == 1 or len(tasks) <= 1:
+        results = [_cluster_partition(task) for task in tasks]
+    else:
+        results = [None] * len(tasks)
+        largest_first = sorted(range(len(tasks)), key=lambda i: -len(members[i]))
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {i: pool.submit(_cluster_partition, tasks[i]) for i in largest_first}
+            for i, future in futures.items():
+                results[i] = future.result()
+
+    labels = np.full(len(latitudes), -1, dtype=np.int64)
+    offset = 0
+    for idx, partition_labels in zip(members, results):
+        clustered = partition_labels >= 0
+        labels[idx[clustered]] = partition_labels[clustered] + offset
+        offset += int(partition_labels.max()) + 1 if clustered.any() else 0
+
+    return labels
+
+
+def update_dbscan_labels(latitudes, longitudes, labels, new_idx, eps=50, min_samples=5, chunk_size=50000,
+                         sample_weight=None):
+    """
+    Re-label only the neighbourhood affected by newly added points
+
+    Adding points can only change the core status of points within eps of
+    them, and those can only link clusters with a point within eps of a
+    changed point. So only points within 2*eps of the new points, plus the
+    clusters they belong to, are re-clustered; everything else keeps its label.
+    Core status is still counted against the full dataset, so the result
+    matches a full ``haversine_dbscan`` up to label numbering.
+
+    Existing cluster ids are kept where possible: a re-clustered component
+    takes the smallest old id it contains, and brand new clusters get ids
+    above the current maximum.
+
+    Args:
+        latitudes, longitudes: Coordinates of all points, old and new (degrees)
+        labels: Current labels for all points; entries at new_idx are ignored
+        new_idx: Indices of the newly added points
+        eps: Maximum distance between neighbouring points (km)
+        min_samples: Minimum neighbourhood size (including the point) for a core point
+        chunk_size: Number of points queried against the tree at once
+        sample_weight: Optional weight of each point, counted towards min_samples
+
+    Returns:
+        Tuple (labels, changed_clusters): updated label array and the ids of
+        every cluster that was created, grown, merged away or re-labelled
+    """
+    points = _radian_points(latitudes, longitudes)
+    sample_weight = _as_weights(sample_weight, len(points))
+    new_idx = np.asarray(new_idx, dtype=np.int64)
+    old_labels = np.asarray(labels, dtype=np.int64).copy()
+    old_labels[new_idx] = -1
+
+    if len(new_idx) == 0:
+        return old_labels, set()
+
+    tree = BallTree(points, metric='haversine')
+    radius = eps / EARTH_RADIUS_KM
+
+    # Affected region: everything within 2*eps of a new point, widened to whole clusters
+    _, near = _neighbour_pairs(tree, points, new_idx, 2 * radius)
+    affected_clusters = np.unique(old_labels[near])
+    affected_clusters = affected_clusters[affected_clusters >= 0]
+    subset = np.unique(np.concatenate([new_idx, near, np.flatnonzero(np.isin(old_labels, affected_clusters))]))
+
+    # Core status for the subset and for any point a subset point could attach to
+    _, halo = _neighbour_pairs(tree, points, subset, radius)
+    scope = np.unique(np.concatenate([subset, halo]))
+    is_core = np.zeros(len(points), dtype=bool)
+    is_core[scope] = _core_mask(tree, points, scope, radius, min_samples, chunk_size, sample_weight)
+
+    in_subset = np.zeros(len(points), dtype=bool)
+    in_subset[subset] = True
+    subset_core = np.flatnonzero(is_core & in_subset)
+    component = _core_components(tree, points, subset_core, is_core & in_subset, radius, chunk_size)
+
+    updated = old_labels.copy()
+    updated[subset] = -1
+    next_label = max(int(old_labels.max()), -1) + 1
+    used = set()
+
+    # Give each component the smallest old id among its core points, or a fresh id
+    for comp in np.unique(component[subset_core]):
+        members = subset_core[component[subset_core] == comp]
+        previous = old_labels[members]
+        previous = previous[previous >= 0]
+        label = int(previous.min()) if len(previous) else -1
+        if label < 0 or label in used:
+            label = next_label
+            next_label += 1
+        used.add(label)
+        updated[members] = label
+
+    # Non-core subset points attach to their nearest core, inside or outside the subset
+    border, core = _nearest_core(tree, points, np.flatnonzero(in_subset & ~is_core), is_core, radius, chunk_size)
+    updated[border] = updated[core]
+
+    changed = set(affected_clusters.tolist()) | set(np.unique(updated[subset]).tolist())
+    changed.discard(-1)
+    return updated, changed
@@ -0,0 +1,67 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Standardized migration file in the data directory
+MIGRATIONS_FILE = "standardized_migrations.parquet"
+
+# Columns migration files are sorted by, so row-group statistics can skip whole groups
+MIGRATION_SORT_COLUMNS = ('species', 'year', 'month')
+MIGRATION_ROW_GROUP_SIZE = 128 * 1024
+
+
+def write_migrations(df, path, row_group_size=MIGRATION_ROW_GROUP_SIZE):
+    """
+    Write standardized migration records to Parquet
+
+    Rows are stably sorted by species, year and month (those present), so
+    each row group covers a narrow range of them and reads filtered on them
+    skip most groups. Species is dictionary encoded.
+    """
+    sort_columns = [col for col in MIGRATION_SORT_COLUMNS if col in df.columns]
+    if sort_columns:
+        df = df.sort_values(sort_columns, kind='stable')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(
+        table, path, row_group_size=row_group_size, compression='zstd',
+        use_dictionary=['species'] if 'species' in df.columns else False
+    )
+
+
+def migration_filters(species=None, year=None, month=None):
+    """Parquet filters for the given species, year and month; each a value or a list of values"""
+    filters = []
+    for column, value in (('species', species), ('year', year), ('month', month)):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            filters.append((column, 'in', list(value)))
+        else:
+            filters.append((column, '==', value))
+    return filters or None
+
+
+def read_migrations(path, species=None, year=None, month=None, columns=None):
+    """
+    Read migration records from Parquet, pushing species/year/month filters down to row groups
+
+    The file is memory mapped, so numeric columns come back without
+    intermediate copies.
+
+    Args:
+        path: Parquet file written by ``write_migrations``
+        species, year, month: Optional value or list of values to keep
+        columns: Optional subset of columns to read
+
+    Returns:
+        DataFrame of the matching records
+    """
+    filters = migration_filters(species, year, month)
+    if filters:
+        names = pq.read_schema(path).names
+        missing = [column for column, _, _ in filters if column not in names]
+        if missing:
+            raise ValueError(f"Cannot filter on missing columns: {missing}")
+
+    table = pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+    return table.to_pandas()
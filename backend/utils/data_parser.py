@@ -1,11 +1,55 @@
 import pandas as pd
+import itertools
 import json
 import os
 from pathlib import Path
 from datetime import datetime
 import numpy as np
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+from utils.columnar_store import MIGRATIONS_FILE, write_migrations
+from utils.geodesy import EARTH_RADIUS_KM
+from utils.geojson_stream import iter_json_array, parse_geojson_lane_arrays, read_json_points
+from utils.lane_cache import LANE_CACHE_FILE, write_lane_cache
+
+# Alternative names of the coordinate columns
+COLUMN_ALIASES = {
+    'lat': 'latitude',
+    'lon': 'longitude',
+    'lng': 'longitude',
+    'long': 'longitude'
+}
+
+# Explicit types of known migration columns (lower-cased names); other columns are read as text.
+# Timestamps are read as text and parsed with DataParser.TIMESTAMP_FORMAT, month and year
+# as text converted to integers when standardized (see MIGRATION_INTEGER_COLUMNS)
+MIGRATION_SCHEMA = {
+    'latitude': pa.float64(),
+    'longitude': pa.float64(),
+    'count': pa.float64(),
+    'weight': pa.float64(),
+    'species': pa.string(),
+    'species_name': pa.string(),
+    'name': pa.string(),
+    'timestamp': pa.string(),
+    'month': pa.string(),
+    'year': pa.string()
+}
+
+# Columns converted to nullable integers; values that are not whole numbers become missing
+MIGRATION_INTEGER_COLUMNS = ('month', 'year')
+
+# Lane properties carried over into standardized lanes
+LANE_METADATA_KEYS = ('traffic_volume', 'vessel_count', 'risk_level', 'description')
 
 class DataParser:
+    # Timestamp format tried before falling back to per-value inference
+    TIMESTAMP_FORMAT = 'ISO8601'
+    
+    # Bytes of CSV text per batch when streaming migration CSVs
+    CSV_BLOCK_BYTES = 32 << 20
+    
     def __init__(self, data_dir="../data"):
         self.data_dir = Path(data_dir)
     
@@ -46,8 +90,82 @@ class DataParser:
     
     def _parse_csv_migration_data(self, file_path):
         """Parse migration data from CSV format"""
-        df = pd.read_csv(file_path)
+        batches = list(self.iter_csv_migration_batches(file_path))
+        return pd.concat(batches, ignore_index=True) if len(batches) > 1 else batches[0]
+    
+    def iter_csv_migration_batches(self, file_path, block_size=None):
+        """
+        Stream a migration CSV as standardized, validated batches
+        
+        The file is read by pyarrow's multithreaded streaming reader with an
+        explicit type for every column: known columns (MIGRATION_SCHEMA,
+        whatever their case or alias) get theirs and all others are read as
+        text, so no block can fail on a type guessed from an earlier one.
+        Each block is standardized and rows with missing or out-of-range
+        coordinates are dropped, so callers can process a batch while the
+        next one is read.
+        
+        Args:
+            file_path: Path to the CSV file
+            block_size: Bytes of CSV text per batch (default: CSV_BLOCK_BYTES)
+            
+        Yields:
+            DataFrames with standardized migration data; at least one, possibly empty
+        """
+        header = pd.read_csv(file_path, nrows=0).columns
+        column_types = {}
+        for column in header:
+            name = COLUMN_ALIASES.get(column.lower(), column.lower())
+            column_types[column] = MIGRATION_SCHEMA.get(name, pa.string())
+        
+        reader = pa_csv.open_csv(
+            file_path,
+            read_options=pa_csv.ReadOptions(block_size=block_size or self.CSV_BLOCK_BYTES),
+            convert_options=pa_csv.ConvertOptions(column_types=column_types)
+        )
+        
+        empty = True
+        for batch in reader:
+            empty = False
+            yield self._validate_coordinates(self.standardize_migration_data(batch.to_pandas()))
+        
+        if empty:
+            yield self.standardize_migration_data(reader.schema.empty_table().to_pandas())
+    
+    def _integer_columns(self, df):
+        """Convert the MIGRATION_INTEGER_COLUMNS present to nullable integers, clearing other values"""
+        for column in MIGRATION_INTEGER_COLUMNS:
+            if column not in df.columns:
+                continue
+            values = pd.to_numeric(df[column], errors='coerce')
+            values = values.where(values == values.round())
+            cleared = int((values.isna() & df[column].notna()).sum())
+            if cleared:
+                print(f"Warning: Cleared {cleared} non-integer '{column}' values")
+            df[column] = values.astype('Int64')
+        return df
+    
+    def _validate_coordinates(self, df):
+        """Drop records whose latitude or longitude is missing, non-numeric or out of range"""
+        lat = pd.to_numeric(df['latitude'], errors='coerce')
+        lon = pd.to_numeric(df['longitude'], errors='coerce')
+        valid = lat.between(-90, 90) & lon.between(-180, 180)
+        if valid.all():
+            return df
+        
+        print(f"Warning: Dropped {int((~valid).sum())} records with invalid coordinates")
+        return df[valid.values].reset_index(drop=True)
+    
+    def standardize_migration_data(self, df):
+        """
+        Standardize column names, timestamps and species for migration records
         
+        Args:
+            df: DataFrame of raw migration records
+            
+        Returns:
+            DataFrame with standardized migration data
+        """
         # Standardize column names (lowercase)
         df.columns = [col.lower() for col in df.columns]
         
@@ -55,23 +173,21 @@ class DataParser:
         required_cols = ['latitude', 'longitude']
         if not all(col in df.columns for col in required_cols):
             # Try alternative column names
-            mapping = {
-                'lat': 'latitude',
-                'lon': 'longitude',
-                'lng': 'longitude',
-                'long': 'longitude'
-            }
-            
-            df = df.rename(columns={k: v for k, v in mapping.items() if k in df.columns})
+            df = df.rename(columns={k: v for k, v in COLUMN_ALIASES.items() if k in df.columns})
             
             if not all(col in df.columns for col in required_cols):
                 raise ValueError(f"Missing required columns: {required_cols}")
         
+        df = self._integer_columns(df)
+        
         # Process timestamp if available
         if 'timestamp' in df.columns:
-            # Try to convert to datetime
+            # Try to convert to datetime, with the fixed format first
             try:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                try:
+                    df['timestamp'] = pd.to_datetime(df['timestamp'], format=self.TIMESTAMP_FORMAT)
+                except (ValueError, TypeError):
+                    df['timestamp'] = pd.to_datetime(df['timestamp'])
                 
                 # Extract month and year if not present
                 if 'month' not in df.columns:
@@ -101,49 +217,79 @@ class DataParser:
         
         return df
     
+    def thin_migration_data(self, df, distance_km=1.0, time_window_hours=24, by_species=True):
+        """
+        Collapse near-duplicate sightings into weighted points
+        
+        Sightings are snapped to a grid of roughly distance_km square cells
+        (longitude cells widen with latitude so they stay square on the
+        ground) and to time windows of time_window_hours. All sightings of the
+        same species in the same cell and window become one record at their
+        mean position and earliest timestamp, with 'count' summed and
+        'weight' holding the number of original sightings. Clustering and
+        conflict detection count each record with its weight, so clusters
+        and cluster sizes match those of the unthinned data up to the grid
+        resolution.
+        
+        Args:
+            df: DataFrame of standardized migration records
+            distance_km: Cell size (km)
+            time_window_hours: Window length (hours); None ignores time
+            by_species: Only merge sightings of the same species
+            
+        Returns:
+            DataFrame with one row per occupied cell and window
+        """
+        if df.empty:
+            return df
+        
+        lat = df['latitude'].values.astype(np.float64)
+        lon = df['longitude'].values.astype(np.float64)
+        cell_deg = distance_km / (np.pi * EARTH_RADIUS_KM / 180)
+        
+        # Longitude cells are scaled by the cosine of their latitude band's centre
+        lat_cell = np.floor(lat / cell_deg).astype(np.int64)
+        band_center = np.clip((lat_cell + 0.5) * cell_deg, -89.999, 89.999)
+        lon_cell = np.floor(lon * np.cos(np.radians(band_center)) / cell_deg).astype(np.int64)
+        keys = [lat_cell, lon_cell]
+        
+        if time_window_hours is not None and 'timestamp' in df.columns:
+            timestamps = pd.to_datetime(df['timestamp'], errors='coerce')
+            window = pd.Timedelta(hours=time_window_hours).value
+            keys.append(np.where(timestamps.isna(), np.iinfo(np.int64).min, timestamps.values.astype(np.int64) // window))
+        
+        if by_species and 'species' in df.columns:
+            keys.append(pd.factorize(df['species'])[0])
+        
+        group = pd.MultiIndex.from_arrays(keys).factorize()[0] if len(keys) > 1 else keys[0]
+        
+        df = df.copy()
+        df['weight'] = pd.to_numeric(df['weight'], errors='coerce').fillna(1) if 'weight' in df.columns else 1
+        df['count'] = pd.to_numeric(df['count'], errors='coerce').fillna(1) if 'count' in df.columns else 1
+        
+        groups = df.groupby(group, sort=False)
+        aggregations = {col: 'first' for col in df.columns}
+        aggregations.update(latitude='mean', longitude='mean', count='sum', weight='sum')
+        if 'timestamp' in df.columns:
+            aggregations['timestamp'] = 'min'
+        thinned = groups.agg(aggregations).reset_index(drop=True)
+        
+        # Month/year follow the earliest sighting of each merged record
+        if 'timestamp' in thinned.columns and pd.api.types.is_datetime64_any_dtype(thinned['timestamp']):
+            if 'month' in thinned.columns:
+                thinned['month'] = thinned['timestamp'].dt.month.fillna(thinned['month'])
+            if 'year' in thinned.columns:
+                thinned['year'] = thinned['timestamp'].dt.year.fillna(thinned['year'])
+        
+        print(f"Thinned {len(df)} sightings to {len(thinned)} weighted records")
+        return thinned
+    
     def _parse_json_migration_data(self, file_path):
-        """Parse migration data from JSON format"""
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        # Handle different JSON structures
-        if isinstance(data, list):
-            # List of records
-            if len(data) > 0 and isinstance(data[0], dict):
-                df = pd.DataFrame(data)
-            else:
-                raise ValueError("Invalid JSON structure for migration data")
-        elif isinstance(data, dict):
-            # Dictionary with records
-            if 'features' in data:  # GeoJSON format
-                features = data['features']
-                records = []
-                
-                for feature in features:
-                    record = feature.get('properties', {}).copy()
-                    
-                    # Extract coordinates from geometry
-                    if 'geometry' in feature and feature['geometry']:
-                        geometry = feature['geometry']
-                        if geometry['type'] == 'Point':
-                            coords = geometry['coordinates']
-                            record['longitude'] = coords[0]
-                            record['latitude'] = coords[1]
-                    
-                    records.append(record)
-                
-                df = pd.DataFrame(records)
-            elif 'data' in data:
-                # Data field contains records
-                df = pd.DataFrame(data['data'])
-            else:
-                # Try to convert dict to DataFrame
-                df = pd.DataFrame([data])
-        else:
-            raise ValueError("Invalid JSON structure for migration data")
+        """Parse migration data from JSON format (GeoJSON points, a list of records or a 'data' field)"""
+        df = read_json_points(file_path)
         
         # Standardize column names and continue processing as with CSV
-        return self._parse_csv_migration_data(df)
+        return self._validate_coordinates(self.standardize_migration_data(df))
     
     def parse_shipping_lanes(self, file_path=None, format_type="json"):
         """
@@ -154,7 +300,8 @@ class DataParser:
             format_type: Type of file (json, geojson, csv)
             
         Returns:
-            List of shipping lanes with standardized format
+            List of shipping lanes with standardized format; GeoJSON lanes
+            come as a sequence of lane mappings over coordinate arrays
         """
         if file_path is None:
             # Try to find a shipping lanes file in the data directory
@@ -184,23 +331,16 @@ class DataParser:
             raise ValueError(f"Unsupported format type: {format_type}")
     
     def _parse_json_shipping_lanes(self, file_path):
-        """Parse shipping lanes from JSON format"""
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        # Handle different JSON structures
-        if isinstance(data, list):
-            # List of lanes
-            lanes = data
-        elif isinstance(data, dict) and 'lanes' in data:
-            # Dictionary with lanes field
-            lanes = data['lanes']
-        elif isinstance(data, dict) and 'routes' in data:
-            # Dictionary with routes field
-            lanes = data['routes']
-        else:
+        """Parse shipping lanes from JSON format, streaming one lane at a time"""
+        # A list of lanes, or a dictionary with a lanes/routes field
+        lanes = iter_json_array(file_path, keys=('lanes', 'routes'))
+        try:
+            first = next(lanes, None)
+            lanes = [] if first is None else itertools.chain([first], lanes)
+        except KeyError:
             # Try to treat the whole object as a single lane
-            lanes = [data]
+            with open(file_path, 'r') as f:
+                lanes = [json.load(f)]
         
         # Standardize lane format
         standardized_lanes = []
@@ -223,7 +363,7 @@ class DataParser:
                 std_lane['coordinates'] = lane['geometry']['coordinates']
             
             # Add metadata if available
-            for key in ['traffic_volume', 'vessel_count', 'risk_level', 'description']:
+            for key in LANE_METADATA_KEYS:
                 if key in lane:
                     std_lane[key] = lane[key]
             
@@ -232,52 +372,8 @@ class DataParser:
         return standardized_lanes
     
     def _parse_geojson_shipping_lanes(self, file_path):
-        """Parse shipping lanes from GeoJSON format"""
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        if 'features' not in data:
-            raise ValueError("Invalid GeoJSON structure: missing 'features' field")
-        
-        features = data['features']
-        standardized_lanes = []
-        
-        for i, feature in enumerate(features):
-            if 'geometry' not in feature:
-                continue
-            
-            geometry = feature['geometry']
-            properties = feature.get('properties', {})
-            
-            std_lane = {
-                'id': properties.get('id', i),
-                'name': properties.get('name', properties.get('route_name', f"Lane {i}")),
-                'coordinates': []
-            }
-            
-            # Extract coordinates based on geometry type
-            if geometry['type'] == 'LineString':
-                # LineString: array of positions
-                std_lane['coordinates'] = [
-                    [coord[1], coord[0]] for coord in geometry['coordinates']  # Convert to [lat, lon]
-                ]
-            elif geometry['type'] == 'MultiLineString':
-                # MultiLineString: array of LineString arrays
-                # Use the first LineString for simplicity
-                if len(geometry['coordinates']) > 0:
-                    std_lane['coordinates'] = [
-                        [coord[1], coord[0]] for coord in geometry['coordinates'][0]  # Convert to [lat, lon]
-                    ]
-            
-            # Add metadata from properties
-            for key in ['traffic_volume', 'vessel_count', 'risk_level', 'description']:
-                if key in properties:
-                    std_lane[key] = properties[key]
-            
-            if std_lane['coordinates']:
-                standardized_lanes.append(std_lane)
-        
-        return standardized_lanes
+        """Parse shipping lanes from GeoJSON format, streaming one feature at a time into coordinate arrays"""
+        return parse_geojson_lane_arrays(file_path, metadata_keys=LANE_METADATA_KEYS).lanes()
     
     def _parse_csv_shipping_lanes(self, file_path):
         """Parse shipping lanes from CSV format"""
@@ -318,7 +414,7 @@ class DataParser:
                 }
                 
                 # Add metadata if available
-                for key in ['traffic_volume', 'vessel_count', 'risk_level', 'description']:
+                for key in LANE_METADATA_KEYS:
                     if key in df.columns:
                         values = group[key].unique()
                         if len(values) > 0:
@@ -360,7 +456,7 @@ class DataParser:
                 }
                 
                 # Add metadata if available
-                for key in ['traffic_volume', 'vessel_count', 'risk_level', 'description']:
+                for key in LANE_METADATA_KEYS:
                     if key in df.columns:
                         std_lane[key] = row[key]
                 
@@ -372,6 +468,10 @@ class DataParser:
         """
         Save standardized data to the data directory
         
+        Migrations go to Parquet (see utils.columnar_store) and lanes to the
+        memory-mapped lane cache (see utils.lane_cache), which the conflict
+        service loads at startup.
+        
         Args:
             migration_data: DataFrame with migration data
             shipping_lanes: List of shipping lanes
@@ -384,15 +484,14 @@ class DataParser:
         
         # Save migration data if provided
         if migration_data is not None:
-            migration_path = self.data_dir / "standardized_migrations.csv"
-            migration_data.to_csv(migration_path, index=False)
+            migration_path = self.data_dir / MIGRATIONS_FILE
+            write_migrations(migration_data, migration_path)
             print(f"Saved standardized migration data to {migration_path}")
         
         # Save shipping lanes if provided
         if shipping_lanes is not None:
-            shipping_path = self.data_dir / "standardized_shipping_lanes.json"
-            with open(shipping_path, 'w') as f:
-                json.dump(shipping_lanes, f, indent=2)
+            shipping_path = self.data_dir / LANE_CACHE_FILE
+            write_lane_cache(shipping_lanes, shipping_path)
             print(f"Saved standardized shipping lanes to {shipping_path}")
         
         return migration_path, shipping_path
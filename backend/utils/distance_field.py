@@ -0,0 +1,299 @@
+import numpy as np
+
+from utils.geodesy import EARTH_RADIUS_KM, _to_unit_vectors, haversine_km
+from utils.lane_index import KM_PER_DEGREE, search_envelopes
+
+
+def _segment_frames(starts, ends):
+    """
+    Per-segment vectors for repeated point-to-arc distances
+
+    Returns:
+        (m, 16) array of the endpoint unit vectors a and b, the unit normal n
+        of the great circle through them, the edge normals n x a and b x n
+        (a point is opposite the arc interior when it lies behind either) and
+        a flag that is 0 for zero-length segments
+    """
+    a = _to_unit_vectors(starts[:, 0], starts[:, 1])
+    b = _to_unit_vectors(ends[:, 0], ends[:, 1])
+    normal = np.cross(a, b)
+    length = np.linalg.norm(normal, axis=1, keepdims=True)
+    is_arc = length[:, 0] >= 1e-12
+    normal = normal / np.where(length == 0, 1.0, length)
+    return np.column_stack([a, b, normal, np.cross(normal, a), np.cross(b, normal), is_arc])
+
+
+def _arc_distance_km(points, frames):
+    """
+    Distance (km) from unit vectors to the segments described by ``_segment_frames`` rows
+
+    Same geometry as ``point_to_segment_distance_km``: the perpendicular
+    distance to the great circle when the foot falls within the arc, else
+    the nearer endpoint.
+    """
+    def dot(columns):
+        return np.einsum('ij,ij->i', points, frames[:, columns])
+
+    on_arc = (dot(slice(9, 12)) >= 0) & (dot(slice(12, 15)) >= 0) & (frames[:, 15] > 0)
+    to_circle = np.arcsin(np.minimum(np.abs(dot(slice(6, 9))), 1.0))
+    chord = np.minimum(
+        np.linalg.norm(points - frames[:, 0:3], axis=1),
+        np.linalg.norm(points - frames[:, 3:6], axis=1)
+    )
+    to_endpoint = 2 * np.arcsin(np.minimum(chord / 2, 1.0))
+    return np.where(on_arc, to_circle, to_endpoint) * EARTH_RADIUS_KM
+
+
+class LaneDistanceField:
+    """
+    Precomputed distance from a lat/lon grid to the nearest shipping lane
+
+    Grid nodes cover the lanes' bounding region padded by max_distance_km,
+    every resolution degrees. Each node stores the exact great-circle
+    distance to the nearest lane, capped at max_distance_km, and that lane's
+    index (-1 beyond the cap). Points outside the grid are further than the
+    cap from every lane. When the padded region crosses the antimeridian the
+    grid spans every longitude, and lookups wrap longitudes into [-180, 180).
+
+    Lookups interpolate bilinearly between the four surrounding nodes. The
+    capped distance is 1-Lipschitz, and bilinear weights never put more
+    than half a cell diagonal between a point and its interpolating corners,
+    so an interpolated distance d is within ``error_bound_km`` of the true
+    one: the truth lies in [d - error_bound_km, d + error_bound_km] for
+    d below max_distance_km - error_bound_km. Threshold tests use the bound
+    to decide most points outright and measure only the rest exactly.
+    """
+
+    def __init__(self, lane_store, resolution=0.1, max_distance_km=100, block_size=32, max_pairs=2000000):
+        """
+        Args:
+            lane_store: LaneStore of the shipping lanes
+            resolution: Node spacing (degrees)
+            max_distance_km: Distance cap; also how far the grid extends past the lanes
+            block_size: Nodes per side of the coarsest blocks candidates are gathered for
+            max_pairs: Node/segment pairs measured at once
+        """
+        self.lane_store = lane_store
+        self.resolution = resolution
+        self.max_distance_km = max_distance_km
+
+        # Segment index boxes cover whole great-circle arcs, so their union bounds the lanes
+        index = lane_store.index
+        if len(index) == 0:
+            bounds = np.array([0.0, 0.0, 0.0, 0.0])
+        else:
+            box_bounds = np.array([b.bounds for b in index.boxes])
+            bounds = np.r_[box_bounds[:, :2].min(axis=0), box_bounds[:, 2:].max(axis=0)]
+
+        pad_lat = max_distance_km / KM_PER_DEGREE
+        min_lat = max(bounds[1] - pad_lat, -90.0)
+        max_lat = min(bounds[3] + pad_lat, 90.0)
+        widest = max(abs(min_lat), abs(max_lat))
+        pad_lon = 180.0 if widest >= 89.999 else min(pad_lat / np.cos(np.radians(widest)), 180.0)
+        min_lon = bounds[0] - pad_lon
+        max_lon = bounds[2] + pad_lon
+        if min_lon < -180.0 or max_lon > 180.0:
+            # The padding spills across the antimeridian, so lanes are near points on both sides of it
+            min_lon, max_lon = -180.0, 180.0
+
+        self.min_lat = np.floor(min_lat / resolution) * resolution
+        self.min_lon = np.floor(min_lon / resolution) * resolution
+        self.n_lat = int(np.ceil((max_lat - self.min_lat) / resolution)) + 1
+        self.n_lon = int(np.ceil((max_lon - self.min_lon) / resolution)) + 1
+        self.lat_nodes = self.min_lat + np.arange(self.n_lat) * resolution
+        self.lon_nodes = self.min_lon + np.arange(self.n_lon) * resolution
+
+        # Widest cell: the one whose edge is closest to the equator
+        equator_lat = float(np.clip(0.0, self.lat_nodes[0], self.lat_nodes[-1]))
+        edge_lat = equator_lat - resolution / 2 if equator_lat > 0 else equator_lat + resolution / 2
+        self.error_bound_km = float(haversine_km(edge_lat, 0.0, edge_lat + resolution / 2, resolution / 2)) + 1e-3
+
+        self.distances = np.full((self.n_lat, self.n_lon), max_distance_km, dtype=np.float32)
+        self.lane_ids = np.full((self.n_lat, self.n_lon), -1, dtype=np.int32)
+        if len(index):
+            self._fill(block_size, max_pairs)
+
+    def _block_geometry(self, row0, col0, size):
+        """Centre of each square block of nodes (clipped to the grid) and its distance to the furthest corner"""
+        rows1 = np.minimum(row0 + size, self.n_lat) - 1
+        cols1 = np.minimum(col0 + size, self.n_lon) - 1
+        lat_a, lat_b = self.lat_nodes[row0], self.lat_nodes[rows1]
+        lon_a, lon_b = self.lon_nodes[col0], self.lon_nodes[cols1]
+        center_lat, center_lon = (lat_a + lat_b) / 2, (lon_a + lon_b) / 2
+        reach = np.maximum(
+            haversine_km(center_lat, center_lon, lat_a, lon_a),
+            haversine_km(center_lat, center_lon, lat_b, lon_a)
+        )
+        return center_lat, center_lon, reach
+
+    def _fill(self, block_size, max_pairs):
+        """
+        Exact capped distances at every node near a lane
+
+        Candidate segments are found for coarse blocks of nodes and then
+        refined by splitting each block into quarters down to single nodes.
+        At every level a segment whose distance D from the block centre
+        exceeds d + 2r (d the nearest segment to the centre, r the distance
+        from the centre to the block's furthest node) or the cap + r cannot be
+        the nearest lane of any node in the block, so it is dropped.
+        """
+        index = self.lane_store.index
+        frames = _segment_frames(index.starts, index.ends)
+
+        size = 1 << int(np.ceil(np.log2(max(block_size, 1))))
+        row0, col0 = (a.ravel() for a in np.meshgrid(
+            np.arange(0, self.n_lat, size), np.arange(0, self.n_lon, size), indexing='ij'
+        ))
+
+        center_lat, center_lon, reach = self._block_geometry(row0, col0, size)
+        boxes, owner = search_envelopes(center_lat, center_lon, self.max_distance_km + reach + 1e-6)
+        envelope_idx, box_idx = index.tree.query(boxes)
+        pairs = np.unique(np.column_stack([owner[envelope_idx], index.box_segment[box_idx]]), axis=0)
+        block_key = row0[pairs[:, 0]] * self.n_lon + col0[pairs[:, 0]]
+        segments = pairs[:, 1]
+
+        while len(segments):
+            # Pairs are grouped by block; measure from each block's centre
+            first = np.flatnonzero(np.r_[True, block_key[1:] != block_key[:-1]])
+            block_of_pair = np.repeat(np.arange(len(first)), np.diff(np.r_[first, len(block_key)]))
+            block_row, block_col = np.divmod(block_key[first], self.n_lon)
+            center_lat, center_lon, reach = self._block_geometry(block_row, block_col, size)
+            centers = _to_unit_vectors(center_lat, center_lon)
+
+            distances = np.empty(len(segments))
+            for start in range(0, len(segments), max_pairs):
+                chunk = slice(start, start + max_pairs)
+                seg = segments[chunk]
+                distances[chunk] = _arc_distance_km(centers[block_of_pair[chunk]], frames[seg])
+            nearest = np.minimum.reduceat(distances, first)
+
+            if size == 1:
+                hit = nearest <= self.max_distance_km
+                ties = np.flatnonzero(distances == nearest[block_of_pair])
+                _, pick = np.unique(block_of_pair[ties], return_index=True)
+                best = ties[pick]
+                self.distances[block_row[hit], block_col[hit]] = nearest[hit]
+                self.lane_ids[block_row[hit], block_col[hit]] = index.segment_lane[segments[best[hit]]]
+                return
+
+            reach = reach[block_of_pair]
+            keep = (distances <= nearest[block_of_pair] + 2 * reach) & (distances <= self.max_distance_km + reach)
+            block_key, segments = block_key[keep], segments[keep]
+
+            # Split every block into quarters and regroup the pairs by block
+            size //= 2
+            block_row, block_col = np.divmod(block_key, self.n_lon)
+            block_row = (block_row[:, None] + np.array([0, 0, size, size])).ravel()
+            block_col = (block_col[:, None] + np.array([0, size, 0, size])).ravel()
+            segments = np.repeat(segments, 4)
+            valid = (block_row < self.n_lat) & (block_col < self.n_lon)
+            block_key = block_row[valid] * self.n_lon + block_col[valid]
+            order = np.argsort(block_key, kind='stable')
+            block_key, segments = block_key[order], segments[valid][order]
+
+    @property
+    def nbytes(self):
+        return self.distances.nbytes + self.lane_ids.nbytes
+
+    def lookup(self, lats, lons):
+        """
+        Interpolated distance to the nearest lane and that lane's index
+
+        Args:
+            lats, lons: Point coordinates (degrees)
+
+        Returns:
+            Tuple (distance_km, lane_id): bilinear distances, within
+            error_bound_km of the truth and capped at max_distance_km, and the
+            nearest lane of the closest grid node (-1 beyond the cap)
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = (np.atleast_1d(np.asarray(lons, dtype=np.float64)) + 180.0) % 360.0 - 180.0
+        distance = np.full(lats.shape, float(self.max_distance_km))
+        lane_id = np.full(lats.shape, -1, dtype=np.int64)
+
+        y = (lats - self.min_lat) / self.resolution
+        x = (lons - self.min_lon) / self.resolution
+        inside = (y >= 0) & (y <= self.n_lat - 1) & (x >= 0) & (x <= self.n_lon - 1)
+        if not inside.any():
+            return distance, lane_id
+
+        y, x = y[inside], x[inside]
+        i = np.minimum(y.astype(np.int64), self.n_lat - 2) if self.n_lat > 1 else np.zeros(len(y), dtype=np.int64)
+        j = np.minimum(x.astype(np.int64), self.n_lon - 2) if self.n_lon > 1 else np.zeros(len(x), dtype=np.int64)
+        i1 = np.minimum(i + 1, self.n_lat - 1)
+        j1 = np.minimum(j + 1, self.n_lon - 1)
+        fy, fx = y - i, x - j
+
+        d = self.distances
+        distance[inside] = (
+            (d[i, j] * (1 - fx) + d[i, j1] * fx) * (1 - fy)
+            + (d[i1, j] * (1 - fx) + d[i1, j1] * fx) * fy
+        )
+        lane_id[inside] = self.lane_ids[np.where(fy < 0.5, i, i1), np.where(fx < 0.5, j, j1)]
+        return distance, lane_id
+
+    def may_be_within(self, lats, lons, distance_km):
+        """Mask of points that could lie within distance_km of a lane; False is certain"""
+        approx, _ = self.lookup(lats, lons)
+        return approx <= distance_km + self.error_bound_km
+
+    def within(self, lats, lons, distance_km):
+        """
+        Exact mask of points within distance_km of any lane
+
+        Points further than the error bound from the threshold are decided by
+        the field alone; the rest are measured against the lane segments.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        approx, _ = self.lookup(lats, lons)
+        result = approx < min(distance_km, self.max_distance_km) - self.error_bound_km
+
+        uncertain = np.flatnonzero(~result & (approx <= distance_km + self.error_bound_km))
+        if len(uncertain):
+            point_idx, _, _ = self.lane_store.lanes_within(lats[uncertain], lons[uncertain], distance_km)
+            result[uncertain[point_idx]] = True
+        return result
+
+    def nearest(self, lats, lons, exact_within=None):
+        """
+        Distance to and index of the nearest lane
+
+        Args:
+            lats, lons: Point coordinates (degrees)
+            exact_within: Optional distance (km); points that may lie this close
+                to a lane get their exact distance and lane, the others keep
+                the interpolated values
+
+        Returns:
+            Tuple (distance_km, lane_id, exact): distances capped at
+            max_distance_km, lane indices (-1 beyond the cap) and a mask of
+            the points that were measured exactly
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        distance, lane_id = self.lookup(lats, lons)
+        exact = np.zeros(len(lats), dtype=bool)
+        if exact_within is None:
+            return distance, lane_id, exact
+
+        refine = np.flatnonzero(distance <= exact_within + self.error_bound_km)
+        if len(refine):
+            # The true distance of a refined point is at most its estimate plus the bound
+            radius = min(exact_within + 2 * self.error_bound_km, self.max_distance_km)
+            point_idx, lane_idx, distances = self.lane_store.lanes_within(lats[refine], lons[refine], radius)
+            order = np.lexsort((distances, point_idx))
+            point_idx, lane_idx, distances = point_idx[order], lane_idx[order], distances[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]][:len(point_idx)]
+
+            hit = refine[point_idx[first]]
+            distance[hit] = distances[first]
+            lane_id[hit] = lane_idx[first]
+            exact[hit] = True
+
+            # Misses are known to be further than the search radius
+            missed = np.setdiff1d(refine, hit)
+            distance[missed] = np.maximum(distance[missed], radius)
+            lane_id[missed[distance[missed] >= self.max_distance_km]] = -1
+        return distance, lane_id, exact
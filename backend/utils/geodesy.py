@@ -0,0 +1,206 @@
+import numpy as np
+
+# Mean Earth radius (km) used for all spherical distance computations
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _to_unit_vectors(lat, lon):
+    """Convert lat/lon arrays in degrees to 3D unit vectors on the sphere"""
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _angle_between(u, v):
+    """Angle (radians) between unit vectors, numerically stable for tiny angles"""
+    cross = np.linalg.norm(np.cross(u, v), axis=-1)
+    dot = np.sum(u * v, axis=-1)
+    return np.arctan2(cross, dot)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between points in kilometres
+
+    All arguments are degrees and broadcast against each other, so scalars,
+    pairwise arrays and outer products (via ``[:, None]``) all work.
+
+    Returns:
+        Distance in km with the broadcast shape of the inputs
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def point_to_segment_distance_km(lat, lon, start_lat, start_lon, end_lat, end_lon):
+    """
+    Distance from points to great-circle segments in kilometres
+
+    The point is projected onto the great circle through the segment; if the
+    projection falls outside the arc, the nearer endpoint is used instead.
+    Arguments broadcast like ``haversine_km``.
+
+    Returns:
+        Distance in km with the broadcast shape of the inputs
+    """
+    p = _to_unit_vectors(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+    a = _to_unit_vectors(np.asarray(start_lat, dtype=np.float64), np.asarray(start_lon, dtype=np.float64))
+    b = _to_unit_vectors(np.asarray(end_lat, dtype=np.float64), np.asarray(end_lon, dtype=np.float64))
+    return _point_to_segment_angle(p, a, b) * EARTH_RADIUS_KM
+
+
+def _point_to_segment_angle(p, a, b):
+    """Angular distance from unit vectors p to great-circle arcs a-b"""
+    normal = np.cross(a, b)
+    normal_len = np.linalg.norm(normal, axis=-1, keepdims=True)
+    degenerate = normal_len[..., 0] < 1e-12
+    normal = normal / np.where(normal_len == 0, 1.0, normal_len)
+
+    # Closest point on the full great circle, then check it lies within the arc
+    along = p - np.sum(p * normal, axis=-1, keepdims=True) * normal
+    along_len = np.linalg.norm(along, axis=-1, keepdims=True)
+    closest = along / np.where(along_len == 0, 1.0, along_len)
+    on_arc = (
+        (np.sum(np.cross(a, closest) * normal, axis=-1) >= 0)
+        & (np.sum(np.cross(closest, b) * normal, axis=-1) >= 0)
+        & ~degenerate
+    )
+
+    to_endpoint = np.minimum(_angle_between(p, a), _angle_between(p, b))
+    return np.where(on_arc, _angle_between(p, closest), to_endpoint)
+
+
+def segment_latitude_range(starts, ends):
+    """
+    Latitude extent of great-circle segments
+
+    An arc can bulge poleward of both endpoints, so its extent is widened
+    whenever the great circle's northern or southern vertex lies on the arc.
+
+    Args:
+        starts, ends: (m, 2) arrays of [lat, lon] segment endpoints
+
+    Returns:
+        Tuple (min_lat, max_lat) in degrees
+    """
+    min_lat = np.minimum(starts[:, 0], ends[:, 0])
+    max_lat = np.maximum(starts[:, 0], ends[:, 0])
+    if len(starts) == 0:
+        return min_lat, max_lat
+
+    a = _to_unit_vectors(starts[:, 0], starts[:, 1])
+    b = _to_unit_vectors(ends[:, 0], ends[:, 1])
+    normal = np.cross(a, b)
+    normal_len = np.linalg.norm(normal, axis=-1, keepdims=True)
+    valid = normal_len[:, 0] > 1e-12
+    normal = normal / np.where(normal_len == 0, 1.0, normal_len)
+
+    # Northernmost point of the great circle: the pole projected onto its plane
+    pole = np.array([0.0, 0.0, 1.0])
+    vertex = pole - normal[:, 2:3] * normal
+    vertex_len = np.linalg.norm(vertex, axis=-1, keepdims=True)
+    valid &= vertex_len[:, 0] > 1e-12
+    vertex = vertex / np.where(vertex_len == 0, 1.0, vertex_len)
+    vertex_lat = np.degrees(np.arcsin(np.clip(vertex[:, 2], -1.0, 1.0)))
+
+    for sign in (1, -1):
+        v = sign * vertex
+        on_arc = (
+            valid
+            & (np.sum(np.cross(a, v) * normal, axis=-1) >= 0)
+            & (np.sum(np.cross(v, b) * normal, axis=-1) >= 0)
+        )
+        if sign == 1:
+            max_lat = np.where(on_arc, np.maximum(max_lat, vertex_lat), max_lat)
+        else:
+            min_lat = np.where(on_arc, np.minimum(min_lat, -vertex_lat), min_lat)
+
+    return min_lat, max_lat
+
+
+def polyline_segments(polylines):
+    """
+    Flatten polylines into segment arrays
+
+    Args:
+        polylines: Sequence of vertex lists, each vertex ``[lat, lon]``
+
+    Returns:
+        Tuple (starts, ends, line_index): (m, 2) lat/lon arrays for segment
+        endpoints and the polyline each segment belongs to. A single-vertex
+        polyline contributes one zero-length segment; empty ones contribute none.
+    """
+    starts, ends, line_index = [], [], []
+    for i, line in enumerate(polylines):
+        coords = np.asarray(line, dtype=np.float64).reshape(-1, 2)
+        if len(coords) == 0:
+            continue
+        if len(coords) == 1:
+            coords = np.vstack([coords, coords])
+        starts.append(coords[:-1])
+        ends.append(coords[1:])
+        line_index.append(np.full(len(coords) - 1, i, dtype=np.int64))
+
+    if not starts:
+        return np.empty((0, 2)), np.empty((0, 2)), np.empty(0, dtype=np.int64)
+
+    return np.concatenate(starts), np.concatenate(ends), np.concatenate(line_index)
+
+
+def points_to_segments_distance_km(lats, lons, starts, ends, line_index, n_lines, chunk_size=250000):
+    """
+    Minimum distance from every point to every polyline, given flattened segments
+
+    Args:
+        lats, lons: 1-D arrays of point coordinates (degrees)
+        starts, ends, line_index: Segment arrays as returned by ``polyline_segments``
+        n_lines: Number of polylines (columns of the result)
+        chunk_size: Upper bound on point x segment pairs evaluated at once
+
+    Returns:
+        (n_points, n_lines) array of distances in km; polylines without
+        segments get ``inf``
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    result = np.full((len(lats), n_lines), np.inf)
+
+    if len(lats) == 0 or len(line_index) == 0:
+        return result
+
+    # Segments are grouped by polyline, so a reduceat over run starts gives per-line minima
+    order = np.argsort(line_index, kind='stable')
+    a = _to_unit_vectors(starts[order, 0], starts[order, 1])
+    b = _to_unit_vectors(ends[order, 0], ends[order, 1])
+    sorted_lines = line_index[order]
+    run_starts = np.flatnonzero(np.r_[True, sorted_lines[1:] != sorted_lines[:-1]])
+    run_lines = sorted_lines[run_starts]
+
+    points = _to_unit_vectors(lats, lons)
+    step = max(1, chunk_size // len(sorted_lines))
+    for start in range(0, len(points), step):
+        p = points[start:start + step, None, :]
+        angles = _point_to_segment_angle(p, a[None, :, :], b[None, :, :])
+        result[start:start + step, run_lines] = np.minimum.reduceat(angles, run_starts, axis=1) * EARTH_RADIUS_KM
+
+    return result
+
+
+def points_to_polylines_distance_km(lats, lons, polylines, chunk_size=250000):
+    """
+    Minimum distance from every point to every polyline
+
+    Args:
+        lats, lons: 1-D arrays of point coordinates (degrees)
+        polylines: Sequence of vertex lists, each vertex ``[lat, lon]``
+        chunk_size: Upper bound on point x segment pairs evaluated at once
+
+    Returns:
+        (n_points, n_polylines) array of distances in km
+    """
+    starts, ends, line_index = polyline_segments(polylines)
+    return points_to_segments_distance_km(lats, lons, starts, ends, line_index, len(polylines), chunk_size)
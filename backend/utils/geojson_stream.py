@@ -0,0 +1,359 @@
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import json as pa_json
+
+from utils.lane_cache import LaneGeometry
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _JsonReader:
+    """
+    Buffered reader that decodes a JSON document value by value
+
+    Only the text of the value being decoded is held in memory; consumed text
+    is dropped as the reader moves on. A value that ends exactly at the end
+    of the buffer is decoded again with more text, so numbers and values split
+    across reads are never cut short.
+    """
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        if self.eof:
+            return False
+        text = self.f.read(size)
+        if not text:
+            self.eof = True
+            return False
+        if self.pos > len(self.buf) // 2:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += text
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or '' at the end of the document"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk_size):
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid JSON: expected '{char}' at offset {self.pos}")
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next value, reading as much more text as it needs"""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow reads geometrically so one huge value is not re-decoded once per chunk
+            self._fill(size)
+            size *= 2
+
+
+def iter_json_array(file_path, keys=(), chunk_size=1 << 20):
+    """
+    Yield the items of a JSON array one at a time without loading the document
+
+    The array is either the whole document or the value of the first of
+    ``keys`` found at the top level of an object; other top-level values are
+    decoded and discarded as they are passed.
+
+    Raises:
+        KeyError: If the document is an object with none of the keys holding an array
+    """
+    with open(file_path, 'r') as f:
+        reader = _JsonReader(f, chunk_size)
+        if reader.peek() == '{':
+            reader.pos += 1
+            while True:
+                if reader.peek() == '}':
+                    raise KeyError(f"No top-level array under any of {list(keys)}")
+                key = reader.decode()
+                reader.expect(':')
+                if key in keys and reader.peek() == '[':
+                    break
+                reader.decode()
+                if reader.peek() == ',':
+                    reader.pos += 1
+
+        reader.expect('[')
+        if reader.peek() == ']':
+            return
+        while True:
+            yield reader.decode()
+            char = reader.peek()
+            reader.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Invalid JSON: expected ',' or ']' at offset {reader.pos - 1}")
+
+
+class LaneArrays(LaneGeometry):
+    """
+    Lane geometry accumulated in growable NumPy buffers
+
+    Vertices of every part are appended as [lat, lon] rows to one float64
+    buffer that doubles when full; ``part_offsets`` delimits the parts and
+    ``lane_part_offsets`` the parts of each lane, as in LaneStore. Once
+    finished, ``lane_store()`` compiles a LaneStore over the buffer itself
+    and ``lanes()`` only builds a lane's coordinate lists when it is read.
+    """
+
+    def __init__(self, capacity=1024):
+        self.coords = np.empty((max(int(capacity), 1), 2), dtype=np.float64)
+        self.size = 0
+        self.part_offsets = [0]
+        self.lane_part_offsets = [0]
+        self.metadata = []
+
+    def add_part_lonlat(self, positions):
+        """Append a part given as GeoJSON [lon, lat(, ...)] positions; returns its vertex count"""
+        try:
+            array = np.asarray(positions, dtype=np.float64)
+            if array.ndim != 2 or array.shape[1] < 2:
+                raise ValueError("positions must be [lon, lat] pairs")
+        except ValueError:
+            # Mixed 2D/3D positions
+            array = np.array([position[:2] for position in positions], dtype=np.float64).reshape(-1, 2)
+
+        end = self.size + len(array)
+        if end > len(self.coords):
+            grown = np.empty((max(end, 2 * len(self.coords)), 2), dtype=np.float64)
+            grown[:self.size] = self.coords[:self.size]
+            self.coords = grown
+        self.coords[self.size:end, 0] = array[:, 1]
+        self.coords[self.size:end, 1] = array[:, 0]
+        self.size = end
+        self.part_offsets.append(end)
+        return len(array)
+
+    def end_lane(self, metadata):
+        """Close the lane made of the parts added since the previous lane"""
+        self.metadata.append(metadata)
+        self.lane_part_offsets.append(len(self.part_offsets) - 1)
+
+    def finish(self):
+        """Trim the buffer and turn the offsets into arrays; lanes of several parts carry 'parts'"""
+        self.coords = self.coords[:self.size].copy()
+        self.part_offsets = np.asarray(self.part_offsets, dtype=np.int64)
+        self.lane_part_offsets = np.asarray(self.lane_part_offsets, dtype=np.int64)
+        self.has_parts = (np.diff(self.lane_part_offsets) > 1).tolist()
+        return self
+
+
+def parse_geojson_lane_arrays(file_path, metadata_keys=(), chunk_size=1 << 20):
+    """
+    Stream the LineString/MultiLineString features of a GeoJSON file into LaneArrays
+
+    Features are decoded one at a time and their coordinates written
+    straight into the buffer, so memory follows the size of the output
+    rather than of the document. Features without line geometry or
+    vertices are skipped; ids and names default to the feature's position.
+
+    Args:
+        file_path: GeoJSON FeatureCollection
+        metadata_keys: Properties copied into each lane's metadata
+        chunk_size: Characters read at a time
+
+    Returns:
+        Finished LaneArrays; metadata holds 'id', 'name' and metadata_keys
+    """
+    # Roughly 40 characters of GeoJSON per vertex
+    arrays = LaneArrays(capacity=os.path.getsize(file_path) // 40)
+    try:
+        features = iter_json_array(file_path, keys=('features',), chunk_size=chunk_size)
+        for i, feature in enumerate(features):
+            geometry = feature.get('geometry') if isinstance(feature, dict) else None
+            if not geometry:
+                continue
+
+            if geometry.get('type') == 'LineString':
+                parts = [geometry.get('coordinates') or []]
+            elif geometry.get('type') == 'MultiLineString':
+                parts = geometry.get('coordinates') or []
+            else:
+                continue
+
+            vertices = sum(arrays.add_part_lonlat(part) for part in parts if len(part) > 0)
+            if not vertices:
+                continue
+
+            properties = feature.get('properties') or {}
+            metadata = {
+                'id': properties.get('id', i),
+                'name': properties.get('name', properties.get('route_name', f"Lane {i}"))
+            }
+            for key in metadata_keys:
+                if key in properties:
+                    metadata[key] = properties[key]
+            arrays.end_lane(metadata)
+    except KeyError:
+        raise ValueError("Invalid GeoJSON structure: missing 'features' field")
+
+    return arrays.finish()
+
+
+# Largest document parsed in one Arrow block; bigger files are streamed
+_ARROW_MAX_BYTES = (1 << 31) - 1
+
+
+def _struct_frame(struct):
+    """DataFrame of a StructArray's fields, nulls of the struct itself included"""
+    if not pa.types.is_struct(struct.type):
+        return pd.DataFrame(index=range(len(struct)))
+    names = [field.name for field in struct.type]
+    return pa.Table.from_arrays(struct.flatten(), names=names).to_pandas()
+
+
+def _point_columns(geometry):
+    """Longitude and latitude arrays of a geometry StructArray; NaN where it is not a Point"""
+    lon = np.full(len(geometry), np.nan)
+    lat = np.full(len(geometry), np.nan)
+    if not pa.types.is_struct(geometry.type) or geometry.type.get_field_index('coordinates') < 0:
+        return lon, lat
+
+    coordinates = geometry.flatten()[geometry.type.get_field_index('coordinates')]
+    value_type = coordinates.type.value_type if pa.types.is_list(coordinates.type) else None
+    if value_type is None or not (pa.types.is_floating(value_type) or pa.types.is_integer(value_type)):
+        raise pa.ArrowInvalid("Point coordinates must be lists of numbers")
+
+    is_point = np.ones(len(geometry), dtype=bool)
+    if geometry.type.get_field_index('type') >= 0:
+        types = geometry.flatten()[geometry.type.get_field_index('type')]
+        is_point = np.asarray(types.to_numpy(zero_copy_only=False) == 'Point', dtype=bool)
+
+    offsets = coordinates.offsets.to_numpy()
+    values = coordinates.values.cast(pa.float64()).to_numpy(zero_copy_only=False)
+    valid = is_point & ~np.asarray(coordinates.is_null().to_numpy(zero_copy_only=False), dtype=bool)
+    valid &= (offsets[1:] - offsets[:-1]) >= 2
+    lon[valid] = values[offsets[:-1][valid]]
+    lat[valid] = values[offsets[:-1][valid] + 1]
+    return lon, lat
+
+
+def _read_points_arrow(file_path):
+    """read_json_points in one pass of Arrow's JSON reader; raises ArrowInvalid for layouts it cannot take"""
+    size = os.path.getsize(file_path)
+    if size + 16 >= _ARROW_MAX_BYTES:
+        raise pa.ArrowInvalid("Document too large for a single block")
+
+    source = file_path
+    with open(file_path, 'rb') as f:
+        if f.read(4096).lstrip().startswith(b'['):
+            # Arrow only reads objects, so a top-level list is read as the 'data' list of one
+            f.seek(0)
+            document = bytearray(b'{"data":') + f.read() + b'}'
+            source = pa.BufferReader(document)
+            size = len(document)
+
+    table = pa_json.read_json(
+        source,
+        read_options=pa_json.ReadOptions(block_size=max(size, 1)),
+        parse_options=pa_json.ParseOptions(newlines_in_values=True)
+    )
+    if table.num_rows != 1:
+        raise pa.ArrowInvalid("Expected a single JSON object")
+
+    if 'features' in table.column_names:
+        features = table.column('features').combine_chunks()
+        if not pa.types.is_list(features.type):
+            raise pa.ArrowInvalid("'features' must be a list")
+        features = features.flatten()
+        if len(features) == 0 or not pa.types.is_struct(features.type):
+            return pd.DataFrame({'longitude': pd.Series(dtype=float), 'latitude': pd.Series(dtype=float)})
+
+        fields = dict(zip([field.name for field in features.type], features.flatten()))
+        df = _struct_frame(fields['properties']) if 'properties' in fields else pd.DataFrame(index=range(len(features)))
+        if 'geometry' in fields:
+            df['longitude'], df['latitude'] = _point_columns(fields['geometry'])
+        return df
+
+    if 'data' in table.column_names:
+        records = table.column('data').combine_chunks()
+        if not pa.types.is_list(records.type) or not pa.types.is_struct(records.type.value_type):
+            raise pa.ArrowInvalid("'data' must be a list of records")
+        return _struct_frame(records.flatten())
+
+    return table.to_pandas()
+
+
+def _read_points_stream(file_path, batch_size, chunk_size):
+    """read_json_points by streaming the document, batch_size items at a time"""
+    try:
+        items = iter_json_array(file_path, keys=('features', 'data'), chunk_size=chunk_size)
+        first = next(items, None)
+    except KeyError:
+        # A single record
+        with open(file_path, 'r') as f:
+            return pd.DataFrame([json.load(f)])
+    if first is None:
+        raise ValueError("Invalid JSON structure for migration data")
+
+    is_feature = isinstance(first, dict) and first.get('type') == 'Feature'
+    items = itertools.chain([first], items)
+    frames = []
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            break
+        if not all(isinstance(record, dict) for record in batch):
+            raise ValueError("Invalid JSON structure for migration data")
+
+        if is_feature:
+            frame = pd.DataFrame([feature.get('properties') or {} for feature in batch], index=range(len(batch)))
+            points = np.array([
+                feature['geometry']['coordinates'][:2]
+                if (feature.get('geometry') or {}).get('type') == 'Point' else [np.nan, np.nan]
+                for feature in batch
+            ], dtype=np.float64).reshape(-1, 2)
+            frame['longitude'], frame['latitude'] = points[:, 0], points[:, 1]
+        else:
+            frame = pd.DataFrame(batch)
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def read_json_points(file_path, batch_size=100000, chunk_size=1 << 20):
+    """
+    Point records of a JSON file as a DataFrame, extracted column by column
+
+    Takes a GeoJSON FeatureCollection (properties become columns, Point
+    coordinates become 'longitude'/'latitude'), a list of records, an object
+    with a 'data' list of records, or a single record. The document is
+    parsed by Arrow's JSON reader straight into columns (a top-level list
+    is wrapped as a 'data' list first); layouts it cannot type (e.g. mixed
+    geometry types, or records that are not objects) are streamed instead,
+    batch_size items at a time, without building the whole document.
+    """
+    try:
+        return _read_points_arrow(file_path)
+    except pa.ArrowInvalid:
+        return _read_points_stream(file_path, batch_size, chunk_size)
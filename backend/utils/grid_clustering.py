@@ -0,0 +1,179 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.metrics import adjusted_rand_score
+
+from utils.geodesy import EARTH_RADIUS_KM, _to_unit_vectors
+
+# Offsets of the 26 cells around a grid cell, face neighbours first so border
+# points prefer the closest dense cell
+_NEIGHBOUR_OFFSETS = sorted(
+    [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) != (0, 0, 0)],
+    key=lambda offset: sum(map(abs, offset))
+)
+
+
+def _cell_keys(cells):
+    """
+    Pack integer (x, y, z) cell coordinates into int64 keys
+
+    The packing is linear with one cell of padding on every side, so the key
+    of a neighbouring cell is the cell's key plus a constant per offset.
+
+    Returns:
+        Tuple (keys, offset_deltas): key of each cell and the key difference
+        for every entry of ``_NEIGHBOUR_OFFSETS``
+    """
+    low = cells.min(axis=0) - 1
+    extent = cells.max(axis=0) - low + 2
+    if np.prod(extent.astype(np.float64)) >= 2 ** 62:
+        raise ValueError("Cluster distance too small for grid clustering")
+
+    def pack(c):
+        return (c[..., 0] * extent[1] + c[..., 1]) * extent[2] + c[..., 2]
+
+    return pack(cells - low), pack(np.array(_NEIGHBOUR_OFFSETS))
+
+
+def grid_dbscan(latitudes, longitudes, eps=50, min_samples=5, sample_weight=None):
+    """
+    Approximate DBSCAN in linear time on a grid of unit-vector cells
+
+    Points are mapped to 3D unit vectors and binned into cubes whose diagonal
+    is the eps chord, so any two points sharing a cell are within eps of each
+    other. The density of a cell is the number of points in its 3x3x3 block,
+    whose footprint on the sphere (9 cell faces, 3 eps^2) is close to the
+    eps disc (pi eps^2). Occupied cells reaching min_samples are dense;
+    adjacent dense cells (26-neighbourhood) are linked into clusters, and
+    points of other cells next to a dense cell join it as border points.
+    Everything else is noise. Working in 3D keeps cells well shaped at the
+    poles and seamless across the antimeridian.
+
+    The block density stands in for each point's own neighbour count, so
+    cluster fringes can differ from exact DBSCAN and thin bridges between
+    clusters may be gained or lost. Use ``clustering_agreement`` to measure
+    the difference on a given dataset.
+
+    Args:
+        latitudes, longitudes: Point coordinates (degrees)
+        eps: Cluster distance (km)
+        min_samples: Minimum number of points in a dense cell
+        sample_weight: Optional weight of each point, counted instead of one
+
+    Returns:
+        Integer array of cluster labels numbered by first appearance, -1 for noise
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    n = len(latitudes)
+    labels = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels
+
+    chord = 2 * np.sin(min(eps / (2 * EARTH_RADIUS_KM), np.pi / 2))
+    side = chord / np.sqrt(3)
+    cells = np.floor(_to_unit_vectors(latitudes, longitudes) / side).astype(np.int64)
+
+    point_keys, deltas = _cell_keys(cells)
+    keys, point_cell, counts = np.unique(point_keys, return_inverse=True, return_counts=True)
+    point_cell = point_cell.ravel()
+    if sample_weight is not None:
+        counts = np.bincount(point_cell, weights=np.asarray(sample_weight, dtype=np.float64), minlength=len(keys))
+
+    def find_cells(sorted_keys, cell_idx, delta):
+        """Position in sorted_keys of the cell delta away from each given cell, or -1"""
+        # cell_idx is ascending, so the probes are sorted too and the search stays cache friendly
+        probe = keys[cell_idx] + delta
+        pos = np.minimum(np.searchsorted(sorted_keys, probe), len(sorted_keys) - 1)
+        return np.where(sorted_keys[pos] == probe, pos, -1)
+
+    # Adjacency is symmetric, so pairs are found through the 13 forward offsets only
+    forward = deltas[deltas > 0]
+
+    # Block density: points in the cell and its 26 neighbours
+    all_cells = np.arange(len(keys))
+    density = counts.copy()
+    for delta in forward:
+        nb = find_cells(keys, all_cells, delta)
+        found = np.flatnonzero(nb >= 0)
+        density[found] += counts[nb[found]]
+        density[nb[found]] += counts[found]
+
+    dense = np.flatnonzero(density >= min_samples)
+    if len(dense) == 0:
+        return labels
+
+    # Neighbour lookups from here on only need the dense cells, sorted by key
+    dense_keys = keys[dense]
+
+    def dense_neighbour(cell_idx, delta):
+        """Position in ``dense`` of the neighbouring dense cell delta away, or -1"""
+        return find_cells(dense_keys, cell_idx, delta)
+
+    # Link adjacent dense cells and label the connected components
+    rows, cols = [np.arange(len(dense))], [np.arange(len(dense))]
+    for delta in forward:
+        nb = dense_neighbour(dense, delta)
+        linked = nb >= 0
+        rows.append(np.flatnonzero(linked))
+        cols.append(nb[linked])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(dense), len(dense)))
+    _, component = connected_components(graph, directed=False)
+
+    cell_label = np.full(len(keys), -1, dtype=np.int64)
+    cell_label[dense] = component
+
+    # Sparse cells bordering a dense cell join its cluster
+    sparse = np.flatnonzero(density < min_samples)
+    for delta in deltas:
+        if len(sparse) == 0:
+            break
+        nb = dense_neighbour(sparse, delta)
+        found = nb >= 0
+        cell_label[sparse[found]] = component[nb[found]]
+        sparse = sparse[~found]
+
+    # Renumber clusters in order of first appearance, like the exact DBSCAN
+    labels = cell_label[point_cell]
+    clustered = np.flatnonzero(labels >= 0)
+    if len(clustered):
+        ids, first = np.unique(labels[clustered], return_index=True)
+        rank = np.empty(len(ids), dtype=np.int64)
+        rank[np.argsort(first, kind='stable')] = np.arange(len(ids))
+        labels[clustered] = rank[np.searchsorted(ids, labels[clustered])]
+    return labels
+
+
+def clustering_agreement(reference, approximate):
+    """
+    Accuracy of an approximate labelling against exact DBSCAN labels
+
+    Args:
+        reference: Exact cluster labels, -1 for noise
+        approximate: Approximate labels of the same points
+
+    Returns:
+        Dictionary with the adjusted Rand index over all points, the share of
+        points whose noise/clustered status matches, precision and recall of
+        clustered points, and both cluster counts
+    """
+    reference = np.asarray(reference)
+    approximate = np.asarray(approximate)
+    ref_clustered = reference >= 0
+    approx_clustered = approximate >= 0
+    both = int((ref_clustered & approx_clustered).sum())
+
+    # Noise points are singletons, so they never count as agreeing with each other
+    noise_ids = -1 - np.arange(len(reference))
+    ref_labels = np.where(ref_clustered, reference, noise_ids)
+    approx_labels = np.where(approx_clustered, approximate, noise_ids)
+
+    return {
+        'adjusted_rand_index': float(adjusted_rand_score(ref_labels, approx_labels)) if len(reference) else 1.0,
+        'noise_agreement': float((ref_clustered == approx_clustered).mean()) if len(reference) else 1.0,
+        'clustered_precision': both / int(approx_clustered.sum()) if approx_clustered.any() else 1.0,
+        'clustered_recall': both / int(ref_clustered.sum()) if ref_clustered.any() else 1.0,
+        'exact_clusters': int(len(np.unique(reference[ref_clustered]))),
+        'approximate_clusters': int(len(np.unique(approximate[approx_clustered])))
+    }
@@ -0,0 +1,300 @@
+from collections import defaultdict
+
+import numpy as np
+
+from utils.clustering import dbscan_structure
+from utils.geodesy import EARTH_RADIUS_KM
+
+
+class IncrementalDBSCAN:
+    """
+    DBSCAN that absorbs new points without revisiting the existing ones
+
+    Points are kept as 3D unit vectors in a hash grid whose cells are one eps
+    chord wide, so the eps-neighbourhood of a point lies in its 27 surrounding
+    cells anywhere on the globe. Each insert only touches the neighbourhoods
+    of the new points: neighbour counts are bumped, points that cross
+    min_samples become core, and core points are linked through a union-find.
+
+    Insertions only ever add core points and core-core links, so clusters can
+    grow and merge but never split. Cluster ids are stable: a cluster keeps
+    its id as it grows, a merge keeps the smaller (older) id, and new
+    clusters get ids above every id handed out so far.
+    """
+
+    def __init__(self, eps=50, min_samples=5):
+        """
+        Args:
+            eps: Maximum distance between neighbouring points (km)
+            min_samples: Minimum neighbourhood size (including the point) for a core point
+        """
+        self.eps = eps
+        self.min_samples = min_samples
+        # Straight-line distance between unit vectors that are eps apart on the sphere
+        self.chord = 2 * np.sin(eps / (2 * EARTH_RADIUS_KM))
+
+        self._n = 0
+        self._xyz = np.empty((0, 3))
+        self._weights = np.empty(0)
+        self._counts = np.empty(0)
+        self._core = np.empty(0, dtype=bool)
+        self._anchor = np.empty(0, dtype=np.int64)
+        self._parent = np.empty(0, dtype=np.int64)
+        self._cells = defaultdict(list)
+        self._root_label = {}
+        self._next_label = 0
+
+    def __len__(self):
+        return self._n
+
+    def _reserve(self, extra):
+        """Grow the per-point buffers geometrically so inserts stay amortised O(batch)"""
+        needed = self._n + extra
+        capacity = len(self._counts)
+        if needed <= capacity:
+            return
+
+        capacity = max(needed, 2 * capacity, 1024)
+        self._xyz = np.resize(self._xyz, (capacity, 3))
+        self._weights = np.resize(self._weights, capacity)
+        self._counts = np.resize(self._counts, capacity)
+        self._core = np.resize(self._core, capacity)
+        self._anchor = np.resize(self._anchor, capacity)
+        self._parent = np.resize(self._parent, capacity)
+
+    def _cell(self, xyz):
+        """Integer grid cell keys of unit vectors"""
+        return np.floor(xyz / self.chord).astype(np.int64)
+
+    def _neighbours(self, i):
+        """Indices and chord distances of every point within eps of point i (itself included)"""
+        cx, cy, cz = self._cell(self._xyz[i])
+        candidates = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    cell = self._cells.get((cx + dx, cy + dy, cz + dz))
+                    if cell:
+                        candidates.extend(cell)
+
+        candidates = np.array(candidates, dtype=np.int64)
+        distances = np.linalg.norm(self._xyz[candidates] - self._xyz[i], axis=1)
+        within = distances <= self.chord
+        return candidates[within], distances[within]
+
+    def _find(self, i):
+        """Union-find root of a core point, with path halving"""
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _union(self, a, b, merged_labels):
+        """Link two core points; the merged cluster keeps the smaller existing id"""
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return
+
+        label_a = self._root_label.pop(root_a, None)
+        label_b = self._root_label.pop(root_b, None)
+        labels = [label for label in (label_a, label_b) if label is not None]
+        self._parent[root_b] = root_a
+        if labels:
+            self._root_label[root_a] = min(labels)
+            if len(labels) == 2:
+                merged_labels.add(max(labels))
+
+    def _store_points(self, lat, lon, sample_weight=None):
+        """Append unit vectors for radian coordinates and register them in the grid"""
+        batch = len(lat)
+        new = np.arange(self._n, self._n + batch)
+        self._reserve(batch)
+        cos_lat = np.cos(lat)
+        self._xyz[new] = np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+        self._weights[new] = 1.0 if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        self._counts[new] = 0
+        self._core[new] = False
+        self._anchor[new] = -1
+        self._parent[new] = new
+        self._n += batch
+
+        # Group the batch by cell so the grid is updated once per cell
+        if batch:
+            cells, inverse = np.unique(self._cell(self._xyz[new]), axis=0, return_inverse=True)
+            order = np.argsort(inverse.ravel(), kind='stable')
+            bounds = np.flatnonzero(np.r_[True, np.diff(inverse.ravel()[order]) != 0, True])
+            for cell, a, b in zip(map(tuple, cells), bounds[:-1], bounds[1:]):
+                self._cells[cell].extend(new[order[a:b]].tolist())
+        return new
+
+    def fit(self, latitudes, longitudes, labels=None, sample_weight=None):
+        """
+        Seed the engine with history in one vectorized pass
+
+        The initial structure comes from the BallTree DBSCAN, so seeding a
+        large history costs the same as a batch clustering; later inserts are
+        incremental.
+
+        Args:
+            latitudes, longitudes: Coordinates of the existing points (degrees)
+            labels: Optional existing labelling of the same points with the same
+                parameters, whose cluster ids are kept
+            sample_weight: Optional weight of each point, counted towards min_samples
+
+        Returns:
+            self
+        """
+        if self._n:
+            raise ValueError("IncrementalDBSCAN can only be seeded while empty")
+
+        lat = np.radians(np.atleast_1d(np.asarray(latitudes, dtype=np.float64)))
+        lon = np.radians(np.atleast_1d(np.asarray(longitudes, dtype=np.float64)))
+        new = self._store_points(lat, lon, sample_weight)
+
+        structure = dbscan_structure(
+            latitudes, longitudes, self.eps, self.min_samples, sample_weight=sample_weight
+        )
+        is_core = structure['is_core']
+        self._counts[new] = structure['counts']
+        self._core[new] = is_core
+        self._anchor[new] = structure['anchor']
+
+        # Every core point points at the first core of its component
+        core_idx = np.flatnonzero(is_core)
+        components, first = np.unique(structure['component'][core_idx], return_index=True)
+        root_of_component = core_idx[first]
+        self._parent[core_idx] = root_of_component[np.searchsorted(components, structure['component'][core_idx])]
+
+        if labels is not None:
+            self.adopt_labels(labels)
+        else:
+            self._root_label = {int(root): i for i, root in enumerate(root_of_component)}
+            self._next_label = len(root_of_component)
+        return self
+
+    def insert(self, latitudes, longitudes, sample_weight=None):
+        """
+        Add a batch of points and update the cluster structure around them
+
+        Args:
+            latitudes, longitudes: Coordinates of the new points (degrees)
+            sample_weight: Optional weight of each new point
+
+        Returns:
+            Tuple (new_indices, changed_labels): positions of the inserted points
+            and the ids of every cluster that was created, grew or merged away
+        """
+        lat = np.radians(np.atleast_1d(np.asarray(latitudes, dtype=np.float64)))
+        lon = np.radians(np.atleast_1d(np.asarray(longitudes, dtype=np.float64)))
+        start = self._n
+        new = self._store_points(lat, lon, sample_weight)
+        if len(new) == 0:
+            return new, set()
+
+        # New points count their whole neighbourhood; old neighbours gain the new point's weight
+        neighbourhoods = {}
+        touched_old = []
+        for i in new:
+            nb, dist = self._neighbours(i)
+            neighbourhoods[i] = (nb, dist)
+            self._counts[i] = self._weights[nb].sum()
+            old = nb[nb < start]
+            self._counts[old] += self._weights[i]
+            touched_old.append(old)
+
+        touched_old = np.unique(np.concatenate(touched_old))
+        candidates = np.concatenate([new, touched_old])
+        promoted = candidates[(self._counts[candidates] >= self.min_samples) & ~self._core[candidates]]
+        self._core[promoted] = True
+        self._anchor[promoted] = promoted
+
+        # Link every promoted core to its core neighbours and claim unassigned neighbours as borders
+        merged_labels = set()
+        for c in promoted:
+            nb, _ = neighbourhoods.get(c) or self._neighbours(c)
+            for q in nb:
+                if q == c:
+                    continue
+                if self._core[q]:
+                    self._union(c, q, merged_labels)
+                elif self._anchor[q] < 0:
+                    self._anchor[q] = c
+
+        # New non-core points still unassigned join their nearest core neighbour
+        for i in new:
+            if self._core[i] or self._anchor[i] >= 0:
+                continue
+            nb, dist = neighbourhoods[i]
+            core = self._core[nb]
+            if core.any():
+                self._anchor[i] = nb[core][np.argmin(dist[core])]
+
+        # Components without an id are new clusters
+        changed = set(merged_labels)
+        for c in promoted:
+            root = self._find(c)
+            if root not in self._root_label:
+                self._root_label[root] = self._next_label
+                self._next_label += 1
+            changed.add(self._root_label[root])
+
+        anchored = self._anchor[new]
+        for anchor in np.unique(anchored[anchored >= 0]):
+            changed.add(self._root_label[self._find(anchor)])
+
+        return new, changed
+
+    def adopt_labels(self, labels):
+        """
+        Rename clusters to match an existing labelling of the same points
+
+        Used after seeding the engine with history that was already clustered
+        with the same parameters, so ids stay stable across the hand-over.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        roots = self._roots()
+        core = np.flatnonzero(self._core[:self._n])
+
+        self._root_label = {}
+        for root, label in zip(roots[core], labels[core]):
+            if root not in self._root_label and label >= 0:
+                self._root_label[int(root)] = int(label)
+
+        # Anything the old labelling did not cover gets a fresh id
+        self._next_label = max(int(labels.max()) if len(labels) else -1, -1) + 1
+        for root in np.unique(roots[core]):
+            if int(root) not in self._root_label:
+                self._root_label[int(root)] = self._next_label
+                self._next_label += 1
+
+    def _roots(self):
+        """Union-find roots of every point, resolved with vectorized pointer jumping"""
+        roots = self._parent[:self._n].copy()
+        while True:
+            jumped = roots[roots]
+            if np.array_equal(jumped, roots):
+                break
+            roots = jumped
+        self._parent[:self._n] = roots
+        return roots
+
+    def labels(self):
+        """
+        Current cluster id of every point, -1 for noise
+
+        Returns:
+            Integer array in insertion order
+        """
+        n = self._n
+        roots = self._roots()
+        label_of_root = np.full(n, -1, dtype=np.int64)
+        if self._root_label:
+            keys = np.fromiter(self._root_label.keys(), dtype=np.int64, count=len(self._root_label))
+            values = np.fromiter(self._root_label.values(), dtype=np.int64, count=len(self._root_label))
+            label_of_root[keys] = values
+
+        labels = np.full(n, -1, dtype=np.int64)
+        anchored = self._anchor[:n] >= 0
+        labels[anchored] = label_of_root[roots[self._anchor[:n][anchored]]]
+        return labels
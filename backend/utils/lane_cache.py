@@ -0,0 +1,204 @@
+import json
+import os
+import struct
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from utils.lane_store import LaneStore, lane_parts
+
+# Compiled lane file in the data directory
+LANE_CACHE_FILE = "standardized_shipping_lanes.lanes"
+
+# File layout, little endian, every section starting on an 8-byte boundary:
+#   header     magic, version, n_lanes, n_parts, n_vertices, metadata byte length
+#   metadata   UTF-8 JSON: per-lane dicts of every key but the geometry, and has_parts flags
+#   int64      lane_part_offsets (n_lanes + 1)
+#   int64      part_offsets (n_parts + 1)
+#   float64    coords (n_vertices, 2) of [lat, lon]
+_MAGIC = b'MWLANES\x00'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIxxxxqqqq')
+
+# Lane keys stored as geometry rather than as metadata
+_GEOMETRY_KEYS = ('coordinates', 'parts')
+
+
+def _aligned(offset):
+    return (offset + 7) // 8 * 8
+
+
+def _json_default(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+
+def write_lane_cache(shipping_lanes, path):
+    """
+    Compile standardized lanes into the binary lane cache
+
+    Empty parts are dropped, as in LaneStore, so a store built from the
+    cache matches one built from the lanes. Lanes backed by a LaneCache or
+    LaneArrays are written straight from their arrays. The file is written
+    beside the target and renamed over it, so processes that still map the
+    old file keep reading it intact.
+    """
+    if isinstance(shipping_lanes, CachedLanes):
+        source = shipping_lanes.cache
+        _write_arrays(
+            path, source.metadata, source.has_parts, source.lane_part_offsets, source.part_offsets, source.coords
+        )
+        return
+
+    metadata = []
+    has_parts = []
+    parts = []
+    lane_part_counts = []
+    for lane in shipping_lanes:
+        lane_arrays = [np.asarray(part, dtype=np.float64).reshape(-1, 2) for part in lane_parts(lane)]
+        lane_arrays = [part for part in lane_arrays if len(part)]
+        parts.extend(lane_arrays)
+        lane_part_counts.append(len(lane_arrays))
+        has_parts.append('parts' in lane)
+        metadata.append({k: lane[k] for k in lane if k not in _GEOMETRY_KEYS})
+
+    coords = np.concatenate(parts) if parts else np.empty((0, 2))
+    part_offsets = np.concatenate([[0], np.cumsum([len(part) for part in parts])])
+    lane_part_offsets = np.concatenate([[0], np.cumsum(lane_part_counts)])
+    _write_arrays(path, metadata, has_parts, lane_part_offsets, part_offsets, coords)
+
+
+def _write_arrays(path, metadata, has_parts, lane_part_offsets, part_offsets, coords):
+    meta_bytes = json.dumps(
+        {'lanes': list(metadata), 'has_parts': [bool(flag) for flag in has_parts]}, default=_json_default
+    ).encode('utf-8')
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(
+            _MAGIC, _VERSION, len(lane_part_offsets) - 1, len(part_offsets) - 1, len(coords), len(meta_bytes)
+        ))
+        f.write(meta_bytes)
+        arrays = (
+            np.asarray(lane_part_offsets, dtype='<i8'),
+            np.asarray(part_offsets, dtype='<i8'),
+            np.asarray(coords, dtype='<f8')
+        )
+        for array in arrays:
+            f.write(b'\x00' * (_aligned(f.tell()) - f.tell()))
+            f.write(array.tobytes())
+    os.replace(temp_path, path)
+
+
+class LaneGeometry:
+    """
+    Lanes laid out as LaneStore keeps them, with per-lane metadata
+
+    Subclasses provide ``coords``, ``part_offsets``, ``lane_part_offsets``,
+    ``metadata`` (per-lane dicts of every key but the geometry) and
+    ``has_parts`` (whether each lane carries 'parts').
+    """
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def lane_parts(self, lane_id):
+        """[lat, lon] vertex lists of every part of a lane"""
+        first, last = self.lane_part_offsets[lane_id], self.lane_part_offsets[lane_id + 1]
+        return [
+            self.coords[self.part_offsets[p]:self.part_offsets[p + 1]].tolist() for p in range(first, last)
+        ]
+
+    def lanes(self):
+        """The lanes as a sequence of standardized lane mappings, materialized on access"""
+        return CachedLanes(self)
+
+    def lane_store(self):
+        """LaneStore over the coordinate buffer, without copying it"""
+        names = [lane.get('name', f"Lane {i}") for i, lane in enumerate(self.metadata)]
+        return LaneStore.from_arrays(self.coords, self.part_offsets, self.lane_part_offsets, names)
+
+
+class LaneCache(LaneGeometry):
+    """
+    Read-only view of a compiled lane file
+
+    The offset and coordinate arrays are ``numpy.memmap`` views of the file,
+    so opening costs a header read and a metadata parse, and every process
+    that opens the same file shares its pages through the OS page cache.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, version, n_lanes, n_parts, n_vertices, meta_length = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"Not a lane cache file (version {_VERSION}): {path}")
+            meta = json.loads(f.read(meta_length).decode('utf-8'))
+
+        self.metadata = meta['lanes']
+        self.has_parts = meta['has_parts']
+
+        offset = _aligned(_HEADER.size + meta_length)
+        self.lane_part_offsets = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(n_lanes + 1,))
+        offset = _aligned(offset + self.lane_part_offsets.nbytes)
+        self.part_offsets = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(n_parts + 1,))
+        offset = _aligned(offset + self.part_offsets.nbytes)
+        if n_vertices:
+            self.coords = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(n_vertices, 2))
+        else:
+            # A zero-length memmap is not allowed
+            self.coords = np.empty((0, 2))
+
+
+class CachedLane(Mapping):
+    """
+    A standardized lane backed by a LaneCache or LaneArrays
+
+    Metadata is read from the cache's table; 'coordinates' and 'parts' are
+    built from the coordinate buffer each time they are looked up, so
+    lanes that are only listed or named never copy their geometry.
+    """
+
+    def __init__(self, cache, lane_id):
+        self._cache = cache
+        self._lane_id = lane_id
+        self._metadata = cache.metadata[lane_id]
+
+    def _geometry_keys(self):
+        return _GEOMETRY_KEYS if self._cache.has_parts[self._lane_id] else _GEOMETRY_KEYS[:1]
+
+    def __getitem__(self, key):
+        if key in self._geometry_keys():
+            parts = self._cache.lane_parts(self._lane_id)
+            if key == 'parts':
+                return parts
+            return parts[0] if parts else []
+        return self._metadata[key]
+
+    def __contains__(self, key):
+        return key in self._metadata or key in self._geometry_keys()
+
+    def __iter__(self):
+        yield from self._metadata
+        yield from self._geometry_keys()
+
+    def __len__(self):
+        return len(self._metadata) + len(self._geometry_keys())
+
+
+class CachedLanes(Sequence):
+    """Sequence of CachedLane over every lane of a LaneCache or LaneArrays"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("lane index out of range")
+        return CachedLane(self.cache, index)
@@ -0,0 +1,144 @@
+import numpy as np
+from shapely import STRtree, box
+
+from utils.geodesy import (
+    EARTH_RADIUS_KM,
+    point_to_segment_distance_km,
+    segment_latitude_range
+)
+
+# Great-circle length of one degree of latitude (km)
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+
+def search_envelopes(lats, lons, distance_km):
+    """
+    Lon/lat boxes guaranteed to contain everything within distance_km of each point
+
+    Boxes that would cross the antimeridian are split in two, and boxes that
+    reach a pole span all longitudes.
+
+    Returns:
+        Tuple (boxes, owner): shapely box array and the point index of each box
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    dlat = distance_km / KM_PER_DEGREE
+
+    min_lat = np.maximum(lats - dlat, -90.0)
+    max_lat = np.minimum(lats + dlat, 90.0)
+    widest = np.maximum(np.abs(min_lat), np.abs(max_lat))
+    polar = widest >= 89.999
+    dlon = np.where(polar, 180.0, dlat / np.cos(np.radians(np.where(polar, 0.0, widest))))
+    dlon = np.minimum(dlon, 180.0)
+
+    min_lon = np.where(polar, -180.0, lons - dlon)
+    max_lon = np.where(polar, 180.0, lons + dlon)
+    owner = np.arange(len(lats))
+
+    # Wrap the part of the box that spills past +/-180 onto the other side
+    west = min_lon < -180.0
+    east = max_lon > 180.0
+    extra_min = np.concatenate([min_lon[west] + 360.0, np.full(east.sum(), -180.0)])
+    extra_max = np.concatenate([np.full(west.sum(), 180.0), max_lon[east] - 360.0])
+    extra_lat_min = np.concatenate([min_lat[west], min_lat[east]])
+    extra_lat_max = np.concatenate([max_lat[west], max_lat[east]])
+    extra_owner = np.concatenate([owner[west], owner[east]])
+
+    boxes = box(
+        np.concatenate([np.maximum(min_lon, -180.0), extra_min]),
+        np.concatenate([min_lat, extra_lat_min]),
+        np.concatenate([np.minimum(max_lon, 180.0), extra_max]),
+        np.concatenate([max_lat, extra_lat_max])
+    )
+    return boxes, np.concatenate([owner, extra_owner])
+
+
+class LaneSegmentIndex:
+    """STRtree over the individual segments of every shipping lane"""
+
+    def __init__(self, starts, ends, segment_lane, n_lanes):
+        """
+        Build the index over flattened lane segments
+
+        Args:
+            starts, ends: (m, 2) arrays of [lat, lon] segment endpoints
+            segment_lane: Lane index of each segment
+            n_lanes: Total number of lanes
+        """
+        self.n_lanes = n_lanes
+        self.starts = starts
+        self.ends = ends
+        self.segment_lane = segment_lane
+
+        # Segments are indexed by lon/lat boxes that cover the whole great-circle
+        # arc; arcs crossing the antimeridian get one box on each side
+        min_lat, max_lat = segment_latitude_range(self.starts, self.ends)
+        lon_a, lon_b = self.starts[:, 1], self.ends[:, 1]
+        min_lon, max_lon = np.minimum(lon_a, lon_b), np.maximum(lon_a, lon_b)
+        wraps = (max_lon - min_lon) > 180.0
+        owner = np.arange(len(self.starts))
+
+        self.boxes = box(
+            np.concatenate([np.where(wraps, max_lon, min_lon), np.full(wraps.sum(), -180.0)]),
+            np.concatenate([min_lat, min_lat[wraps]]),
+            np.concatenate([np.where(wraps, 180.0, max_lon), min_lon[wraps]]),
+            np.concatenate([max_lat, max_lat[wraps]])
+        )
+        self.box_segment = np.concatenate([owner, owner[wraps]])
+        self.tree = STRtree(self.boxes)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def candidate_segments(self, lats, lons, distance_km):
+        """
+        Segments whose bounding box intersects each point's search envelope
+
+        Returns:
+            Tuple (point_idx, segment_idx) of candidate pairs
+        """
+        if len(self.starts) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        boxes, owner = search_envelopes(lats, lons, distance_km)
+        envelope_idx, box_idx = self.tree.query(boxes)
+        pairs = np.unique(np.column_stack([owner[envelope_idx], self.box_segment[box_idx]]), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def lanes_within(self, lats, lons, distance_km):
+        """
+        Minimum distance to every lane that comes within distance_km of each point
+
+        Only candidate segments from the tree are measured, so the cost follows
+        the number of near-misses rather than points x lanes.
+
+        Args:
+            lats, lons: Point coordinates (degrees)
+            distance_km: Search radius (km)
+
+        Returns:
+            Tuple (point_idx, lane_idx, distance_km) ordered by point, then lane
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        point_idx, segment_idx = self.candidate_segments(lats, lons, distance_km)
+
+        distances = point_to_segment_distance_km(
+            lats[point_idx], lons[point_idx],
+            self.starts[segment_idx, 0], self.starts[segment_idx, 1],
+            self.ends[segment_idx, 0], self.ends[segment_idx, 1]
+        )
+        hit = distances <= distance_km
+        point_idx = point_idx[hit]
+        lane_idx = self.segment_lane[segment_idx[hit]]
+        distances = distances[hit]
+
+        if len(point_idx) == 0:
+            return point_idx, lane_idx, distances
+
+        # Reduce segment hits to the closest segment per (point, lane)
+        order = np.lexsort((distances, lane_idx, point_idx))
+        point_idx, lane_idx, distances = point_idx[order], lane_idx[order], distances[order]
+        first = np.r_[True, (point_idx[1:] != point_idx[:-1]) | (lane_idx[1:] != lane_idx[:-1])]
+        return point_idx[first], lane_idx[first], distances[first]
@@ -0,0 +1,225 @@
+import numpy as np
+import shapely
+
+from utils.lane_index import LaneSegmentIndex
+
+# Zoom levels with a precomputed simplification; each level serves its own zoom
+# and the next one, and zooms from FULL_RESOLUTION_ZOOM up get every vertex
+SIMPLIFY_ZOOMS = (0, 2, 4, 6, 8, 10)
+FULL_RESOLUTION_ZOOM = 12
+
+
+def simplify_tolerance(zoom, tile_size=256):
+    """Douglas-Peucker tolerance (degrees) of one pixel at the given zoom, measured at the equator"""
+    return 360.0 / (tile_size * 2 ** zoom)
+
+
+def lane_parts(lane):
+    """
+    All vertex lists of a standardized lane
+
+    Lanes parsed from a MultiLineString carry every part under 'parts'; plain
+    lanes only have 'coordinates'.
+    """
+    parts = lane.get('parts')
+    if parts:
+        return parts
+    coordinates = lane.get('coordinates', [])
+    return [coordinates] if len(coordinates) else []
+
+
+class LaneStore:
+    """
+    Shipping lane geometry compiled once per upload
+
+    Vertices of every lane part live in one contiguous float64 buffer of
+    [lat, lon] rows. ``part_offsets`` delimits the parts in that buffer and
+    ``lane_part_offsets`` delimits the parts of each lane, so all vertices and
+    all segments of a lane are contiguous slices. Alongside the buffer the
+    store keeps per-lane bounding boxes, lon/lat views of every part for
+    drawing, the flattened segment arrays and their STRtree index, and
+    Douglas-Peucker simplified copies of every part for overview zoom levels.
+    """
+
+    def __init__(self, shipping_lanes):
+        self.n_lanes = len(shipping_lanes)
+        self.names = [lane.get('name', f"Lane {i}") for i, lane in enumerate(shipping_lanes)]
+
+        parts = []
+        part_lane = []
+        lane_part_counts = np.zeros(self.n_lanes, dtype=np.int64)
+        for lane_id, lane in enumerate(shipping_lanes):
+            for part in lane_parts(lane):
+                part = np.asarray(part, dtype=np.float64).reshape(-1, 2)
+                if len(part):
+                    parts.append(part)
+                    part_lane.append(lane_id)
+                    lane_part_counts[lane_id] += 1
+
+        part_lengths = np.array([len(p) for p in parts], dtype=np.int64)
+        self.coords = np.concatenate(parts) if parts else np.empty((0, 2))
+        self.part_offsets = np.concatenate([[0], np.cumsum(part_lengths)])
+        self.part_lane = np.array(part_lane, dtype=np.int64)
+        self.lane_part_offsets = np.concatenate([[0], np.cumsum(lane_part_counts)])
+        self._build()
+
+    @classmethod
+    def from_arrays(cls, coords, part_offsets, lane_part_offsets, names):
+        """
+        Store over geometry that is already laid out as the store keeps it
+
+        ``coords`` is used as is, so a read-only memmap (see LaneCache) stays
+        shared rather than copied. Every part must have at least one vertex.
+        """
+        store = cls.__new__(cls)
+        store.n_lanes = len(lane_part_offsets) - 1
+        store.names = list(names)
+        store.coords = coords
+        store.part_offsets = np.asarray(part_offsets, dtype=np.int64)
+        store.lane_part_offsets = np.asarray(lane_part_offsets, dtype=np.int64)
+        store.part_lane = np.repeat(np.arange(store.n_lanes), np.diff(store.lane_part_offsets))
+        store._build()
+        return store
+
+    def _build(self):
+        """Derive segments, bounds, lon/lat views, simplifications and the index from the vertex buffer"""
+        part_lengths = np.diff(self.part_offsets)
+        self._build_segments(part_lengths)
+        self._build_bounds()
+        self._build_lonlat_parts()
+        self._build_simplified()
+
+        self.index = LaneSegmentIndex(self.starts, self.ends, self.segment_lane, self.n_lanes)
+
+    def _build_segments(self, part_lengths):
+        """Segment endpoint arrays; single-vertex parts become zero-length segments"""
+        # Every vertex except the last of its part starts a segment
+        is_last = np.zeros(len(self.coords), dtype=bool)
+        is_last[self.part_offsets[1:] - 1] = True
+        start_idx = np.flatnonzero(~is_last)
+        end_idx = start_idx + 1
+
+        single = self.part_offsets[:-1][part_lengths == 1]
+        start_idx = np.concatenate([start_idx, single])
+        end_idx = np.concatenate([end_idx, single])
+        order = np.argsort(start_idx, kind='stable')
+        start_idx, end_idx = start_idx[order], end_idx[order]
+
+        vertex_lane = np.repeat(self.part_lane, part_lengths)
+        self.segment_vertex = start_idx
+        self.starts = self.coords[start_idx]
+        self.ends = self.coords[end_idx]
+        self.segment_lane = vertex_lane[start_idx] if len(start_idx) else np.empty(0, dtype=np.int64)
+        self.lane_segment_offsets = np.searchsorted(self.segment_lane, np.arange(self.n_lanes + 1))
+
+    def _build_bounds(self):
+        """Per-lane (min_lon, min_lat, max_lon, max_lat); NaN for lanes without vertices"""
+        self.bboxes = np.full((self.n_lanes, 4), np.nan)
+        vertex_starts = self.part_offsets[self.lane_part_offsets]
+        has_vertices = vertex_starts[1:] > vertex_starts[:-1]
+        if not has_vertices.any():
+            return
+
+        starts = vertex_starts[:-1][has_vertices]
+        lat, lon = self.coords[:, 0], self.coords[:, 1]
+        self.bboxes[has_vertices] = np.column_stack([
+            np.minimum.reduceat(lon, starts),
+            np.minimum.reduceat(lat, starts),
+            np.maximum.reduceat(lon, starts),
+            np.maximum.reduceat(lat, starts)
+        ])
+
+    def _build_lonlat_parts(self):
+        """Per-part lon/lat views of the vertex buffer for drawing"""
+        self.lonlat_parts = [
+            self.coords[a:b, ::-1] for a, b in zip(self.part_offsets[:-1], self.part_offsets[1:])
+        ]
+
+    def _build_simplified(self):
+        """
+        Simplified lon/lat parts for every zoom in SIMPLIFY_ZOOMS
+
+        Each level is simplified at one pixel of the next zoom, so the error
+        stays under a pixel at both zooms the level serves. Parts keep their
+        order and endpoints, so levels line up with ``lonlat_parts``.
+        """
+        part_lengths = np.diff(self.part_offsets)
+        line_part = np.flatnonzero(part_lengths > 1)
+        vertex_part = np.repeat(np.arange(len(part_lengths)), part_lengths)
+        in_line = part_lengths[vertex_part] > 1
+        geometries = shapely.linestrings(
+            self.coords[in_line, ::-1], indices=np.searchsorted(line_part, vertex_part[in_line])
+        ) if len(line_part) else np.empty(0, dtype=object)
+
+        self.simplified = {}
+        for zoom in SIMPLIFY_ZOOMS:
+            parts = list(self.lonlat_parts)
+            simplified = shapely.simplify(geometries, simplify_tolerance(zoom + 1), preserve_topology=False)
+            coords, index = shapely.get_coordinates(simplified, return_index=True)
+            bounds = np.searchsorted(index, np.arange(len(line_part) + 1))
+            for i, part_id in enumerate(line_part):
+                parts[part_id] = coords[bounds[i]:bounds[i + 1]]
+            self.simplified[zoom] = parts
+
+    def parts_for_zoom(self, zoom):
+        """Lon/lat vertex arrays of every part at the detail suited to a map zoom"""
+        if zoom is None or zoom >= FULL_RESOLUTION_ZOOM:
+            return self.lonlat_parts
+        level = max([z for z in SIMPLIFY_ZOOMS if z <= zoom], default=SIMPLIFY_ZOOMS[0])
+        return self.simplified[level]
+
+    def zoom_levels(self):
+        """Dict mapping the minimum zoom of every level of detail to its lon/lat parts"""
+        levels = {zoom: self.simplified[zoom] for zoom in SIMPLIFY_ZOOMS}
+        levels[FULL_RESOLUTION_ZOOM] = self.lonlat_parts
+        return levels
+
+    def lanes_in_bbox(self, bbox):
+        """
+        Lanes whose bounding box intersects a lon/lat box
+
+        Args:
+            bbox: (min_lon, min_lat, max_lon, max_lat); min_lon > max_lon wraps
+                across the antimeridian
+
+        Returns:
+            Array of lane indices
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        lane_min_lon, lane_min_lat, lane_max_lon, lane_max_lat = self.bboxes.T
+        in_lat = (lane_min_lat <= max_lat) & (lane_max_lat >= min_lat)
+        if min_lon <= max_lon:
+            in_lon = (lane_min_lon <= max_lon) & (lane_max_lon >= min_lon)
+        else:
+            in_lon = (lane_max_lon >= min_lon) | (lane_min_lon <= max_lon)
+        return np.flatnonzero(in_lat & in_lon)
+
+    def __len__(self):
+        return self.n_lanes
+
+    def has_vertices(self, lane_id):
+        """Whether the lane has at least one vertex"""
+        first, last = self.lane_part_offsets[lane_id], self.lane_part_offsets[lane_id + 1]
+        return self.part_offsets[last] > self.part_offsets[first]
+
+    def vertex_range(self, lane_id):
+        """(start, stop) rows of the lane's vertices in ``coords``"""
+        return (
+            self.part_offsets[self.lane_part_offsets[lane_id]],
+            self.part_offsets[self.lane_part_offsets[lane_id + 1]]
+        )
+
+    def lane_vertices(self, lane_id):
+        """View of every [lat, lon] vertex of a lane, all parts back to back"""
+        start, stop = self.vertex_range(lane_id)
+        return self.coords[start:stop]
+
+    def split_parts(self, lane_id, vertices):
+        """Split a lane-shaped vertex array (e.g. a modified copy) back into its parts"""
+        first, last = self.lane_part_offsets[lane_id], self.lane_part_offsets[lane_id + 1]
+        bounds = self.part_offsets[first:last + 1] - self.part_offsets[first]
+        return [vertices[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def lanes_within(self, lats, lons, distance_km):
+        """Lanes within distance_km of each point; see ``LaneSegmentIndex.lanes_within``"""
+        return self.index.lanes_within(lats, lons, distance_km)
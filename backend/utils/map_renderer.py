@@ -0,0 +1,191 @@
+import io
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+# Overview map layout: figure size (inches), resolution and a fixed axes
+# rectangle, so the cached base image and each overlay line up pixel for pixel
+MAP_FIGSIZE = (12, 8)
+MAP_DPI = 100
+MAP_AXES_RECT = (0.08, 0.08, 0.88, 0.84)
+
+
+class FigurePool:
+    """
+    Reusable Agg figures of one size
+
+    Each figure is handed to one thread at a time and cleared on return, so
+    renders never share matplotlib state. Borrowing blocks while every
+    figure is in use.
+    """
+
+    def __init__(self, size, figsize, dpi):
+        self._figures = queue.LifoQueue()
+        for _ in range(size):
+            fig = Figure(figsize=figsize, dpi=dpi)
+            FigureCanvasAgg(fig)
+            self._figures.put(fig)
+
+    @contextmanager
+    def figure(self):
+        fig = self._figures.get()
+        try:
+            yield fig
+        finally:
+            fig.clear()
+            self._figures.put(fig)
+
+
+class MapRenderer:
+    """
+    Renders maps on a bounded thread pool with pooled Agg figures
+
+    Nothing here touches ``matplotlib.pyplot``, so renders are independent
+    of each other and of the request threads. At most max_workers renders
+    run at once and at most max_pending more wait in the queue; further
+    submissions block until a slot frees up. Static layers are rasterised
+    once and kept as base images keyed by the caller.
+    """
+
+    def __init__(self, max_workers=4, max_pending=16, max_base_images=8):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='map-render')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._base_images = OrderedDict()
+        self._base_lock = threading.Lock()
+        self.max_base_images = max_base_images
+
+    def _pool(self, figsize, dpi):
+        key = (tuple(figsize), dpi)
+        with self._pools_lock:
+            if key not in self._pools:
+                self._pools[key] = FigurePool(self.max_workers, figsize, dpi)
+            return self._pools[key]
+
+    def submit(self, draw, figsize, dpi, *args):
+        """
+        Run draw(fig, *args) on a pooled figure in the executor
+
+        Returns:
+            Future resolving to whatever draw returns
+        """
+        self._slots.acquire()
+
+        def run():
+            with self._pool(figsize, dpi).figure() as fig:
+                return draw(fig, *args)
+
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def base_image(self, key, draw, figsize, dpi, *args):
+        """
+        RGBA raster of a static layer, drawn with draw(fig, *args) on first use
+
+        Called from inside a render, so it draws on a figure of its own rather
+        than waiting on the pool its caller may have drained.
+        """
+        with self._base_lock:
+            image = self._base_images.get(key)
+            if image is not None:
+                self._base_images.move_to_end(key)
+                return image
+
+        fig = Figure(figsize=figsize, dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        draw(fig, *args)
+        canvas.draw()
+        image = np.asarray(canvas.buffer_rgba()).copy()
+
+        with self._base_lock:
+            self._base_images[key] = image
+            while len(self._base_images) > self.max_base_images:
+                self._base_images.popitem(last=False)
+        return image
+
+
+def map_extent(lane_bboxes, lons, lats, step=5.0):
+    """
+    Lon/lat limits of the overview map, snapped outward to a step-degree grid
+
+    Snapping keeps the extent (and so the cached base image) stable while
+    data changes stay inside the same grid cells.
+
+    Returns:
+        Tuple (min_lon, max_lon, min_lat, max_lat)
+    """
+    lon_values = np.concatenate([lane_bboxes[:, 0], lane_bboxes[:, 2], np.asarray(lons, dtype=np.float64)])
+    lat_values = np.concatenate([lane_bboxes[:, 1], lane_bboxes[:, 3], np.asarray(lats, dtype=np.float64)])
+    lon_values = lon_values[np.isfinite(lon_values)]
+    lat_values = lat_values[np.isfinite(lat_values)]
+    if len(lon_values) == 0:
+        return (-180.0, 180.0, -90.0, 90.0)
+
+    min_lon, max_lon = lon_values.min(), lon_values.max()
+    min_lat, max_lat = lat_values.min(), lat_values.max()
+    pad_lon = max(0.05 * (max_lon - min_lon), 1.0)
+    pad_lat = max(0.05 * (max_lat - min_lat), 1.0)
+    return (
+        float(max(np.floor((min_lon - pad_lon) / step) * step, -180.0)),
+        float(min(np.ceil((max_lon + pad_lon) / step) * step, 180.0)),
+        float(max(np.floor((min_lat - pad_lat) / step) * step, -90.0)),
+        float(min(np.ceil((max_lat + pad_lat) / step) * step, 90.0))
+    )
+
+
+def _map_axes(fig, extent):
+    """Axes at the fixed overview rectangle with the given lon/lat limits"""
+    ax = fig.add_axes(MAP_AXES_RECT)
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    return ax
+
+
+def draw_lane_base(fig, lonlat_parts, extent):
+    """Static layer of the overview map: frame, labels, grid and every shipping lane"""
+    fig.patch.set_facecolor('white')
+    ax = _map_axes(fig, extent)
+    ax.add_collection(LineCollection(lonlat_parts, colors='k', alpha=0.7, linewidths=2))
+    ax.set_title('Migration Clusters and Shipping Lanes')
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    ax.grid(True)
+
+
+def render_conflict_map(fig, renderer, base_key, lonlat_parts, extent, lons, lats, clusters, conflict_lons, conflict_lats):
+    """
+    Overview PNG: the cached lane base image with clusters and conflicts drawn on top
+
+    Cluster colours follow the default colour cycle by cluster id, as one
+    scatter per cluster would.
+
+    Returns:
+        PNG bytes
+    """
+    base = renderer.base_image(base_key, draw_lane_base, MAP_FIGSIZE, MAP_DPI, lonlat_parts, extent)
+    fig.figimage(base, zorder=-1)
+
+    ax = _map_axes(fig, extent)
+    ax.set_axis_off()
+    if len(lons):
+        ax.scatter(lons, lats, c=np.asarray(clusters) % 10, cmap='tab10', vmin=0, vmax=9, alpha=0.6)
+    if len(conflict_lons):
+        ax.scatter(conflict_lons, conflict_lats, color='red', marker='x', s=100, linewidth=2)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=MAP_DPI)
+    return buf.getvalue()
@@ -0,0 +1,186 @@
+import io
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.image import imsave
+from scipy.ndimage import gaussian_filter1d
+
+from utils.lane_index import KM_PER_DEGREE
+from utils.tiles import MERCATOR_RADIUS, TILE_SIZE, tile_bounds
+
+RISK_LAYERS = ('risk', 'density', 'proximity')
+
+
+def smooth_density(density, lat_centers, resolution, smoothing_km):
+    """
+    Gaussian smoothing of a global lat/lon grid with a kernel that stays round on the ground
+
+    Sigma is fixed along latitude and widens with 1/cos(latitude) along
+    longitude, which wraps around the globe.
+
+    Args:
+        density: (n_lat, n_lon) grid, rows south to north
+        lat_centers: Latitude of each row (degrees)
+        resolution: Cell size (degrees)
+        smoothing_km: Kernel standard deviation (km); 0 returns the grid unchanged
+    """
+    if smoothing_km <= 0:
+        return density
+
+    sigma_lat = smoothing_km / (KM_PER_DEGREE * resolution)
+    density = gaussian_filter1d(density, sigma_lat, axis=0, mode='nearest')
+
+    # Only rows with mass need the longitude pass
+    for i in np.flatnonzero(density.any(axis=1)):
+        cos_lat = max(np.cos(np.radians(lat_centers[i])), 1e-3)
+        sigma_lon = min(sigma_lat / cos_lat, density.shape[1] / 4)
+        density[i] = gaussian_filter1d(density[i], sigma_lon, mode='wrap')
+    return density
+
+
+class RiskRaster:
+    """
+    Global lat/lon raster of migration density, lane proximity and their product
+
+    Density is the count-weighted number of sightings per cell, smoothed with
+    a Gaussian of smoothing_km (wider in longitude towards the poles so the
+    kernel stays round on the ground) and scaled to [0, 1]. Proximity is
+    1 at a lane falling linearly to 0 at proximity_km, measured exactly from
+    each cell centre. Risk is density x proximity, so proximity is only
+    measured for cells that carry any density.
+
+    Rows run south to north and columns west to east; cell (i, j) spans
+    latitudes -90 + i*resolution onwards and longitudes -180 + j*resolution
+    onwards.
+    """
+
+    def __init__(self, lats, lons, weights, lane_store, resolution=0.25, smoothing_km=25, proximity_km=50,
+                 chunk_size=200000):
+        """
+        Args:
+            lats, lons: Migration point coordinates (degrees)
+            weights: Weight of each point (e.g. the 'count' column), or None
+            lane_store: LaneStore of the shipping lanes
+            resolution: Cell size (degrees)
+            smoothing_km: Standard deviation of the density kernel (km); 0 disables smoothing
+            proximity_km: Distance at which lane proximity reaches zero (km)
+            chunk_size: Cells measured against the lanes at once
+        """
+        self.resolution = resolution
+        self.smoothing_km = smoothing_km
+        self.proximity_km = proximity_km
+        self.n_lat = int(round(180 / resolution))
+        self.n_lon = int(round(360 / resolution))
+        self.lat_centers = -90 + (np.arange(self.n_lat) + 0.5) * 180 / self.n_lat
+        self.lon_centers = -180 + (np.arange(self.n_lon) + 0.5) * 360 / self.n_lon
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[valid]
+        density, _, _ = np.histogram2d(
+            lats[valid], lons[valid], bins=[self.n_lat, self.n_lon],
+            range=[[-90, 90], [-180, 180]], weights=weights
+        )
+        self.total_weight = float(density.sum())
+        density = smooth_density(density, self.lat_centers, resolution, smoothing_km)
+        peak = density.max()
+        self.density = (density / peak if peak > 0 else density).astype(np.float32)
+
+        self.proximity = np.zeros((self.n_lat, self.n_lon), dtype=np.float32)
+        rows, cols = np.nonzero(self.density > 1e-6)
+        for start in range(0, len(rows), chunk_size):
+            r, c = rows[start:start + chunk_size], cols[start:start + chunk_size]
+            cell_idx, _, distances = lane_store.lanes_within(self.lat_centers[r], self.lon_centers[c], proximity_km)
+            nearest = np.full(len(r), np.inf)
+            np.minimum.at(nearest, cell_idx, distances)
+            self.proximity[r, c] = np.clip(1 - nearest / proximity_km, 0, 1)
+
+        self.risk = self.density * self.proximity
+
+    def layer(self, name):
+        if name not in RISK_LAYERS:
+            raise ValueError(f"Unknown raster layer: {name}")
+        return getattr(self, name)
+
+    def grid(self, name='risk', bbox=None, max_cells=40000):
+        """
+        A layer cropped to a bbox and block-max downsampled to at most max_cells
+
+        Args:
+            name: 'risk', 'density' or 'proximity'
+            bbox: Optional (min_lon, min_lat, max_lon, max_lat)
+            max_cells: Upper bound on rows x columns returned
+
+        Returns:
+            Dict with 'values' (rows south to north), 'bounds' of the returned
+            cells, 'resolution' in degrees per returned cell and 'max'
+        """
+        values = self.layer(name)
+        row0, row1, col0, col1 = 0, self.n_lat, 0, self.n_lon
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            row0 = int(np.clip(np.floor((min_lat + 90) / self.resolution), 0, self.n_lat - 1))
+            row1 = int(np.clip(np.ceil((max_lat + 90) / self.resolution), row0 + 1, self.n_lat))
+            col0 = int(np.clip(np.floor((min_lon + 180) / self.resolution), 0, self.n_lon - 1))
+            col1 = int(np.clip(np.ceil((max_lon + 180) / self.resolution), col0 + 1, self.n_lon))
+        values = values[row0:row1, col0:col1]
+
+        # Block maximum keeps hot spots visible at coarse resolution
+        factor = max(1, int(np.ceil(np.sqrt(values.size / max_cells))))
+        if factor > 1:
+            pad_rows = -values.shape[0] % factor
+            pad_cols = -values.shape[1] % factor
+            padded = np.pad(values, ((0, pad_rows), (0, pad_cols)))
+            values = padded.reshape(
+                padded.shape[0] // factor, factor, padded.shape[1] // factor, factor
+            ).max(axis=(1, 3))
+
+        return {
+            'values': values,
+            'bounds': [
+                -180 + col0 * self.resolution,
+                -90 + row0 * self.resolution,
+                -180 + min(col0 + values.shape[1] * factor, self.n_lon) * self.resolution,
+                -90 + min(row0 + values.shape[0] * factor, self.n_lat) * self.resolution
+            ],
+            'resolution': self.resolution * factor,
+            'max': float(values.max()) if values.size else 0.0
+        }
+
+    def sample(self, name, lats, lons):
+        """Nearest-cell values of a layer at the given coordinates"""
+        rows = np.clip(((np.asarray(lats) + 90) / self.resolution).astype(np.int64), 0, self.n_lat - 1)
+        cols = np.clip(((np.asarray(lons) + 180) / self.resolution).astype(np.int64), 0, self.n_lon - 1)
+        return self.layer(name)[rows, cols]
+
+
+def render_heatmap_tile(raster, z, x, y, name='risk', cmap='inferno'):
+    """
+    PNG heatmap tile of a raster layer in Web Mercator
+
+    Every tile pixel samples the raster cell under its centre; opacity follows
+    the value so empty cells stay transparent. Values are scaled by the layer
+    maximum, so all tiles of one raster share a colour scale.
+
+    Returns:
+        PNG bytes
+    """
+    min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+    step = (max_x - min_x) / TILE_SIZE
+    px = min_x + (np.arange(TILE_SIZE) + 0.5) * step
+    py = max_y - (np.arange(TILE_SIZE) + 0.5) * step
+    lons = np.degrees(px / MERCATOR_RADIUS)
+    lats = np.degrees(2 * np.arctan(np.exp(py / MERCATOR_RADIUS)) - np.pi / 2)
+
+    values = raster.sample(name, lats[:, None], lons[None, :])
+    peak = raster.layer(name).max()
+    scaled = values / peak if peak > 0 else values
+
+    rgba = colormaps[cmap](scaled)
+    rgba[..., 3] = np.clip(scaled * 1.5, 0, 0.85)
+
+    buf = io.BytesIO()
+    imsave(buf, rgba, format='png')
+    return buf.getvalue()
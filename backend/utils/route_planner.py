@@ -0,0 +1,302 @@
+import heapq
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import shapely
+from scipy.ndimage import distance_transform_edt
+
+from utils.geodesy import EARTH_RADIUS_KM, haversine_km
+from utils.lane_index import KM_PER_DEGREE
+from utils.risk_raster import smooth_density
+
+class CostGrid:
+    """
+    Global lat/lon grid of per-km travel cost for rerouting lanes
+
+    A cell costs 1, plus density_weight times the smoothed and normalised
+    density of clustered sightings, plus avoid_weight within avoid_km of
+    any avoided point (conflict cluster centres). Alongside the costs the
+    grid keeps the tables A* needs: great-circle step lengths between
+    neighbouring cell centres per row, and radians and cosines of every
+    row and column for the distance-to-goal heuristic. All of it depends
+    only on the migration data and conflicts, so one grid serves every
+    lane until those change.
+    """
+
+    def __init__(self, lats, lons, weights, avoid_lats, avoid_lons, avoid_km, resolution=0.1,
+                 density_weight=4.0, avoid_weight=20.0):
+        """
+        Args:
+            lats, lons: Clustered sighting coordinates (degrees)
+            weights: Weight of each sighting, or None
+            avoid_lats, avoid_lons: Centres of zones to keep avoid_km away from
+            avoid_km: Radius of the avoided zones and smoothing of the density (km)
+            resolution: Cell size (degrees)
+            density_weight: Extra cost per km at the densest cell
+            avoid_weight: Extra cost per km inside an avoided zone
+        """
+        self.resolution = resolution
+        self.n_lat = int(round(180 / resolution))
+        self.n_lon = int(round(360 / resolution))
+        self.lat_centers = -90 + (np.arange(self.n_lat) + 0.5) * 180 / self.n_lat
+        self.lon_centers = -180 + (np.arange(self.n_lon) + 0.5) * 360 / self.n_lon
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        density, _, _ = np.histogram2d(
+            lats, lons, bins=[self.n_lat, self.n_lon], range=[[-90, 90], [-180, 180]], weights=weights
+        )
+        density = smooth_density(density, self.lat_centers, resolution, avoid_km)
+        peak = density.max()
+        cost = 1 + density_weight * (density / peak if peak > 0 else density)
+
+        for lat, lon in zip(avoid_lats, avoid_lons):
+            rows, cols = self.cells_within(lat, lon, avoid_km)
+            cost[rows, cols] += avoid_weight
+        self.cost = cost.astype(np.float32)
+
+        # Step lengths: along each row, and from each row to the next straight and diagonally
+        self.east_km = haversine_km(self.lat_centers, 0.0, self.lat_centers, resolution)
+        self.north_km = haversine_km(self.lat_centers[:-1], 0.0, self.lat_centers[1:], 0.0)
+        self.diagonal_km = haversine_km(self.lat_centers[:-1], 0.0, self.lat_centers[1:], resolution)
+
+        # Heuristic tables
+        self.lat_rad = np.radians(self.lat_centers)
+        self.cos_lat = np.cos(self.lat_rad)
+        self.lon_rad = np.radians(self.lon_centers)
+
+    def cells_within(self, lat, lon, distance_km):
+        """Row and (wrapped) column indices of the cells whose centre is within distance_km of a point"""
+        dlat = distance_km / KM_PER_DEGREE
+        row0 = max(int((lat - dlat + 90) / self.resolution), 0)
+        row1 = min(int((lat + dlat + 90) / self.resolution) + 1, self.n_lat)
+        widest = min(max(abs(lat - dlat), abs(lat + dlat)), 89.9)
+        dlon = min(dlat / np.cos(np.radians(widest)), 180.0)
+        col0 = int(np.floor((lon - dlon + 180) / self.resolution))
+        col1 = int(np.floor((lon + dlon + 180) / self.resolution)) + 1
+        if col1 - col0 > self.n_lon:
+            col0, col1 = 0, self.n_lon
+
+        rows, cols = np.meshgrid(np.arange(row0, row1), np.arange(col0, col1) % self.n_lon, indexing='ij')
+        inside = haversine_km(lat, lon, self.lat_centers[rows], self.lon_centers[cols]) <= distance_km
+        return rows[inside], cols[inside]
+
+    def cell(self, lat, lon):
+        """Row and column of the cell containing a point"""
+        row = min(max(int((lat + 90) / self.resolution), 0), self.n_lat - 1)
+        col = int(np.floor((lon + 180) / self.resolution)) % self.n_lon
+        return row, col
+
+
+def _astar(cost, heuristic, moves, start, goal):
+    """
+    A* over a flattened 8-connected grid
+
+    Moving between neighbouring cells costs the great-circle step length
+    times the mean of both cells' costs; cells costing ``inf`` are blocked.
+    The grid must be bordered by blocked cells, so moves never leave it.
+
+    Args:
+        cost, heuristic: Flat lists of cell costs and lower bounds on the cost to the goal
+        moves: Per grid row, the (flat offset, step length in km) of all eight moves
+        start, goal: Flat cell indices
+
+    Returns:
+        List of flat cell indices from start to goal, or None if the goal is unreachable
+    """
+    width = len(cost) // len(moves)
+    best = [math.inf] * len(cost)
+    parent = [-1] * len(cost)
+    closed = bytearray(len(cost))
+    best[start] = 0.0
+    heap = [(heuristic[start], start)]
+
+    while heap:
+        _, node = heapq.heappop(heap)
+        if node == goal:
+            path = [node]
+            while path[-1] != start:
+                path.append(parent[path[-1]])
+            return path[::-1]
+        if closed[node]:
+            continue
+        closed[node] = 1
+
+        travelled = best[node]
+        node_cost = cost[node]
+        for offset, step in moves[node // width]:
+            neighbour = node + offset
+            neighbour_cost = cost[neighbour]
+            if closed[neighbour] or neighbour_cost == math.inf:
+                continue
+            candidate = travelled + step * (node_cost + neighbour_cost) / 2
+            if candidate < best[neighbour]:
+                best[neighbour] = candidate
+                parent[neighbour] = node
+                heapq.heappush(heap, (candidate + heuristic[neighbour], neighbour))
+
+    return None
+
+
+def plan_detour(grid, stretch, max_deviation_km, deviation_weight=0.5):
+    """
+    Least-cost replacement for a stretch of lane, keeping both of its ends
+
+    The search runs in a window around the stretch. Cells further than
+    max_deviation_km from the original stretch are blocked, and the rest
+    pay deviation_weight per km travelled at the full deviation, so
+    detours stay close to the known route unless the grid's costs push
+    them out. There is no land mask; staying in this corridor is what keeps
+    the detour in plausible water.
+
+    Args:
+        grid: CostGrid
+        stretch: (k, 2) array of [lat, lon] vertices of the original stretch
+        max_deviation_km: Corridor half-width (km)
+        deviation_weight: Extra cost per km at the corridor edge
+
+    Returns:
+        (m, 2) array of [lat, lon] vertices from the first to the last vertex
+        of the stretch, or None if no path exists inside the corridor
+    """
+    res = grid.resolution
+    lats = stretch[:, 0]
+    lons = np.degrees(np.unwrap(np.radians(stretch[:, 1])))
+
+    pad_lat = max_deviation_km / KM_PER_DEGREE + res
+    row0 = max(int((lats.min() - pad_lat + 90) / res), 0)
+    row1 = min(int((lats.max() + pad_lat + 90) / res) + 1, grid.n_lat)
+    widest = min(max(abs(lats.min() - pad_lat), abs(lats.max() + pad_lat)), 89.9)
+    pad_lon = pad_lat / np.cos(np.radians(widest))
+    col0 = int(np.floor((lons.min() - pad_lon + 180) / res))
+    col1 = int(np.floor((lons.max() + pad_lon + 180) / res)) + 1
+    col1 = min(col1, col0 + grid.n_lon)
+    rows = np.arange(row0, row1)
+    cols = np.arange(col0, col1)
+    height, width = len(rows), len(cols)
+
+    # Distance (km) from every window cell to the original stretch, via a
+    # distance transform of the rasterised stretch at the window's mid latitude
+    spacing_km = max(res * KM_PER_DEGREE / 4, 1.0)
+    lengths = haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    samples = np.maximum(np.ceil(lengths / spacing_km).astype(np.int64), 1)
+    t = np.concatenate([np.arange(n) / n for n in samples] + [[0.0]])
+    seg = np.concatenate([np.full(n, i) for i, n in enumerate(samples)] + [[len(lengths) - 1]])
+    t[-1] = 1.0
+    sample_lat = lats[seg] + t * (lats[seg + 1] - lats[seg])
+    sample_lon = lons[seg] + t * (lons[seg + 1] - lons[seg])
+    on_stretch = np.ones((height, width), dtype=bool)
+    on_stretch[
+        np.clip(((sample_lat + 90) / res).astype(np.int64) - row0, 0, height - 1),
+        np.clip(np.floor((sample_lon + 180) / res).astype(np.int64) - col0, 0, width - 1)
+    ] = False
+    mid_cos = np.cos(np.radians((lats.min() + lats.max()) / 2))
+    deviation = distance_transform_edt(on_stretch, sampling=(res * KM_PER_DEGREE, res * KM_PER_DEGREE * mid_cos))
+
+    cost = grid.cost[row0:row1][:, cols % grid.n_lon] + deviation_weight * deviation / max_deviation_km
+    cost[deviation > max_deviation_km] = np.inf
+
+    # Great-circle distance to the goal cell is a lower bound, since every cell costs at least 1 per km
+    goal_row, goal_col = grid.cell(lats[-1], lons[-1])
+    start_row, start_col = grid.cell(lats[0], lons[0])
+    goal_col = (goal_col - col0) % grid.n_lon
+    start_col = (start_col - col0) % grid.n_lon
+    goal_row -= row0
+    start_row -= row0
+    if not (0 <= start_col < width and 0 <= goal_col < width):
+        return None
+
+    cell_lat = grid.lat_rad[rows][:, None]
+    d_lon = grid.lon_rad[cols % grid.n_lon][None, :] - grid.lon_rad[(goal_col + col0) % grid.n_lon]
+    d_lat = cell_lat - grid.lat_rad[goal_row + row0]
+    h = np.sin(d_lat / 2) ** 2 + grid.cos_lat[rows][:, None] * grid.cos_lat[goal_row + row0] * np.sin(d_lon / 2) ** 2
+    heuristic = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+    # Border the window with blocked cells and tabulate each row's moves
+    cost = np.pad(cost, 1, constant_values=np.inf)
+    heuristic = np.pad(heuristic, 1)
+    padded = width + 2
+    east = np.pad(grid.east_km[row0:row1], 1)
+    north = np.pad(grid.north_km[row0:row1 - 1], 1)
+    diagonal = np.pad(grid.diagonal_km[row0:row1 - 1], 1)
+    moves = [()] + [
+        (
+            (-padded - 1, diagonal[r - 1]), (-padded, north[r - 1]), (-padded + 1, diagonal[r - 1]),
+            (-1, east[r]), (1, east[r]),
+            (padded - 1, diagonal[r]), (padded, north[r]), (padded + 1, diagonal[r])
+        )
+        for r in range(1, height + 1)
+    ] + [()]
+
+    start = (start_row + 1) * padded + start_col + 1
+    goal = (goal_row + 1) * padded + goal_col + 1
+    path = _astar(cost.ravel().tolist(), heuristic.ravel().tolist(), moves, start, goal)
+    if path is None:
+        return None
+
+    path_rows, path_cols = np.divmod(np.array(path), padded)
+    path_rows -= 1
+    path_cols -= 1
+    detour = np.column_stack([grid.lat_centers[path_rows + row0], -180 + (path_cols + col0 + 0.5) * res])
+    detour = np.vstack([[lats[0], lons[0]], detour[1:-1], [lats[-1], lons[-1]]])
+
+    # Drop the staircase: simplify within half a cell
+    if len(detour) > 2:
+        detour = shapely.get_coordinates(shapely.simplify(shapely.linestrings(detour), res / 2))
+    wrapped = np.abs(detour[:, 1]) > 180
+    detour[wrapped, 1] = (detour[wrapped, 1] + 180) % 360 - 180
+    detour[0], detour[-1] = stretch[0], stretch[-1]
+    return detour
+
+
+# Cost grid and detour settings of a worker process, set once by _init_detour_worker
+_worker_settings = None
+
+
+def _init_detour_worker(grid, max_deviation_km, deviation_weight):
+    global _worker_settings
+    _worker_settings = (grid, max_deviation_km, deviation_weight)
+
+
+def _plan_lane_detours(task):
+    """Detours for every stretch of one lane, in a worker process"""
+    lane_id, stretches = task
+    grid, max_deviation_km, deviation_weight = _worker_settings
+    return lane_id, [plan_detour(grid, stretch, max_deviation_km, deviation_weight) for stretch in stretches]
+
+
+def iter_lane_detours(grid, tasks, max_deviation_km, deviation_weight=0.5, max_workers=None):
+    """
+    Plan the detours of many lanes on a process pool, yielding each lane as it finishes
+
+    The cost grid goes to every worker once, when the worker starts, rather
+    than with each lane. Lanes are submitted largest first so the longest
+    searches start early.
+
+    Args:
+        grid: CostGrid shared by all lanes
+        tasks: List of (lane_id, stretches), stretches being (k, 2) [lat, lon] arrays
+        max_deviation_km, deviation_weight: As for ``plan_detour``
+        max_workers: Pool size; defaults to all cores. 1 plans in-process
+
+    Yields:
+        (lane_id, detours) with one detour (or None) per stretch, in completion order
+    """
+    if max_workers == 1 or len(tasks) <= 1:
+        for lane_id, stretches in tasks:
+            yield lane_id, [plan_detour(grid, stretch, max_deviation_km, deviation_weight) for stretch in stretches]
+        return
+
+    largest_first = sorted(tasks, key=lambda task: -sum(len(stretch) for stretch in task[1]))
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_detour_worker,
+        initargs=(grid, max_deviation_km, deviation_weight)
+    )
+    try:
+        futures = [pool.submit(_plan_lane_detours, task) for task in largest_first]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # A consumer that stops early (e.g. a dropped stream) leaves queued lanes unplanned
+        pool.shutdown(cancel_futures=True)
@@ -0,0 +1,173 @@
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.collections import LineCollection
+
+# Web Mercator (EPSG:3857) constants shared with slippy-map clients
+MERCATOR_RADIUS = 6378137.0
+MERCATOR_EXTENT = np.pi * MERCATOR_RADIUS
+MAX_MERCATOR_LAT = 85.0511287798
+
+# Tiles are one-inch figures rendered at TILE_SIZE dpi
+TILE_SIZE = 256
+TILE_FIGSIZE = (1, 1)
+
+
+def lonlat_to_mercator(lon, lat):
+    """Project lon/lat degrees to Web Mercator metres, clamping latitude to the map edge"""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    x = np.radians(lon) * MERCATOR_RADIUS
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * MERCATOR_RADIUS
+    return x, y
+
+
+def tile_bounds(z, x, y):
+    """
+    Web Mercator extent of an XYZ tile
+
+    Returns:
+        Tuple (min_x, min_y, max_x, max_y) in metres
+    """
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} is outside the tile grid")
+
+    size = 2 * MERCATOR_EXTENT / n
+    min_x = -MERCATOR_EXTENT + x * size
+    max_y = MERCATOR_EXTENT - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+class TileLayers:
+    """
+    Map geometry projected to Web Mercator once per data revision
+
+    Points are kept as flat arrays and lanes as per-part vertex arrays with
+    per-part bounding boxes, so each tile only selects what intersects it.
+    Lanes are held at several levels of detail, each used from its minimum
+    zoom until the next level takes over.
+    """
+
+    def __init__(self, lons, lats, clusters, lane_levels, conflict_lons=(), conflict_lats=()):
+        """
+        Args:
+            lons, lats, clusters: Migration points and their cluster labels
+            lane_levels: Dict mapping a minimum zoom to lon/lat lane part arrays
+            conflict_lons, conflict_lats: Conflict cluster centers
+        """
+        self.point_x, self.point_y = lonlat_to_mercator(lons, lats)
+        self.clusters = np.asarray(clusters, dtype=np.int64)
+
+        self.lane_levels = {}
+        for zoom, lonlat_parts in lane_levels.items():
+            parts = [np.column_stack(lonlat_to_mercator(p[:, 0], p[:, 1])) for p in lonlat_parts if len(p)]
+            bounds = np.array([[p[:, 0].min(), p[:, 1].min(), p[:, 0].max(), p[:, 1].max()] for p in parts])
+            self.lane_levels[zoom] = (parts, bounds.reshape(-1, 4))
+
+        self.conflict_x, self.conflict_y = lonlat_to_mercator(conflict_lons, conflict_lats)
+
+    def lanes_for_zoom(self, zoom):
+        """Tuple (parts, part_bounds) of the most detailed level allowed at a zoom"""
+        level = max([z for z in self.lane_levels if z <= zoom], default=min(self.lane_levels, default=None))
+        return self.lane_levels.get(level, ([], np.empty((0, 4))))
+
+
+def render_tile(fig, layers, z, x, y):
+    """
+    Render one transparent PNG tile of clusters, lanes and conflict markers
+
+    Only geometry intersecting the tile (padded by a few pixels so markers and
+    strokes crossing the edge are not cut off) is drawn. Cluster colours come
+    from the cluster id, so neighbouring tiles agree.
+
+    Args:
+        fig: Empty Agg figure of TILE_FIGSIZE at TILE_SIZE dpi, e.g. from a FigurePool
+        layers: TileLayers for the current data
+        z, x, y: Tile coordinates
+
+    Returns:
+        PNG bytes
+    """
+    min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+    pad = 8 * (max_x - min_x) / TILE_SIZE
+
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.set_xlim(min_x, max_x)
+    ax.set_ylim(min_y, max_y)
+
+    lane_parts, bounds = layers.lanes_for_zoom(z)
+    visible = np.flatnonzero(
+        (bounds[:, 0] <= max_x + pad) & (bounds[:, 2] >= min_x - pad)
+        & (bounds[:, 1] <= max_y + pad) & (bounds[:, 3] >= min_y - pad)
+    )
+    if len(visible):
+        ax.add_collection(LineCollection(
+            [lane_parts[i] for i in visible], colors='k', alpha=0.7, linewidths=2
+        ))
+
+    px, py = layers.point_x, layers.point_y
+    inside = (
+        (layers.clusters >= 0)
+        & (px >= min_x - pad) & (px <= max_x + pad)
+        & (py >= min_y - pad) & (py <= max_y + pad)
+    )
+    if inside.any():
+        ax.scatter(
+            px[inside], py[inside], c=layers.clusters[inside] % 10,
+            cmap='tab10', vmin=0, vmax=9, s=6, alpha=0.6, linewidths=0
+        )
+
+    cx, cy = layers.conflict_x, layers.conflict_y
+    marked = (cx >= min_x - pad) & (cx <= max_x + pad) & (cy >= min_y - pad) & (cy <= max_y + pad)
+    if marked.any():
+        ax.scatter(cx[marked], cy[marked], color='red', marker='x', s=60, linewidths=2)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=TILE_SIZE, transparent=True)
+    return buf.getvalue()
+
+
+class TileCache:
+    """Thread-safe LRU cache of rendered tiles, bounded by total bytes"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached tile bytes, or None; a hit makes the entry most recently used"""
+        with self._lock:
+            tile = self._entries.get(key)
+            if tile is not None:
+                self._entries.move_to_end(key)
+            return tile
+
+    def put(self, key, tile):
+        """Store a tile and evict least recently used entries beyond the byte cap"""
+        if len(tile) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = tile
+            self.size += len(tile)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0